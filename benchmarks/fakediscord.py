@@ -0,0 +1,382 @@
+"""Gateway y API REST falsos para ejecutar los cogs sin token ni red.
+
+Los eventos se inyectan con los mismos parsers que usa el gateway real
+(`ConnectionState.parsers`), y las peticiones REST y de webhooks de
+interacciones se responden en memoria con payloads mínimos válidos. Cada
+evento inyectado se sigue a través de todas las tareas que genera, de modo
+que se puede medir su latencia completa y las llamadas a la API que provoca.
+"""
+import asyncio
+import contextvars
+import itertools
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+import discord
+from discord.webhook.async_ import AsyncWebhookAdapter, async_context
+
+DISCORD_EPOCH = 1420070400000
+ADMINISTRATOR = str(discord.Permissions.all().value)
+
+CURRENT_EVENT = contextvars.ContextVar('fake_discord_event', default=None)
+
+
+class EventRecord:
+    """Un evento inyectado y todas las tareas que desencadena"""
+
+    __slots__ = ('kind', 'started', 'finished', 'api_calls', 'pending', 'done')
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.started = time.perf_counter()
+        self.finished = None
+        self.api_calls = 0
+        self.pending = 0
+        self.done = asyncio.get_running_loop().create_future()
+
+    @property
+    def latency(self):
+        return self.finished - self.started
+
+    def task_added(self):
+        self.pending += 1
+
+    def task_done(self, task=None):
+        self.pending -= 1
+        if self.pending <= 0 and not self.done.done():
+            self.finished = time.perf_counter()
+            self.done.set_result(self)
+
+
+def route_params(route):
+    """Extrae los IDs de la URL de una ruta comparándola con su plantilla"""
+    path = route.url[len(route.BASE):].split('?')[0].split('/')
+    params = {}
+    for template, value in zip(route.path.split('/'), path):
+        if template.startswith('{') and template.endswith('}'):
+            params[template[1:-1]] = value
+    return params
+
+
+def iso_now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def user_payload(user_id, name, bot=False):
+    return {
+        "id": str(user_id),
+        "username": name,
+        "discriminator": "0",
+        "global_name": None,
+        "avatar": None,
+        "bot": bot,
+    }
+
+
+def member_payload(user, roles):
+    return {
+        "user": user,
+        "roles": [str(role) for role in roles],
+        "joined_at": iso_now(),
+        "deaf": False,
+        "mute": False,
+        "flags": 0,
+    }
+
+
+def role_payload(role_id, name, position, permissions='0'):
+    return {
+        "id": str(role_id),
+        "name": name,
+        "color": 0,
+        "hoist": False,
+        "position": position,
+        "permissions": permissions,
+        "managed": False,
+        "mentionable": False,
+        "flags": 0,
+    }
+
+
+class FakeWebhookAdapter(AsyncWebhookAdapter):
+    """Responde a los callbacks de interacciones sin salir a la red"""
+
+    def __init__(self, fake):
+        super().__init__()
+        self.fake = fake
+
+    async def request(self, route, session=None, *, payload=None, **kwargs):
+        return await self.fake.handle(route, payload, webhook=True)
+
+
+class FakeDiscord:
+    """Sustituye las capas HTTP y gateway de un bot de discord.py"""
+
+    def __init__(self, bot, owner_id, rest_latency=0.0):
+        self.bot = bot
+        self.state = bot._connection
+        self.owner_id = owner_id
+        self.rest_latency = rest_latency
+        self.calls = Counter()
+        self.users = {}
+        self.dm_channels = {}
+        self.modals = {}
+        self.owner_message_ids = []
+        self.recorded = None
+        self._sequence = itertools.count()
+        self.bot_user = user_payload(self.snowflake(), 'SilentBot', bot=True)
+
+    def snowflake(self):
+        now = int(time.time() * 1000) - DISCORD_EPOCH
+        return (now << 22) | (next(self._sequence) & 0x3FFFFF)
+
+    async def install(self):
+        """Prepara el bot como si hubiera iniciado sesión y recibido READY"""
+        loop = asyncio.get_running_loop()
+        await self.bot._async_setup_hook()
+        loop.set_task_factory(self._task_factory)
+
+        self.bot.http.request = self._http_request
+        async_context.set(FakeWebhookAdapter(self))
+
+        self.state.user = discord.ClientUser(state=self.state, data=self.bot_user)
+        self.state.application_id = int(self.bot_user["id"])
+        self.add_user(self.owner_id, 'owner')
+
+    def add_user(self, user_id, name):
+        payload = user_payload(user_id, name)
+        self.users[int(user_id)] = payload
+        self.state.store_user(payload)
+        return payload
+
+    def add_guild(self, guild_id, roles, channel_ids, members):
+        """Crea un guild en caché. `roles` son payloads de rol, `members` payloads de miembro"""
+        everyone = role_payload(guild_id, '@everyone', 0)
+        data = {
+            "id": str(guild_id),
+            "name": f"Guild {guild_id}",
+            "owner_id": str(self.snowflake()),
+            "roles": [everyone] + roles,
+            "channels": [
+                {"id": str(channel_id), "type": 0, "name": f"channel-{index}", "position": index,
+                 "guild_id": str(guild_id), "permission_overwrites": [], "nsfw": False}
+                for index, channel_id in enumerate(channel_ids)
+            ],
+            "members": members,
+            "member_count": len(members),
+            "features": [],
+            "emojis": [],
+            "stickers": [],
+            "voice_states": [],
+            "presences": [],
+            "threads": [],
+            "stage_instances": [],
+            "guild_scheduled_events": [],
+            "unavailable": False,
+            "large": False,
+            "premium_tier": 0,
+            "preferred_locale": "en-US",
+        }
+        for member in members:
+            self.users[int(member["user"]["id"])] = member["user"]
+        return self.state._add_guild_from_data(data)
+
+    # --- Gateway ---
+
+    def feed(self, kind, event, data):
+        """Inyecta un evento del gateway y devuelve su EventRecord"""
+        record = EventRecord(kind)
+        self._record_frame(event, data)
+        token = CURRENT_EVENT.set(record)
+        try:
+            self.state.parsers[event](data)
+        finally:
+            CURRENT_EVENT.reset(token)
+        if record.pending == 0:
+            record.task_done()
+        return record
+
+    def start_recording(self):
+        """Guarda cada evento inyectado como trama de dispatch del gateway"""
+        self.recorded = []
+
+    def _record_frame(self, event, data):
+        if self.recorded is not None:
+            self.recorded.append({"op": 0, "t": event, "s": len(self.recorded) + 1, "d": data})
+
+    def _task_factory(self, loop, coro, context=None, **kwargs):
+        task = asyncio.Task(coro, loop=loop, context=context, **kwargs)
+        record = (context.get(CURRENT_EVENT) if context is not None else CURRENT_EVENT.get())
+        if record is not None:
+            record.task_added()
+            task.add_done_callback(record.task_done)
+        return task
+
+    def _echo(self, event, data):
+        # El gateway real devuelve los mensajes propios; no cuentan para el evento
+        self._record_frame(event, data)
+        asyncio.get_running_loop().call_soon(self.state.parsers[event], data, context=contextvars.Context())
+
+    def dm_message(self, author_id, content, attachments=0):
+        author = self.users.get(author_id) or self.add_user(author_id, f'user{author_id}')
+        channel = self.dm_channels.setdefault(author_id, self.snowflake())
+        return {
+            "id": str(self.snowflake()),
+            "channel_id": str(channel),
+            "author": author,
+            "content": content,
+            "timestamp": iso_now(),
+            "edited_timestamp": None,
+            "tts": False,
+            "mention_everyone": False,
+            "mentions": [],
+            "mention_roles": [],
+            "attachments": [
+                {"id": str(self.snowflake()), "filename": f"file{i}.png", "size": 1024,
+                 "url": f"https://cdn.discordapp.com/attachments/{channel}/{i}/file{i}.png",
+                 "proxy_url": f"https://media.discordapp.net/attachments/{channel}/{i}/file{i}.png"}
+                for i in range(attachments)
+            ],
+            "embeds": [],
+            "pinned": False,
+            "type": 0,
+            "flags": 0,
+        }
+
+    def guild_message(self, guild_id, channel_id, member, content):
+        data = self.dm_message(int(member["user"]["id"]), content)
+        data["channel_id"] = str(channel_id)
+        data["guild_id"] = str(guild_id)
+        data["member"] = {k: v for k, v in member.items() if k != "user"}
+        return data
+
+    def reaction(self, user_id, channel_id, message_id, emoji):
+        return {
+            "user_id": str(user_id),
+            "channel_id": str(channel_id),
+            "message_id": str(message_id),
+            "emoji": {"id": None, "name": emoji},
+            "type": 0,
+            "burst": False,
+        }
+
+    def interaction(self, interaction_type, guild_id, channel_id, member, data):
+        return {
+            "id": str(self.snowflake()),
+            "application_id": self.bot_user["id"],
+            "type": interaction_type,
+            "token": f"token-{self.snowflake()}",
+            "version": 1,
+            "guild_id": str(guild_id),
+            "channel_id": str(channel_id),
+            "channel": {"id": str(channel_id), "type": 0, "guild_id": str(guild_id), "name": "channel-0",
+                        "position": 0, "permission_overwrites": []},
+            "member": dict(member, permissions=ADMINISTRATOR),
+            "app_permissions": ADMINISTRATOR,
+            "locale": "en-US",
+            "guild_locale": "en-US",
+            "entitlements": [],
+            "authorizing_integration_owners": {},
+            "context": 0,
+            "attachment_size_limit": 10 * 1024 * 1024,
+            "data": data,
+        }
+
+    def modal_submit(self, interaction_id, guild_id, channel_id, member, values):
+        """Respuesta a un modal enviado antes, rellenando sus campos en orden"""
+        modal = self.modals.pop(str(interaction_id))
+        values = iter(values)
+
+        def fill(component):
+            if component.get('type') == 4:
+                return {"type": 4, "custom_id": component["custom_id"], "value": next(values, "1")}
+            filled = {"type": component["type"]}
+            if 'components' in component:
+                filled["components"] = [fill(child) for child in component["components"]]
+            if 'component' in component:
+                filled["component"] = fill(component["component"])
+            return filled
+
+        data = {"custom_id": modal["custom_id"], "components": [fill(c) for c in modal["components"]]}
+        return self.interaction(5, guild_id, channel_id, member, data)
+
+    # --- REST ---
+
+    async def _http_request(self, route, *, files=None, form=None, **kwargs):
+        return await self.handle(route, kwargs.get('json'), params=kwargs.get('params'))
+
+    async def handle(self, route, payload, webhook=False, params=None):
+        record = CURRENT_EVENT.get()
+        if record is not None:
+            record.api_calls += 1
+        self.calls[f'{route.method} {route.path}'] += 1
+        if self.rest_latency:
+            await asyncio.sleep(self.rest_latency)
+
+        ids = route_params(route)
+        path = route.path
+
+        if webhook:
+            if path.endswith('/callback'):
+                if payload and payload.get('type') == 9:
+                    self.modals[ids['webhook_id']] = payload['data']
+                return {"interaction": {"id": ids['webhook_id'], "type": 2}}
+            # Follow-ups y ediciones de la respuesta original devuelven el mensaje
+            return {
+                "id": ids.get('message_id') if ids.get('message_id', '@original') != '@original' else str(self.snowflake()),
+                "channel_id": str(self.snowflake()), "author": self.bot_user,
+                "content": (payload or {}).get('content') or "", "embeds": (payload or {}).get('embeds') or [],
+                "timestamp": iso_now(), "edited_timestamp": None, "tts": False, "mention_everyone": False,
+                "mentions": [], "mention_roles": [], "attachments": [], "pinned": False, "type": 0,
+                "flags": 64, "webhook_id": ids['webhook_id'],
+            }
+
+        if path == '/users/{user_id}':
+            user_id = int(ids['user_id'])
+            return self.users.get(user_id) or user_payload(user_id, f'user{user_id}')
+        if path == '/users/@me/channels':
+            recipient_id = int(payload['recipient_id'])
+            channel_id = self.dm_channels.setdefault(recipient_id, self.snowflake())
+            recipient = self.users.get(recipient_id) or user_payload(recipient_id, f'user{recipient_id}')
+            return {"id": str(channel_id), "type": 1, "recipients": [recipient]}
+        if path == '/channels/{channel_id}/messages' and route.method == 'POST':
+            message = {
+                "id": str(self.snowflake()),
+                "channel_id": ids['channel_id'],
+                "author": self.bot_user,
+                "content": (payload or {}).get('content') or "",
+                "embeds": (payload or {}).get('embeds') or [],
+                "timestamp": iso_now(),
+                "edited_timestamp": None,
+                "tts": False,
+                "mention_everyone": False,
+                "mentions": [],
+                "mention_roles": [],
+                "attachments": [],
+                "pinned": False,
+                "type": 0,
+                "flags": 0,
+            }
+            if int(ids['channel_id']) == self.dm_channels.get(self.owner_id):
+                self.owner_message_ids.append(int(message["id"]))
+            self._echo('MESSAGE_CREATE', message)
+            return message
+        if path == '/channels/{channel_id}/messages' and route.method == 'GET':
+            limit = int((params or {}).get('limit', 50))
+            return [
+                dict(self.dm_message(self.owner_id, f"history {i}"), channel_id=ids['channel_id'])
+                for i in range(limit)
+            ]
+        if path == '/channels/{channel_id}/messages/{message_id}' and route.method == 'PATCH':
+            return {
+                "id": ids['message_id'], "channel_id": ids['channel_id'], "author": self.bot_user,
+                "content": "", "embeds": (payload or {}).get('embeds') or [], "timestamp": iso_now(),
+                "edited_timestamp": iso_now(), "tts": False, "mention_everyone": False, "mentions": [],
+                "mention_roles": [], "attachments": [], "pinned": False, "type": 0, "flags": 0,
+            }
+        if path == '/guilds/{guild_id}/members/{user_id}' and route.method == 'PATCH':
+            user_id = int(ids['user_id'])
+            return member_payload(self.users.get(user_id) or user_payload(user_id, f'user{user_id}'), [])
+        # Bans, kicks, roles, reacciones y borrados responden 204 sin cuerpo
+        return None
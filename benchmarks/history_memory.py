@@ -0,0 +1,100 @@
+"""Memoria del historial de conversaciones: dicts frente a HistoryEntry.
+
+Uso:
+    python benchmarks/history_memory.py --entries 1000000
+
+Construye el mismo historial con el formato anterior (un dict por mensaje
+con datetime y listas) y con core.history.HistoryEntry, y mide con
+tracemalloc lo que ocupa cada uno. Los textos y URLs se generan antes de
+medir y los comparten ambas versiones, así que la diferencia es solo la
+sobrecarga por entrada.
+"""
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from core.history import HistoryEntry, INCOMING, OUTGOING
+
+
+def make_inputs(count, attachment_ratio, seed):
+    rnd = random.Random(seed)
+    base = int(time.time()) - count
+    contents = [f"message {i} {rnd.random():.8f}" for i in range(count)]
+    urls = [
+        [f"https://cdn.discordapp.com/attachments/{rnd.getrandbits(60)}/{i}/file.png"]
+        if rnd.random() < attachment_ratio else []
+        for i in range(count)
+    ]
+    senders = [rnd.getrandbits(60) for _ in range(1000)]
+    rows = [(senders[i % len(senders)], contents[i], base + i, urls[i], i % 3 == 0) for i in range(count)]
+    return rows
+
+
+def build_dicts(rows):
+    history = []
+    for sender, content, ts, urls, outgoing in rows:
+        history.append({
+            "sender": sender,
+            "content": content,
+            "timestamp": datetime.fromtimestamp(ts),
+            "attachments": list(urls),
+            "type": "outgoing" if outgoing else "incoming"
+        })
+    return history
+
+
+def build_entries(rows):
+    return [
+        HistoryEntry(sender, content, direction=OUTGOING if outgoing else INCOMING, ts=ts, attachments=urls)
+        for sender, content, ts, urls, outgoing in rows
+    ]
+
+
+def measure(builder, rows):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    started = time.perf_counter()
+    history = builder(rows)
+    seconds = time.perf_counter() - started
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    size = after - before
+    del history
+    return {
+        "bytes": size,
+        "bytes_per_entry": round(size / len(rows), 1),
+        "build_seconds": round(seconds, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--entries', type=int, default=1_000_000)
+    parser.add_argument('--attachment-ratio', type=float, default=0.2)
+    parser.add_argument('--seed', type=int, default=1234)
+    args = parser.parse_args()
+
+    rows = make_inputs(args.entries, args.attachment_ratio, args.seed)
+    dicts = measure(build_dicts, rows)
+    entries = measure(build_entries, rows)
+    result = {
+        "entries": args.entries,
+        "dict": dicts,
+        "slots": entries,
+        "reduction": round(1 - entries["bytes"] / dicts["bytes"], 3),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
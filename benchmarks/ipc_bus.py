@@ -0,0 +1,133 @@
+"""Benchmark del modo dividido: rendimiento del bus IPC con 1..N workers.
+
+Uso: python benchmarks/ipc_bus.py [--events 4000] [--workers 1,2,4] [--work-ms 1.0]
+
+Cada evento simula el trabajo de un reenvío (formatear el embed y serializar
+la petición REST) durante `--work-ms` de CPU y registra una entrada de
+enrutamiento en el estado compartido, igual que worker.py. Al final se
+comprueba que todas las réplicas del estado coinciden con el bus.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.ipc import StateBus, BusClient
+
+
+def burn(work_ms, seed):
+    """Trabajo de CPU equivalente a construir y serializar un embed"""
+    deadline = time.perf_counter() + work_ms / 1000
+    data = seed.encode()
+    while time.perf_counter() < deadline:
+        data = hashlib.sha256(data).digest()
+        json.dumps({"title": "DM", "description": data.hex(), "fields": [{"name": "a", "value": "b"}]})
+    return data.hex()[:16]
+
+
+async def run_worker(socket_path, worker_id, work_ms):
+    bus = await BusClient.connect(socket_path, role='worker', worker_id=worker_id)
+
+    async def handle(payload):
+        digest = burn(work_ms, payload["content"])
+        await bus.set("pending", payload["id"], {"target_user_id": payload["author_id"], "digest": digest})
+        await bus.publish("ack", payload["id"], {"worker": worker_id}, to='gateway')
+
+    async def report(payload):
+        state_hash = hashlib.sha256(json.dumps(bus.state, sort_keys=True).encode()).hexdigest()
+        await bus.publish("state", worker_id, {"worker": worker_id, "version": bus.version, "hash": state_hash}, to='gateway')
+
+    bus.subscribe("dm", handle)
+    bus.subscribe("report", report)
+    await bus.wait_closed()
+
+
+def worker_main(socket_path, worker_id, work_ms):
+    asyncio.run(run_worker(socket_path, worker_id, work_ms))
+
+
+async def run_case(workers, events, work_ms):
+    socket_path = os.path.join(tempfile.mkdtemp(), 'bus.sock')
+    server = StateBus(socket_path, backlog_limit=events)
+    await server.start()
+
+    ctx = multiprocessing.get_context('spawn')
+    processes = [ctx.Process(target=worker_main, args=(socket_path, i, work_ms)) for i in range(workers)]
+    for process in processes:
+        process.start()
+
+    gateway = await BusClient.connect(socket_path, role='gateway')
+    done = asyncio.Event()
+    acked = 0
+    reports = []
+
+    async def on_ack(payload):
+        nonlocal acked
+        acked += 1
+        if acked == events:
+            done.set()
+
+    async def on_state(payload):
+        reports.append(payload)
+
+    gateway.subscribe("ack", on_ack)
+    gateway.subscribe("state", on_state)
+
+    while len(server.workers) < workers:
+        await asyncio.sleep(0.05)
+
+    start = time.perf_counter()
+    for i in range(events):
+        await gateway.publish("dm", 1000 + i % 500, {"id": i, "author_id": 1000 + i % 500, "content": f"message {i}"})
+    await done.wait()
+    elapsed = time.perf_counter() - start
+
+    # Comprobar que todas las réplicas del estado coinciden
+    for worker_id in range(workers):
+        await gateway.publish("report", worker_id, {})
+    while len(reports) < workers:
+        await asyncio.sleep(0.01)
+    server_hash = hashlib.sha256(json.dumps(server.state, sort_keys=True).encode()).hexdigest()
+    consistent = all(r["hash"] == server_hash and r["version"] == server.version for r in reports)
+
+    await gateway.close()
+    await server.close()
+    for process in processes:
+        process.terminate()
+        process.join()
+
+    return {
+        "workers": workers,
+        "events": events,
+        "seconds": round(elapsed, 3),
+        "events_per_second": round(events / elapsed, 1),
+        "state_version": server.version,
+        "replicas_consistent": consistent,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=4000)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--work-ms', type=float, default=1.0)
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"CPU disponibles: {os.cpu_count()}")
+    for workers in [int(w) for w in args.workers.split(',')]:
+        result = asyncio.run(run_case(workers, args.events, args.work_ms))
+        baseline = baseline or result["events_per_second"]
+        result["speedup"] = round(result["events_per_second"] / baseline, 2)
+        print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,329 @@
+"""Prueba de carga offline de DMForwarding y ModerationPanel.
+
+Uso:
+    python benchmarks/loadtest.py --events 2000 --rate 500 --output results.json
+    python benchmarks/loadtest.py --compare results.json
+
+Reproduce tráfico sintético de MD, reacciones del owner, mensajes en el
+canal del servidor (tipo `guild` en --mix) y el flujo completo de
+/moderation-panel (comando + modal) contra el gateway y la API falsos de
+benchmarks/fakediscord.py. Mide rendimiento, latencia p50/p99 por tipo de
+evento, llamadas a la API por evento y crecimiento de memoria, y guarda el
+resultado en JSON para comparar entre commits.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import tempfile
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import discord
+from discord.ext import commands
+
+from core.evidence import EvidenceCache
+from core.guild_config import GuildConfig
+from core.scheduler import WorkScheduler
+from core.tracing import TRACER, TracedCommandTree, instrument
+from core import preflight
+from fakediscord import FakeDiscord, member_payload, role_payload, user_payload
+
+ACTIONS = ['ban', 'kick', 'timeout', 'add_role', 'remove_role', 'purge']
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * (len(ordered) - 1)))))
+    return ordered[index]
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, text=True).strip()
+    except Exception:
+        return None
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, weight = part.split('=')
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.random = random.Random(args.seed)
+        self.records = []
+        self.followups = []
+
+    async def setup(self):
+        intents = discord.Intents.default()
+        intents.message_content = True
+        intents.members = True
+        intents.guilds = True
+        self.bot = commands.Bot(command_prefix='!', intents=intents, help_command=None, tree_cls=TracedCommandTree)
+        self.bot.scheduler = WorkScheduler(self.args.concurrency) if self.args.concurrency else None
+        # Registro de servidores en un directorio temporal: modpanel lo siembra con DEFAULT_GUILDS
+        workdir = tempfile.mkdtemp(prefix='loadtest-')
+        self.bot.guild_config = GuildConfig(os.path.join(workdir, 'guild_config.json'))
+        self.bot.evidence = EvidenceCache(os.path.join(workdir, 'evidence'))
+
+        os.chdir(ROOT)
+        # Sin --throttle se mide el reparto sin la limitación de MD entrantes
+        os.environ['DM_THROTTLE'] = '1' if self.args.throttle else '0'
+        await self.bot.load_extension('commands.modpanel_command')
+        await self.bot.load_extension('scripts.dmreplies')
+        dmreplies = sys.modules['scripts.dmreplies']
+
+        self.fake = FakeDiscord(self.bot, dmreplies.BOT_OWNER_ID, rest_latency=self.args.rest_latency_ms / 1000)
+        await self.fake.install()
+        instrument(self.bot)
+        self.cog = self.bot.get_cog('DMForwarding')
+
+        self.guild_id = self.bot.guild_config.guild_ids()[0]
+        moderator_role = min(self.bot.guild_config.roles(self.guild_id))
+        self.channel_id = self.fake.snowflake()
+        self.extra_roles = [self.fake.snowflake() for _ in range(10)]
+        bot_role = self.fake.snowflake()
+        roles = [role_payload(bot_role, 'Bot', 50, permissions=str(discord.Permissions.all().value)),
+                 role_payload(moderator_role, 'Moderator', 40)]
+        roles += [role_payload(role_id, f'Role {i}', 1 + i) for i, role_id in enumerate(self.extra_roles)]
+
+        self.moderator = member_payload(user_payload(self.fake.snowflake(), 'moderator'), [moderator_role])
+        # Una parte de los objetivos tiene un rol por encima del bot: la API los rechazaría
+        admin_role = self.fake.snowflake()
+        roles.append(role_payload(admin_role, 'Admin', 60))
+        outranked = int(self.args.targets * self.args.outranked_ratio)
+        self.targets = [member_payload(user_payload(self.fake.snowflake(), f'target{i}'), [admin_role] if i < outranked else [])
+                        for i in range(self.args.targets)]
+        members = [member_payload(self.fake.bot_user, [bot_role]), self.moderator] + self.targets
+        self.fake.add_guild(self.guild_id, roles, [self.channel_id], members)
+
+        self.senders = [self.fake.snowflake() for _ in range(self.args.senders)]
+        for sender in self.senders:
+            self.fake.add_user(sender, f'sender{sender % 10000}')
+
+        # El owner se resuelve igual que en on_ready
+        await self.cog.ensure_owner()
+
+    def next_event(self, kind):
+        if kind == 'reaction':
+            forwarded = [message_id for message_id, info in self.cog.pending_messages.items()
+                         if info["type"] == "forwarded_message"]
+            if forwarded:
+                message_id = self.random.choice(forwarded[-50:])
+                owner_channel = self.fake.dm_channels[self.fake.owner_id]
+                data = self.fake.reaction(self.fake.owner_id, owner_channel, message_id, "👥")
+                return self.fake.feed('reaction', 'MESSAGE_REACTION_ADD', data)
+            kind = 'dm'
+
+        if kind == 'command':
+            target = self.random.choice(self.targets)
+            action = self.random.choice(ACTIONS)
+            target_id = target["user"]["id"]
+            data = {
+                "id": str(self.fake.snowflake()),
+                "name": "moderation-panel",
+                "type": 1,
+                "guild_id": str(self.guild_id),
+                "options": [
+                    {"name": "user", "type": 6, "value": target_id},
+                    {"name": "action", "type": 3, "value": action},
+                ],
+                "resolved": {
+                    "users": {target_id: target["user"]},
+                    "members": {target_id: {k: v for k, v in target.items() if k != "user"}},
+                },
+            }
+            payload = self.fake.interaction(2, self.guild_id, self.channel_id, self.moderator, data)
+            record = self.fake.feed('command', 'INTERACTION_CREATE', payload)
+            self.followups.append(asyncio.create_task(self.submit_modal(record, payload["id"], action)))
+            return record
+
+        if kind == 'guild':
+            author = self.random.choice(self.targets)
+            data = self.fake.guild_message(self.guild_id, self.channel_id, author, f"chat {self.random.random():.6f}")
+            return self.fake.feed('guild', 'MESSAGE_CREATE', data)
+
+        sender = self.random.choice(self.senders)
+        attachments = 1 if self.random.random() < self.args.attachment_ratio else 0
+        data = self.fake.dm_message(sender, f"message {self.random.random():.6f}", attachments=attachments)
+        return self.fake.feed('dm', 'MESSAGE_CREATE', data)
+
+    async def submit_modal(self, command_record, interaction_id, action):
+        await command_record.done
+        if interaction_id not in self.fake.modals:
+            return
+        roles = ' '.join(str(role) for role in self.random.sample(self.extra_roles, self.args.batch_roles))
+        members = ' '.join(target["user"]["id"] for target in self.random.sample(self.targets, self.args.batch_members))
+        values = {
+            'timeout': ['5', 'load test'],
+            'add_role': [roles, members],
+            'remove_role': [roles, members],
+            'purge': ['10'],
+        }.get(action, ['load test'])
+        payload = self.fake.modal_submit(interaction_id, self.guild_id, self.channel_id, self.moderator, values)
+        record = self.fake.feed('modal', 'INTERACTION_CREATE', payload)
+        self.records.append(record)
+        await record.done
+
+    async def run(self):
+        await self.setup()
+        mix = parse_mix(self.args.mix)
+        kinds, weights = list(mix), list(mix.values())
+
+        # Calentamiento para que la primera ejecución de cada ruta no distorsione
+        for _ in range(min(50, self.args.events)):
+            await self.next_event(self.random.choices(kinds, weights)[0]).done
+        await asyncio.gather(*self.followups)
+        self.followups.clear()
+        self.records.clear()
+
+        if self.args.record:
+            self.fake.start_recording()
+
+        tracemalloc.start()
+        memory_start = tracemalloc.get_traced_memory()[0]
+        calls_start = sum(self.fake.calls.values())
+
+        interval = 1 / self.args.rate if self.args.rate else 0
+        started = time.perf_counter()
+        for i in range(self.args.events):
+            if interval:
+                delay = started + i * interval - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            self.records.append(self.next_event(self.random.choices(kinds, weights)[0]))
+            if not interval and i % 100 == 99:
+                await asyncio.sleep(0)
+
+        await asyncio.gather(*(record.done for record in self.records))
+        await asyncio.gather(*self.followups)
+        elapsed = time.perf_counter() - started
+
+        memory_end, memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        if self.args.record:
+            with open(self.args.record, 'w', encoding='utf-8') as file:
+                for frame in self.fake.recorded:
+                    file.write(json.dumps(frame, ensure_ascii=False) + '\n')
+        return self.summary(elapsed, memory_start, memory_end, memory_peak, sum(self.fake.calls.values()) - calls_start)
+
+    def summary(self, elapsed, memory_start, memory_end, memory_peak, api_calls):
+        by_kind = {}
+        for record in self.records:
+            by_kind.setdefault(record.kind, []).append(record)
+
+        kinds = {}
+        for kind, records in sorted(by_kind.items()):
+            latencies = [record.latency * 1000 for record in records]
+            kinds[kind] = {
+                "count": len(records),
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "mean_ms": round(statistics.fmean(latencies), 3),
+                "api_calls_per_event": round(sum(r.api_calls for r in records) / len(records), 2),
+            }
+
+        latencies = [record.latency * 1000 for record in self.records]
+        return {
+            "commit": git_commit(),
+            "timestamp": time.strftime('%Y-%m-%dT%H:%M:%S'),
+            "python": sys.version.split()[0],
+            "discord_py": discord.__version__,
+            "config": {k: v for k, v in vars(self.args).items() if k not in ('output', 'compare', 'record')},
+            "events": len(self.records),
+            "seconds": round(elapsed, 3),
+            "throughput_eps": round(len(self.records) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "api_calls_per_event": round(api_calls / len(self.records), 2),
+            "memory": {
+                "growth_bytes": memory_end - memory_start,
+                "growth_bytes_per_1k_events": int((memory_end - memory_start) * 1000 / len(self.records)),
+                "peak_bytes": memory_peak,
+            },
+            "kinds": kinds,
+            "throttle": self.cog.throttle.snapshot() if self.cog.throttle else None,
+            "scheduler": self.bot.scheduler.snapshot() if self.bot.scheduler else None,
+            "traces": TRACER.snapshot()["operations"],
+            "preflight": preflight.snapshot(),
+            "evidence": self.bot.evidence.snapshot(),
+            "inbox": self.cog.inbox_editor.snapshot() if self.cog.inbox_editor else None,
+            "api_calls_by_route": dict(self.fake.calls.most_common()),
+        }
+
+
+def compare(current, baseline):
+    """Imprime la variación de las métricas principales frente a otro resultado"""
+    def delta(path):
+        old, new = baseline, current
+        for key in path:
+            old, new = old.get(key, {}), new.get(key, {})
+        if not isinstance(old, (int, float)) or not isinstance(new, (int, float)) or not old:
+            return None
+        return round((new - old) / old * 100, 1)
+
+    print(f"Comparación con {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    rows = [("throughput_eps",), ("p50_ms",), ("p99_ms",), ("api_calls_per_event",), ("memory", "growth_bytes_per_1k_events")]
+    rows += [("kinds", kind, metric) for kind in current.get("kinds", {}) for metric in ("p50_ms", "p99_ms")]
+    for path in rows:
+        change = delta(path)
+        if change is not None:
+            print(f"  {'.'.join(path)}: {change:+.1f}%")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=0, help="eventos por segundo (0 = sin límite)")
+    parser.add_argument('--mix', default='dm=70,reaction=15,command=15')
+    parser.add_argument('--senders', type=int, default=200)
+    parser.add_argument('--targets', type=int, default=50)
+    parser.add_argument('--attachment-ratio', type=float, default=0.2)
+    parser.add_argument('--rest-latency-ms', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=1234)
+    parser.add_argument('--batch-roles', type=int, default=1, help="roles por cada add_role/remove_role")
+    parser.add_argument('--batch-members', type=int, default=0, help="miembros adicionales por cada add_role/remove_role")
+    parser.add_argument('--outranked-ratio', type=float, default=0.0, help="fracción de objetivos con un rol por encima del bot")
+    parser.add_argument('--concurrency', type=int, default=8, help="huecos del planificador compartido (0 = sin planificador)")
+    parser.add_argument('--throttle', action='store_true', help="activar la limitación de MD entrantes (DM_THROTTLE)")
+    parser.add_argument('--output', help="fichero JSON donde guardar el resultado")
+    parser.add_argument('--compare', help="resultado JSON anterior con el que comparar")
+    parser.add_argument('--record', help="guardar las tramas del gateway inyectadas en un fichero JSONL")
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    result = asyncio.run(LoadTest(args).run())
+    print(json.dumps(result, indent=2))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(result, file, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare(result, json.load(file))
+
+
+if __name__ == '__main__':
+    main()
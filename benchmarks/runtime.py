@@ -0,0 +1,114 @@
+"""Benchmark del modo rápido (FAST_RUNTIME): codecs JSON y event loop.
+
+Uso:
+    python benchmarks/loadtest.py --events 3000 --record gateway.jsonl
+    python benchmarks/runtime.py --payloads gateway.jsonl
+
+Decodifica y codifica las tramas grabadas del gateway con cada codec JSON
+instalado y ejecuta la prueba de carga de benchmarks/loadtest.py con asyncio
+y con uvloop. Sin `--payloads` se graban tramas nuevas con el propio harness.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from core.runtime import available_codecs
+from loadtest import LoadTest, build_parser
+
+
+def load_frames(path):
+    with open(path, encoding='utf-8') as file:
+        return [line.rstrip('\n') for line in file if line.strip()]
+
+
+def record_frames(events):
+    path = os.path.join(tempfile.mkdtemp(), 'gateway.jsonl')
+    args = build_parser().parse_args(['--events', str(events), '--record', path])
+    asyncio.run(LoadTest(args).run())
+    return path
+
+
+def bench_codecs(frames, repeats):
+    raw_bytes = sum(len(frame.encode('utf-8')) for frame in frames)
+    results = {}
+    for name, (dumps, loads) in available_codecs().items():
+        started = time.perf_counter()
+        for _ in range(repeats):
+            decoded = [loads(frame) for frame in frames]
+        decode = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for _ in range(repeats):
+            for obj in decoded:
+                dumps(obj)
+        encode = time.perf_counter() - started
+
+        total = len(frames) * repeats
+        results[name] = {
+            "decode_us_per_frame": round(decode / total * 1e6, 3),
+            "encode_us_per_frame": round(encode / total * 1e6, 3),
+            "decode_mb_per_s": round(raw_bytes * repeats / decode / 1e6, 1),
+        }
+
+    baseline = results["json"]["decode_us_per_frame"]
+    for result in results.values():
+        result["decode_speedup"] = round(baseline / result["decode_us_per_frame"], 2)
+    return results
+
+
+def loop_factories():
+    factories = {"asyncio": asyncio.new_event_loop}
+    try:
+        import uvloop
+    except ImportError:
+        pass
+    else:
+        factories["uvloop"] = uvloop.new_event_loop
+    return factories
+
+
+def bench_loops(events):
+    results = {}
+    for name, factory in loop_factories().items():
+        args = build_parser().parse_args(['--events', str(events)])
+        with asyncio.Runner(loop_factory=factory) as runner:
+            result = runner.run(LoadTest(args).run())
+        results[name] = {
+            "throughput_eps": result["throughput_eps"],
+            "p50_ms": result["p50_ms"],
+            "p99_ms": result["p99_ms"],
+        }
+
+    baseline = results["asyncio"]["throughput_eps"]
+    for result in results.values():
+        result["speedup"] = round(result["throughput_eps"] / baseline, 2)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--payloads', help="tramas grabadas con loadtest.py --record")
+    parser.add_argument('--record-events', type=int, default=2000)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--loop-events', type=int, default=3000)
+    args = parser.parse_args()
+
+    frames = load_frames(args.payloads or record_frames(args.record_events))
+    result = {
+        "frames": len(frames),
+        "json": bench_codecs(frames, args.repeats),
+        "event_loop": bench_loops(args.loop_events),
+    }
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == '__main__':
+    main()
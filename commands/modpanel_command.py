@@ -3,45 +3,85 @@ from discord.ext import commands
 from discord import app_commands
 import asyncio
 import datetime
+import logging
+import os
+from core.scheduler import scheduled
+from core.batch import RateLimiter, parse_ids, run_batch
+from core.tracing import TracedModal, stage
+from core.preflight import PreflightError, check
+from core.at_rest import open_store
 
-# Configuration
-ALLOWED_GUILDS = [1366203495119589536]  # Replace with your guild ID
-ALLOWED_ROLES = [1366424264600719461]   # Replace with your role ID
+logger = logging.getLogger('bot.modpanel')
+
+# Configuration: guilds and roles live in the guild registry (core/guild_config.py).
+# These are only written to the registry file the first time the bot runs.
+DEFAULT_GUILDS = {1366203495119589536: [1366424264600719461]}  # {guild ID: [role IDs]}
 
 # Permission check function
 def require_roles():
     async def predicate(interaction: discord.Interaction) -> bool:
-        if not interaction.guild:
-            await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
-            return False
-        
-        if interaction.guild.id not in ALLOWED_GUILDS:
-            await interaction.response.send_message(
-                "This command is not available in this server.",
-                ephemeral=True
-            )
-            return False
+        # Timed as the permission_check stage of the command trace (core/tracing.py)
+        with stage("permission_check"):
+            if not interaction.guild:
+                await interaction.response.send_message("This command can only be used in a server.", ephemeral=True)
+                return False
         
-        member_roles = [role.id for role in interaction.user.roles]
-        has_allowed_role = any(role_id in member_roles for role_id in ALLOWED_ROLES)
+            config = interaction.client.guild_config
+            if interaction.guild.id not in config:
+                await interaction.response.send_message(
+                    "This command is not available in this server.",
+                    ephemeral=True
+                )
+                return False
         
-        if not has_allowed_role:
-            await interaction.response.send_message(
-                "You do not have the required permissions to use this command.",
-                ephemeral=True
-            )
-            return False
+            if not config.allows(interaction.guild.id, [role.id for role in interaction.user.roles]):
+                await interaction.response.send_message(
+                    "You do not have the required permissions to use this command.",
+                    ephemeral=True
+                )
+                return False
             
-        return True
+            return True
     return app_commands.check(predicate)
 
 # Moderation Panel Cog
 class ModerationPanel(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
+        self.registered_guilds = set()
+
+    async def cog_load(self):
+        self.guild_commands_changed(self.bot.guild_config.guild_ids(), ())
+
+    async def cog_unload(self):
+        self.guild_commands_changed((), list(self.registered_guilds))
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        # Keep recent messages of registered guilds so bans, kicks and purges can archive them
+        evidence = self.bot.evidence
+        if evidence is not None and message.guild is not None and message.guild.id in self.registered_guilds:
+            evidence.add(message)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        if self.bot.evidence is not None:
+            self.bot.evidence.drop_guild(guild.id)
+
+    def guild_commands_changed(self, added, removed):
+        """Registers /moderation-panel in guilds added to the registry and drops it from removed ones.
+
+        Only updates the local command tree; the bot syncs the affected guilds.
+        """
+        for guild_id in added:
+            self.bot.tree.add_command(self.moderation_panel, guild=discord.Object(id=guild_id), override=True)
+            self.registered_guilds.add(guild_id)
+        for guild_id in removed:
+            self.bot.tree.remove_command(self.moderation_panel.name, guild=discord.Object(id=guild_id))
+            self.registered_guilds.discard(guild_id)
 
     @app_commands.command(name="moderation-panel", description="Moderation actions for server management")
-    @app_commands.guilds(*ALLOWED_GUILDS)
+    @app_commands.guilds()  # Guild-only; the guilds come from the registry in cog_load
     @require_roles()
     @app_commands.describe(
         user="The user to perform the action on",
@@ -53,7 +93,8 @@ class ModerationPanel(commands.Cog):
         app_commands.Choice(name="Timeout", value="timeout"),
         app_commands.Choice(name="Add Role", value="add_role"),
         app_commands.Choice(name="Remove Role", value="remove_role"),
-        app_commands.Choice(name="Purge Messages", value="purge")
+        app_commands.Choice(name="Purge Messages", value="purge"),
+        app_commands.Choice(name="View Evidence", value="evidence")
     ])
     async def moderation_panel(
         self, 
@@ -87,8 +128,185 @@ class ModerationPanel(commands.Cog):
             modal = PurgeModal()
             await interaction.response.send_modal(modal)
 
+        elif action_value == "evidence":
+            await send_evidence(interaction, user)
+
+# Evidence archived before bans, kicks and purges (core/evidence.py)
+class EvidenceBatch:
+    """Archive the buffered messages of a user (whole server) or channel around a moderation action.
+
+    The snapshot is taken on entry, so a purge can't delete what it was meant to keep, and the file is
+    written while the action runs. It is indexed only if the action succeeds and deleted otherwise, so
+    the archive never records actions that didn't happen. Failures are logged and never block the action.
+    """
+
+    def __init__(self, interaction: discord.Interaction, action: str, reason: str = None,
+                 user: discord.Member = None, channel=None, limit: int = None):
+        self.interaction = interaction
+        self.action = action
+        self.reason = reason
+        self.user = user
+        self.channel = channel
+        self.limit = limit
+        self.snapshots = []
+        self.archived = 0
+        self._write = None
+
+    async def __aenter__(self):
+        evidence = self.interaction.client.evidence
+        if evidence is not None:
+            self.snapshots = evidence.collect(
+                self.interaction.guild.id,
+                user_id=self.user.id if self.user else None,
+                channel_id=self.channel.id if self.channel else None,
+                limit=self.limit
+            )
+            self._write = asyncio.create_task(evidence.write(self.interaction.guild.id, self.action, self.snapshots))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._write is None:
+            return False
+        evidence = self.interaction.client.evidence
+        guild_id = self.interaction.guild.id
+        with stage("evidence"):
+            try:
+                path = await self._write
+                if path is None:
+                    return False
+                if exc_type is not None:
+                    await evidence.discard(path)
+                    return False
+                await evidence.commit(guild_id, self.action, path, self.snapshots,
+                                      moderator_id=self.interaction.user.id, reason=self.reason)
+                self.archived = len(self.snapshots)
+            except Exception as e:
+                logger.error(f"Could not archive evidence for {self.action} in guild {guild_id}: {e}")
+        return False
+
+def evidence_note(archived: int) -> str:
+    return f" Archived {archived} recent messages as evidence." if archived else ""
+
+async def send_evidence(interaction: discord.Interaction, user: discord.Member):
+    evidence = interaction.client.evidence
+    if evidence is None:
+        await interaction.response.send_message("The evidence archive is disabled.", ephemeral=True)
+        return
+    batches = evidence.find(interaction.guild.id, user_id=user.id, limit=5)
+    if not batches:
+        await interaction.response.send_message(f"No archived messages for {user.mention}.", ephemeral=True)
+        return
+
+    lines = [
+        f"`{batch['created']:%Y-%m-%d %H:%M}` {batch['action']} by <@{batch['moderator_id']}>: "
+        f"{batch['messages']} messages" + (f" ({batch['reason'][:100]})" if batch['reason'] else "")
+        for batch in batches
+    ]
+    files = [discord.File(open_store(batch['path']), filename=os.path.basename(batch['path']))
+             for batch in batches if os.path.exists(batch['path'])]
+    try:
+        await interaction.response.send_message(
+            f"Archived evidence for {user.mention}:\n" + "\n".join(lines),
+            files=files,
+            ephemeral=True
+        )
+    finally:
+        # discord.File never closes a handle it was given, sent or not
+        for file in files:
+            file.close()
+            file.fp.close()
+
+async def reply(interaction: discord.Interaction, message: str, **kwargs):
+    """Answer ephemerally, as a follow-up once the interaction has been deferred"""
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True, **kwargs)
+    else:
+        await interaction.response.send_message(message, ephemeral=True, **kwargs)
+
+# Role changes for one or many members
+async def send_error(interaction: discord.Interaction, error: Exception):
+    await reply(interaction, f"An error occurred while executing the command: {str(error)}")
+
+def role_batch_error(error):
+    if isinstance(error, discord.Forbidden):
+        return "missing permissions"
+    if isinstance(error, discord.NotFound):
+        return "not a member of this server"
+    return str(error)
+
+async def apply_role_batch(interaction: discord.Interaction, user: discord.Member, role_text: str, members_text: str, add: bool):
+    """Add or remove several roles for one or many members.
+
+    All roles go in a single member update; with several members the updates
+    run concurrently under a rate limiter and the ephemeral reply is edited
+    with progress and the per-member failures.
+    """
+    verb, preposition = ("add", "to") if add else ("remove", "from")
+    role_ids = parse_ids(role_text)
+    if not role_ids:
+        await reply(interaction, "Please enter a valid role ID.")
+        return
+    roles = [interaction.guild.get_role(role_id) for role_id in role_ids]
+    missing = [str(role_id) for role_id, role in zip(role_ids, roles) if role is None]
+    if missing:
+        await reply(interaction, f"Role not found. Please check the role ID(s): {', '.join(missing)}")
+        return
+    action = "add_role" if add else "remove_role"
+    try:
+        # Role-level problems (above the bot or the moderator) fail every member alike
+        with stage("preflight"):
+            check(action, interaction.guild, interaction.user, roles=roles)
+    except PreflightError as e:
+        await reply(interaction, str(e))
+        return
+    role_names = ", ".join(role.name for role in roles)
+    member_ids = [user.id] + [member_id for member_id in parse_ids(members_text) if member_id != user.id]
+
+    async def change(member_id):
+        member = user if member_id == user.id else (
+            interaction.guild.get_member(member_id) or await interaction.guild.fetch_member(member_id)
+        )
+        check(action, interaction.guild, interaction.user, member)
+        method = member.add_roles if add else member.remove_roles
+        # Several roles: one PATCH with the final role list instead of one request per role
+        await scheduled(interaction.client, "moderation", method, *roles, atomic=len(roles) == 1)
+
+    if len(member_ids) == 1:
+        try:
+            # The scheduler may queue the change: answer within Discord's 3 s window first
+            await interaction.response.defer(ephemeral=True)
+            await change(user.id)
+            past = "added" if add else "removed"
+            await reply(interaction, f"Successfully {past} {role_names} {preposition} {user.mention}")
+        except PreflightError as e:
+            await reply(interaction, str(e))
+        except discord.Forbidden:
+            await reply(interaction, f"I don't have permission to {verb} this role.")
+        return
+
+    total = len(member_ids)
+    await reply(interaction, f"Applying: {verb} {role_names} {preposition} {total} members... 0/{total}")
+
+    async def progress(done, total, failures):
+        await interaction.edit_original_response(
+            content=f"Applying: {verb} {role_names} {preposition} {total} members... {done}/{total} ({failures} failed)"
+        )
+
+    results = await run_batch(member_ids, change, RateLimiter.from_env(), on_progress=progress)
+    failed = {member_id: error for member_id, error in results.items() if error is not None}
+    lines = [f"Done: {verb} {role_names} {preposition} {total - len(failed)}/{total} members."]
+    if failed:
+        lines.append("Failed:")
+        lines += [f"<@{member_id}> ({member_id}): {role_batch_error(error)}" for member_id, error in list(failed.items())[:20]]
+        if len(failed) > 20:
+            lines.append(f"...and {len(failed) - 20} more")
+    await interaction.edit_original_response(content="\n".join(lines))
+
 # Modals for different actions
-class BanModal(discord.ui.Modal, title="Ban User"):
+# Moderation API calls go through the shared scheduler ahead of DM fan-out (core/scheduler.py).
+# Each modal defers right after preflight: waiting on the scheduler can exceed Discord's
+# 3-second deadline, so results are sent as follow-ups (see reply()).
+class BanModal(TracedModal, title="Ban User"):
     def __init__(self, user: discord.Member):
         super().__init__()
         self.user = user
@@ -102,23 +320,20 @@ class BanModal(discord.ui.Modal, title="Ban User"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            await self.user.ban(reason=self.reason.value)
-            await interaction.response.send_message(
-                f"Successfully banned {self.user.mention} for: {self.reason.value}",
-                ephemeral=True
-            )
+            with stage("preflight"):
+                check("ban", interaction.guild, interaction.user, self.user)
+            await interaction.response.defer(ephemeral=True)
+            async with EvidenceBatch(interaction, "ban", self.reason.value, user=self.user) as evidence:
+                await scheduled(interaction.client, "moderation", self.user.ban, reason=self.reason.value)
+            await reply(interaction, f"Successfully banned {self.user.mention} for: {self.reason.value}" + evidence_note(evidence.archived))
+        except PreflightError as e:
+            await reply(interaction, str(e))
         except discord.Forbidden:
-            await interaction.response.send_message(
-                "I don't have permission to ban this user.",
-                ephemeral=True
-            )
+            await reply(interaction, "I don't have permission to ban this user.")
         except Exception as e:
-            await interaction.response.send_message(
-                f"An error occurred while executing the command: {str(e)}",
-                ephemeral=True
-            )
+            await reply(interaction, f"An error occurred while executing the command: {str(e)}")
 
-class KickModal(discord.ui.Modal, title="Kick User"):
+class KickModal(TracedModal, title="Kick User"):
     def __init__(self, user: discord.Member):
         super().__init__()
         self.user = user
@@ -132,23 +347,20 @@ class KickModal(discord.ui.Modal, title="Kick User"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            await self.user.kick(reason=self.reason.value)
-            await interaction.response.send_message(
-                f"Successfully kicked {self.user.mention} for: {self.reason.value}",
-                ephemeral=True
-            )
+            with stage("preflight"):
+                check("kick", interaction.guild, interaction.user, self.user)
+            await interaction.response.defer(ephemeral=True)
+            async with EvidenceBatch(interaction, "kick", self.reason.value, user=self.user) as evidence:
+                await scheduled(interaction.client, "moderation", self.user.kick, reason=self.reason.value)
+            await reply(interaction, f"Successfully kicked {self.user.mention} for: {self.reason.value}" + evidence_note(evidence.archived))
+        except PreflightError as e:
+            await reply(interaction, str(e))
         except discord.Forbidden:
-            await interaction.response.send_message(
-                "I don't have permission to kick this user.",
-                ephemeral=True
-            )
+            await reply(interaction, "I don't have permission to kick this user.")
         except Exception as e:
-            await interaction.response.send_message(
-                f"An error occurred while executing the command: {str(e)}",
-                ephemeral=True
-            )
+            await reply(interaction, f"An error occurred while executing the command: {str(e)}")
 
-class TimeoutModal(discord.ui.Modal, title="Timeout User"):
+class TimeoutModal(TracedModal, title="Timeout User"):
     def __init__(self, user: discord.Member):
         super().__init__()
         self.user = user
@@ -169,116 +381,73 @@ class TimeoutModal(discord.ui.Modal, title="Timeout User"):
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
+            with stage("preflight"):
+                check("timeout", interaction.guild, interaction.user, self.user)
             duration_minutes = int(self.duration.value)
             until = discord.utils.utcnow() + datetime.timedelta(minutes=duration_minutes)
-            await self.user.timeout(until, reason=self.reason.value)
-            await interaction.response.send_message(
-                f"Successfully timed out {self.user.mention} for {duration_minutes} minutes. Reason: {self.reason.value}",
-                ephemeral=True
-            )
+            await interaction.response.defer(ephemeral=True)
+            await scheduled(interaction.client, "moderation", self.user.timeout, until, reason=self.reason.value)
+            await reply(interaction, f"Successfully timed out {self.user.mention} for {duration_minutes} minutes. Reason: {self.reason.value}")
         except ValueError:
-            await interaction.response.send_message(
-                "Please enter a valid number for duration.",
-                ephemeral=True
-            )
+            await reply(interaction, "Please enter a valid number for duration.")
+        except PreflightError as e:
+            await reply(interaction, str(e))
         except discord.Forbidden:
-            await interaction.response.send_message(
-                "I don't have permission to timeout this user.",
-                ephemeral=True
-            )
+            await reply(interaction, "I don't have permission to timeout this user.")
         except Exception as e:
-            await interaction.response.send_message(
-                f"An error occurred while executing the command: {str(e)}",
-                ephemeral=True
-            )
+            await reply(interaction, f"An error occurred while executing the command: {str(e)}")
 
-class AddRoleModal(discord.ui.Modal, title="Add Role to User"):
+class AddRoleModal(TracedModal, title="Add Role to User"):
     def __init__(self, user: discord.Member):
         super().__init__()
         self.user = user
         self.role = discord.ui.TextInput(
-            label="Role ID to add",
-            placeholder="Enter the ID of the role to add...",
+            label="Role IDs to add",
+            placeholder="Enter one or more role IDs, separated by spaces...",
             style=discord.TextStyle.short,
             required=True
         )
+        self.members = discord.ui.TextInput(
+            label="Also apply to member IDs (optional)",
+            placeholder="Other member IDs, separated by spaces or new lines...",
+            style=discord.TextStyle.paragraph,
+            required=False
+        )
         self.add_item(self.role)
+        self.add_item(self.members)
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            role_id = int(self.role.value)
-            role = interaction.guild.get_role(role_id)
-            if role:
-                await self.user.add_roles(role)
-                await interaction.response.send_message(
-                    f"Successfully added {role.name} to {self.user.mention}",
-                    ephemeral=True
-                )
-            else:
-                await interaction.response.send_message(
-                    "Role not found. Please check the role ID.",
-                    ephemeral=True
-                )
-        except ValueError:
-            await interaction.response.send_message(
-                "Please enter a valid role ID.",
-                ephemeral=True
-            )
-        except discord.Forbidden:
-            await interaction.response.send_message(
-                "I don't have permission to add this role.",
-                ephemeral=True
-            )
+            await apply_role_batch(interaction, self.user, self.role.value, self.members.value, add=True)
         except Exception as e:
-            await interaction.response.send_message(
-                f"An error occurred while executing the command: {str(e)}",
-                ephemeral=True
-            )
+            await send_error(interaction, e)
 
-class RemoveRoleModal(discord.ui.Modal, title="Remove Role from User"):
+class RemoveRoleModal(TracedModal, title="Remove Role from User"):
     def __init__(self, user: discord.Member):
         super().__init__()
         self.user = user
         self.role = discord.ui.TextInput(
-            label="Role ID to remove",
-            placeholder="Enter the ID of the role to remove...",
+            label="Role IDs to remove",
+            placeholder="Enter one or more role IDs, separated by spaces...",
             style=discord.TextStyle.short,
             required=True
         )
+        self.members = discord.ui.TextInput(
+            label="Also apply to member IDs (optional)",
+            placeholder="Other member IDs, separated by spaces or new lines...",
+            style=discord.TextStyle.paragraph,
+            required=False
+        )
         self.add_item(self.role)
+        self.add_item(self.members)
 
     async def on_submit(self, interaction: discord.Interaction):
         try:
-            role_id = int(self.role.value)
-            role = interaction.guild.get_role(role_id)
-            if role:
-                await self.user.remove_roles(role)
-                await interaction.response.send_message(
-                    f"Successfully removed {role.name} from {self.user.mention}",
-                    ephemeral=True
-                )
-            else:
-                await interaction.response.send_message(
-                    "Role not found. Please check the role ID.",
-                    ephemeral=True
-                )
-        except ValueError:
-            await interaction.response.send_message(
-                "Please enter a valid role ID.",
-                ephemeral=True
-            )
-        except discord.Forbidden:
-            await interaction.response.send_message(
-                "I don't have permission to remove this role.",
-                ephemeral=True
-            )
+            await apply_role_batch(interaction, self.user, self.role.value, self.members.value, add=False)
         except Exception as e:
-            await interaction.response.send_message(
-                f"An error occurred while executing the command: {str(e)}",
-                ephemeral=True
-            )
+            await send_error(interaction, e)
 
-class PurgeModal(discord.ui.Modal, title="Purge Messages"):
+class PurgeModal(TracedModal, title="Purge Messages"):
     def __init__(self):
         super().__init__()
         self.amount = discord.ui.TextInput(
@@ -293,33 +462,26 @@ class PurgeModal(discord.ui.Modal, title="Purge Messages"):
         try:
             amount = int(self.amount.value)
             if amount < 1 or amount > 100:
-                await interaction.response.send_message(
-                    "Please enter a number between 1 and 100.",
-                    ephemeral=True
-                )
+                await reply(interaction, "Please enter a number between 1 and 100.")
                 return
                 
-            # Delete the messages
-            deleted = await interaction.channel.purge(limit=amount)
-            await interaction.response.send_message(
-                f"Successfully deleted {len(deleted)} messages.",
-                ephemeral=True
-            )
+            with stage("preflight"):
+                check("purge", interaction.guild, interaction.user, channel=interaction.channel)
+            await interaction.response.defer(ephemeral=True)
+            
+            # Snapshot what is about to be deleted, then delete the messages while it is written
+            async with EvidenceBatch(interaction, "purge", channel=interaction.channel, limit=amount) as evidence:
+                deleted = await scheduled(interaction.client, "moderation", interaction.channel.purge, limit=amount)
+            await reply(interaction, f"Successfully deleted {len(deleted)} messages." + evidence_note(evidence.archived))
         except ValueError:
-            await interaction.response.send_message(
-                "Please enter a valid number.",
-                ephemeral=True
-            )
+            await reply(interaction, "Please enter a valid number.")
+        except PreflightError as e:
+            await reply(interaction, str(e))
         except discord.Forbidden:
-            await interaction.response.send_message(
-                "I don't have permission to delete messages in this channel.",
-                ephemeral=True
-            )
+            await reply(interaction, "I don't have permission to delete messages in this channel.")
         except Exception as e:
-            await interaction.response.send_message(
-                f"An error occurred while executing the command: {str(e)}",
-                ephemeral=True
-            )
+            await reply(interaction, f"An error occurred while executing the command: {str(e)}")
 
 async def setup(bot: commands.Bot):
+    bot.guild_config.seed(DEFAULT_GUILDS)
     await bot.add_cog(ModerationPanel(bot))
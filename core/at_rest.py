@@ -0,0 +1,263 @@
+import io
+import logging
+import os
+import struct
+
+# Cifrado en reposo por trozos (AES-256-GCM) para los almacenes del bot.
+#
+# Formato:  cabecera = b'SBE1' | tamaño de trozo (uint32) | sal (16 bytes)
+#           trozo i  = nonce (12) | texto cifrado (<= tamaño de trozo) | tag (16)
+#
+# La clave de cada fichero se deriva con HKDF de la de get_encryption_key y
+# la sal de la cabecera. Cada trozo lleva su índice y si es el último como
+# datos autenticados, así que reordenar, quitar o truncar trozos hace fallar
+# el descifrado. Todos los trozos salvo el último ocupan lo mismo, lo que da
+# acceso aleatorio en O(1) y memoria constante (un trozo) al leer o escribir.
+# cryptography solo se importa cuando hay algo que cifrar o descifrar.
+
+logger = logging.getLogger('bot.at_rest')
+
+MAGIC = b'SBE1'
+HEADER = struct.Struct('>4sI16s')
+NONCE_SIZE = 12
+TAG_SIZE = 16
+DEFAULT_CHUNK_SIZE = 64 * 1024
+_INFO = b'silentbot at-rest v1'
+
+_key = None
+
+
+class DecryptionError(Exception):
+    """Un trozo no se pudo autenticar: fichero corrupto, manipulado o clave incorrecta"""
+
+
+def enabled():
+    return os.environ.get('AT_REST_ENCRYPTION', '0').lower() in ('1', 'true', 'yes')
+
+
+def master_key():
+    """Clave de KEY_CODE (core/crypto.py), derivada una sola vez por proceso"""
+    global _key
+    if _key is None:
+        from core.crypto import get_encryption_key
+        _key = get_encryption_key()
+        if _key is None:
+            raise ValueError("AT_REST_ENCRYPTION está activo pero no hay una KEY_CODE válida")
+    return _key
+
+
+def _file_cipher(key, salt):
+    from cryptography.hazmat.primitives import hashes
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+    from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+    return AESGCM(HKDF(algorithm=hashes.SHA256(), length=32, salt=salt, info=_INFO).derive(key))
+
+
+def _aad(header, index, last):
+    return header + struct.pack('>QB', index, last)
+
+
+def is_encrypted(path):
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+class EncryptedFile(io.RawIOBase):
+    """Fichero binario cifrado con la interfaz de `open` ('rb', 'wb' o 'ab').
+
+    En lectura admite `seek`, así que sirve directamente para discord.File,
+    gzip.GzipFile o io.TextIOWrapper. Al añadir ('ab') se descifra y se
+    vuelve a sellar solo el último trozo, con un nonce nuevo.
+    """
+
+    def __init__(self, path, mode='rb', key=None, chunk_size=DEFAULT_CHUNK_SIZE):
+        super().__init__()
+        self._file = None
+        if mode not in ('rb', 'wb', 'ab'):
+            raise ValueError(f"modo no soportado: {mode}")
+        self.name = path
+        self.mode = mode
+        self._key = key or master_key()
+        self._buffer = bytearray()  # escritura: texto pendiente del trozo actual
+        self._cached = (None, b'')  # lectura: (índice, texto) del último trozo descifrado
+        self._index = 0
+        self._pos = 0
+        self.size = 0
+
+        try:
+            if mode == 'ab' and os.path.exists(path) and os.path.getsize(path) > 0:
+                self._file = open(path, 'r+b')
+                self._read_header()
+                self._reopen_last_chunk()
+            elif mode in ('wb', 'ab'):
+                self._file = open(path, 'wb')
+                self.chunk_size = chunk_size
+                self._header = HEADER.pack(MAGIC, chunk_size, os.urandom(16))
+                self._cipher = _file_cipher(self._key, self._header[8:])
+                self._file.write(self._header)
+            else:
+                self._file = open(path, 'rb')
+                self._read_header()
+                body = os.fstat(self._file.fileno()).st_size - HEADER.size
+                self.chunks = -(-body // self._stride) if body > 0 else 0
+                if not self.chunks:
+                    # Hasta un fichero vacío tiene su último trozo: sin trozos, se truncó
+                    raise DecryptionError(f"{self.name}: no tiene ningún trozo")
+                last = body - (self.chunks - 1) * self._stride
+                self.size = (self.chunks - 1) * self.chunk_size + last - NONCE_SIZE - TAG_SIZE
+        except BaseException:
+            if self._file is not None:
+                self._file.close()
+            self._file = None
+            raise
+
+    def _read_header(self):
+        header = self._file.read(HEADER.size)
+        if len(header) != HEADER.size:
+            raise DecryptionError(f"{self.name}: cabecera incompleta")
+        magic, self.chunk_size, salt = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise DecryptionError(f"{self.name}: no es un fichero cifrado")
+        self._header = header
+        self._cipher = _file_cipher(self._key, salt)
+
+    @property
+    def _stride(self):
+        return NONCE_SIZE + self.chunk_size + TAG_SIZE
+
+    # --- Lectura ---
+
+    def read_chunk(self, index):
+        """Texto del trozo `index`; lanza DecryptionError si no se autentica"""
+        if self._cached[0] == index:
+            return self._cached[1]
+        self._file.seek(HEADER.size + index * self._stride)
+        sealed = self._file.read(self._stride)
+        last = index == self.chunks - 1
+        if len(sealed) < NONCE_SIZE + TAG_SIZE:
+            raise DecryptionError(f"{self.name}: trozo {index} incompleto")
+        try:
+            from cryptography.exceptions import InvalidTag
+            plain = self._cipher.decrypt(sealed[:NONCE_SIZE], sealed[NONCE_SIZE:], _aad(self._header, index, last))
+        except InvalidTag:
+            raise DecryptionError(f"{self.name}: el trozo {index} no se pudo autenticar") from None
+        self._cached = (index, plain)
+        return plain
+
+    def readable(self):
+        return self.mode == 'rb'
+
+    def seekable(self):
+        return self.mode == 'rb'
+
+    def readinto(self, buffer):
+        if self._pos >= self.size:
+            return 0
+        index, offset = divmod(self._pos, self.chunk_size)
+        plain = self.read_chunk(index)
+        count = min(len(buffer), len(plain) - offset)
+        buffer[:count] = plain[offset:offset + count]
+        self._pos += count
+        return count
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if not self.seekable():
+            raise io.UnsupportedOperation("seek")
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._pos, io.SEEK_END: self.size}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self):
+        return self._pos if self.mode == 'rb' else self.size
+
+    # --- Escritura ---
+
+    def writable(self):
+        return self.mode in ('wb', 'ab')
+
+    def _reopen_last_chunk(self):
+        body = os.fstat(self._file.fileno()).st_size - HEADER.size
+        self.chunks = -(-body // self._stride)
+        self._index = self.chunks - 1
+        self._buffer = bytearray(self.read_chunk(self._index))
+        self.size = self._index * self.chunk_size + len(self._buffer)
+        self._file.seek(HEADER.size + self._index * self._stride)
+        self._file.truncate()
+
+    def _seal(self, data, last):
+        nonce = os.urandom(NONCE_SIZE)
+        self._file.write(nonce + self._cipher.encrypt(nonce, bytes(data), _aad(self._header, self._index, last)))
+        self._index += 1
+
+    def write(self, data):
+        if not self.writable():
+            raise io.UnsupportedOperation("write")
+        self._buffer += data
+        self.size += len(data)
+        # Un trozo lleno solo se sella cuando llega más texto: el último siempre va marcado como tal
+        while len(self._buffer) > self.chunk_size:
+            self._seal(self._buffer[:self.chunk_size], last=False)
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._file is not None and self.writable():
+                self._seal(self._buffer, last=True)
+                self._buffer = bytearray()
+        finally:
+            if self._file is not None:
+                self._file.close()
+            super().close()
+
+
+def open_store(path, mode='rb', encoding=None):
+    """`open` para los almacenes persistentes: cifra al escribir si AT_REST_ENCRYPTION está activo.
+
+    Al leer se detecta el formato por la cabecera, así que los ficheros en
+    claro de antes de activar el cifrado se siguen pudiendo leer. Con
+    `encoding` devuelve texto (p. ej. mode='w', encoding='utf-8').
+    """
+    binary_mode = mode.replace('t', '').replace('b', '') + 'b'
+    if binary_mode == 'rb':
+        raw = EncryptedFile(path, 'rb') if is_encrypted(path) else open(path, 'rb')
+    elif enabled():
+        raw = EncryptedFile(path, binary_mode)
+    else:
+        raw = open(path, binary_mode)
+    if encoding is not None:
+        if isinstance(raw, EncryptedFile):
+            raw = io.BufferedReader(raw) if binary_mode == 'rb' else io.BufferedWriter(raw)
+        return io.TextIOWrapper(raw, encoding=encoding)
+    return raw
+
+
+def encrypt_stream(source, destination, key=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Cifra un fichero (o fichero abierto) en otro leyendo de trozo en trozo"""
+    with EncryptedFile(destination, 'wb', key=key, chunk_size=chunk_size) as out:
+        _copy(source, out, chunk_size)
+
+
+def decrypt_stream(source, destination, key=None):
+    with EncryptedFile(source, 'rb', key=key) as encrypted:
+        if isinstance(destination, (str, os.PathLike)):
+            with open(destination, 'wb') as out:
+                _copy(encrypted, out, encrypted.chunk_size)
+        else:
+            _copy(encrypted, destination, encrypted.chunk_size)
+
+
+def _copy(source, destination, chunk_size):
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            return _copy(f, destination, chunk_size)
+    while True:
+        data = source.read(chunk_size)
+        if not data:
+            break
+        destination.write(data)
@@ -0,0 +1,198 @@
+import asyncio
+import hashlib
+import logging
+import os
+import tempfile
+from collections import OrderedDict
+
+import aiohttp
+import discord
+
+from core.at_rest import open_store
+
+logger = logging.getLogger('bot.attachments')
+
+
+def _write_chunk(file, hasher, chunk):
+    hasher.update(chunk)
+    file.write(chunk)
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class AttachmentCache:
+    """Almacén local de adjuntos direccionado por contenido (SHA-256).
+
+    Los adjuntos se descargan por trozos y se escriben a disco mientras se
+    calcula su hash, sin cargar el fichero entero en memoria. Un mismo fichero
+    se guarda una sola vez aunque llegue desde varias URLs, y al superar
+    `max_bytes` se expulsan los menos usados (LRU). Varios procesos pueden
+    leer del mismo directorio: los ficheros solo aparecen con un rename atómico.
+    Con AT_REST_ENCRYPTION se guardan cifrados (core/at_rest.py) y se
+    descifran por trozos al enviarse.
+    """
+
+    def __init__(self, root, max_bytes=512 * 1024 * 1024, max_file_bytes=10 * 1024 * 1024, chunk_size=64 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.chunk_size = chunk_size
+        self.entries = OrderedDict()  # {digest: size}, del menos al más usado
+        self.names = {}  # {digest: nombre original}
+        self.total_bytes = 0
+        self.stats = {"hits": 0, "downloads": 0, "deduplicated": 0, "evicted": 0, "rejected": 0}
+        self._inflight = {}
+        self._session = None
+        os.makedirs(root, exist_ok=True)
+        self._load_index()
+
+    @classmethod
+    def from_env(cls):
+        """ATTACHMENT_CACHE_MB=0 desactiva la caché"""
+        max_mb = float(os.environ.get('ATTACHMENT_CACHE_MB', 512))
+        if max_mb <= 0:
+            return None
+        return cls(
+            os.environ.get('ATTACHMENT_CACHE_DIR', '.attachment_cache'),
+            max_bytes=int(max_mb * 1024 * 1024),
+            max_file_bytes=int(float(os.environ.get('ATTACHMENT_MAX_FILE_MB', 10)) * 1024 * 1024),
+        )
+
+    def _load_index(self):
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if len(filename) == 64 and not filename.endswith('.tmp'):
+                    stat = os.stat(os.path.join(dirpath, filename))
+                    found.append((stat.st_atime, filename, stat.st_size))
+        for _, digest, size in sorted(found):
+            self.entries[digest] = size
+            self.total_bytes += size
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], digest)
+
+    def __contains__(self, digest):
+        return digest in self.entries or os.path.exists(self.path(digest))
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=60))
+        return self._session
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def store_attachment(self, attachment):
+        """Guarda un discord.Attachment y devuelve su hash, o None si no se pudo"""
+        if attachment.size and attachment.size > self.max_file_bytes:
+            self.stats["rejected"] += 1
+            return None
+        digest = await self.fetch(attachment.url)
+        if digest is not None:
+            self.names[digest] = attachment.filename
+        return digest
+
+    async def fetch(self, url):
+        """Descarga una URL al almacén; peticiones simultáneas a la misma URL se comparten"""
+        task = self._inflight.get(url)
+        if task is None:
+            task = asyncio.ensure_future(self._download(url))
+            self._inflight[url] = task
+            task.add_done_callback(lambda _: self._inflight.pop(url, None))
+        return await asyncio.shield(task)
+
+    async def _download(self, url):
+        session = await self._get_session()
+        hasher = hashlib.sha256()
+        size = 0
+        # Disco, hash y cifrado van a un hilo: el event loop solo espera a la red
+        tmp_path = await asyncio.to_thread(self._tmp_path)
+        try:
+            file = await asyncio.to_thread(open_store, tmp_path, 'wb')
+            try:
+                async with session.get(url) as response:
+                    response.raise_for_status()
+                    if (response.content_length or 0) > self.max_file_bytes:
+                        self.stats["rejected"] += 1
+                        return None
+                    async for chunk in response.content.iter_chunked(self.chunk_size):
+                        size += len(chunk)
+                        if size > self.max_file_bytes:
+                            self.stats["rejected"] += 1
+                            return None
+                        await asyncio.to_thread(_write_chunk, file, hasher, chunk)
+            finally:
+                await asyncio.to_thread(file.close)
+
+            digest = hasher.hexdigest()
+            self.stats["downloads"] += 1
+            if digest in self:
+                self.stats["deduplicated"] += 1
+                self.touch(digest)
+                return digest
+
+            await asyncio.to_thread(self._move_into_place, tmp_path, digest)
+            self.entries[digest] = size
+            self.total_bytes += size
+            await asyncio.to_thread(_remove_files, self._evict())
+            return digest
+        except Exception as e:
+            logger.error(f"Error caching attachment {url}: {e}")
+            return None
+        finally:
+            await asyncio.to_thread(_remove_files, [tmp_path])
+
+    def _tmp_path(self):
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix='.tmp')
+        os.close(fd)
+        return tmp_path
+
+    def _move_into_place(self, tmp_path, digest):
+        os.makedirs(os.path.dirname(self.path(digest)), exist_ok=True)
+        os.replace(tmp_path, self.path(digest))
+
+    def touch(self, digest):
+        if digest in self.entries:
+            self.entries.move_to_end(digest)
+
+    def _evict(self):
+        """Saca de la cuenta los menos usados hasta caber en `max_bytes`; devuelve las rutas a borrar"""
+        paths = []
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            digest, size = self.entries.popitem(last=False)
+            self.total_bytes -= size
+            self.names.pop(digest, None)
+            self.stats["evicted"] += 1
+            paths.append(self.path(digest))
+        return paths
+
+    def open_file(self, digest, filename=None):
+        """discord.File que lee del disco al enviarse, o None si ya no está en caché"""
+        path = self.path(digest)
+        if not os.path.exists(path):
+            return None
+        self.stats["hits"] += 1
+        self.touch(digest)
+        return discord.File(open_store(path), filename=filename or self.names.get(digest) or digest)
+
+    def files_for(self, digests, filenames=None):
+        filenames = filenames or [None] * len(digests)
+        files = [self.open_file(digest, name) for digest, name in zip(digests, filenames) if digest]
+        return [file for file in files if file is not None]
+
+    def snapshot(self):
+        return {
+            "entries": len(self.entries),
+            "total_bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            **self.stats,
+        }
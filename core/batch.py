@@ -0,0 +1,71 @@
+import asyncio
+import os
+import re
+import time
+
+from core.throttle import TokenBucket
+
+_SNOWFLAKE = re.compile(r'\d{15,21}')
+
+
+def parse_ids(text):
+    """IDs de Discord en un texto libre (separados por espacios, comas o menciones), sin repetir"""
+    return list(dict.fromkeys(int(match) for match in _SNOWFLAKE.findall(text or '')))
+
+
+class RateLimiter:
+    """Como mucho `rate` operaciones por segundo y `concurrency` a la vez"""
+
+    def __init__(self, rate=5.0, concurrency=5, burst=None):
+        self.bucket = TokenBucket(rate, burst or concurrency, time.monotonic())
+        self.semaphore = asyncio.Semaphore(concurrency)
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            rate=float(os.environ.get('BATCH_RATE', 5)),
+            concurrency=int(os.environ.get('BATCH_CONCURRENCY', 5)),
+        )
+
+    async def __aenter__(self):
+        await self.semaphore.acquire()
+        while not self.bucket.ready(time.monotonic()):
+            await asyncio.sleep(self.bucket.wait_time(time.monotonic()))
+        self.bucket.consume()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.semaphore.release()
+
+
+async def run_batch(items, fn, limiter, on_progress=None, progress_interval=1.0):
+    """Aplica `fn(item)` a todos los elementos en paralelo bajo `limiter`.
+
+    Un fallo no detiene el resto: devuelve {item: None si fue bien, o el
+    error}. `on_progress(hechos, total, fallos)` se llama como mucho una vez
+    cada `progress_interval` segundos mientras dura el lote.
+    """
+    results = {}
+    total = len(items)
+    last_progress = time.monotonic()
+
+    async def apply(item):
+        nonlocal last_progress
+        async with limiter:
+            try:
+                await fn(item)
+                results[item] = None
+            except Exception as e:
+                results[item] = e
+
+        now = time.monotonic()
+        if on_progress is not None and len(results) < total and now - last_progress >= progress_interval:
+            last_progress = now
+            failures = sum(1 for error in results.values() if error is not None)
+            try:
+                await on_progress(len(results), total, failures)
+            except Exception:
+                pass
+
+    await asyncio.gather(*(apply(item) for item in items))
+    return results
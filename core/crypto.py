@@ -0,0 +1,62 @@
+import base64
+import logging
+import os
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import padding
+
+# Este módulo importa toda la pila de cryptography; main.py solo lo carga
+# cuando hay ficheros *.encrypted que descifrar.
+
+logger = logging.getLogger('bot.crypto')
+
+def get_encryption_key():
+    """Obtiene y deriva la clave desde la variable de entorno KEY_CODE"""
+    try:
+        key_code = os.environ.get('KEY_CODE')
+        if not key_code:
+            raise ValueError("KEY_CODE no está definida en las variables de entorno")
+        
+        # Decodifica la clave base64
+        key = base64.urlsafe_b64decode(key_code)
+        
+        if len(key) != 32:
+            salt = b'fixed_salt_for_github'
+            kdf = PBKDF2HMAC(
+                algorithm=hashes.SHA256(),
+                length=32,
+                salt=salt,
+                iterations=100000,
+                backend=default_backend()
+            )
+            key = kdf.derive(key_code.encode())
+        
+        return key
+    except Exception as e:
+        logger.error(f"Error getting encryption key: {e}")
+        return None
+
+def decrypt_file(encrypted_content, key):
+    """Descifra contenido usando AES-256 en modo CBC"""
+    try:
+        encrypted_data = base64.b64decode(encrypted_content)
+        iv = encrypted_data[:16]
+        ciphertext = encrypted_data[16:]
+        
+        cipher = Cipher(
+            algorithms.AES(key),
+            modes.CBC(iv),
+            backend=default_backend()
+        )
+        decryptor = cipher.decryptor()
+        padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
+        
+        unpadder = padding.PKCS7(128).unpadder()
+        plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
+        
+        return plaintext.decode('utf-8')
+    except Exception as e:
+        logger.error(f"Error decrypting file: {e}")
+        return None
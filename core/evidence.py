@@ -0,0 +1,273 @@
+import asyncio
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from core.at_rest import open_store
+
+logger = logging.getLogger('bot.evidence')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS batches (
+    id INTEGER PRIMARY KEY,
+    guild_id INTEGER NOT NULL,
+    action TEXT NOT NULL,
+    path TEXT NOT NULL,
+    created REAL NOT NULL,
+    moderator_id INTEGER,
+    reason TEXT,
+    messages INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS batch_keys (
+    batch_id INTEGER NOT NULL,
+    guild_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    channel_id INTEGER NOT NULL,
+    messages INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS batch_keys_user ON batch_keys (guild_id, user_id, batch_id);
+CREATE INDEX IF NOT EXISTS batch_keys_channel ON batch_keys (guild_id, channel_id, batch_id);
+"""
+
+# Coste aproximado de un Snapshot sin contar el texto (objeto, ints, entradas del dict y la deque)
+_SNAPSHOT_OVERHEAD = 240
+
+
+class Snapshot:
+    """Copia mínima de un mensaje de servidor, independiente de la caché de discord.py"""
+
+    __slots__ = ('id', 'channel_id', 'author_id', 'ts', 'content', 'attachments', 'size')
+
+    def __init__(self, id, channel_id, author_id, ts, content, attachments=()):
+        self.id = id
+        self.channel_id = channel_id
+        self.author_id = author_id
+        self.ts = int(ts)
+        self.content = content
+        self.attachments = tuple(attachments) if attachments else ()
+        self.size = _SNAPSHOT_OVERHEAD + len(content) + sum(len(url) for url in self.attachments)
+
+    @classmethod
+    def from_message(cls, message):
+        return cls(
+            message.id,
+            message.channel.id,
+            message.author.id,
+            message.created_at.timestamp(),
+            message.content,
+            [attachment.url for attachment in message.attachments],
+        )
+
+    def to_dict(self):
+        return {
+            "message_id": self.id,
+            "channel_id": self.channel_id,
+            "author_id": self.author_id,
+            "timestamp": datetime.fromtimestamp(self.ts).isoformat(timespec='seconds'),
+            "content": self.content,
+            "attachments": list(self.attachments),
+        }
+
+
+class GuildBuffer:
+    """Mensajes recientes de un servidor: como mucho `per_channel` por canal y `max_bytes` en total.
+
+    `messages` mantiene el orden de llegada de todo el servidor y cada
+    canal guarda sus IDs en el mismo orden, así que el mensaje más antiguo
+    del servidor es siempre el primero de su canal y los dos límites se
+    aplican en O(1).
+    """
+
+    __slots__ = ('per_channel', 'max_bytes', 'messages', 'channels', 'bytes')
+
+    def __init__(self, per_channel, max_bytes):
+        self.per_channel = per_channel
+        self.max_bytes = max_bytes
+        self.messages = OrderedDict()  # {message_id: Snapshot}
+        self.channels = {}  # {channel_id: deque(message_id)}
+        self.bytes = 0
+
+    def add(self, snapshot):
+        channel = self.channels.get(snapshot.channel_id)
+        if channel is None:
+            channel = self.channels[snapshot.channel_id] = deque()
+        channel.append(snapshot.id)
+        self.messages[snapshot.id] = snapshot
+        self.bytes += snapshot.size
+
+        if len(channel) > self.per_channel:
+            self.bytes -= self.messages.pop(channel.popleft()).size
+        while self.bytes > self.max_bytes and self.messages:
+            _, oldest = self.messages.popitem(last=False)
+            self.bytes -= oldest.size
+            oldest_channel = self.channels[oldest.channel_id]
+            oldest_channel.popleft()
+            if not oldest_channel:
+                del self.channels[oldest.channel_id]
+
+    def by_user(self, user_id):
+        return [snapshot for snapshot in self.messages.values() if snapshot.author_id == user_id]
+
+    def by_channel(self, channel_id, limit=None):
+        ids = self.channels.get(channel_id, ())
+        if limit is not None:
+            ids = list(ids)[-limit:]
+        return [self.messages[message_id] for message_id in ids]
+
+
+class EvidenceCache:
+    """Búfer en memoria de los mensajes recientes de cada servidor y archivo de pruebas en disco.
+
+    Antes de un purge, ban o kick los mensajes afectados se escriben como un
+    lote JSONL comprimido en `root/<guild_id>/` y se indexan en SQLite por
+    usuario y canal, así que lo borrado se puede consultar después. Las
+    escrituras van a un único hilo propio con una conexión fija: varios
+    lotes a la vez no compiten por el bloqueo de escritura de SQLite.
+    """
+
+    def __init__(self, root, per_channel=100, guild_bytes=1024 * 1024):
+        self.root = root
+        self.per_channel = per_channel
+        self.guild_bytes = guild_bytes
+        self.index_path = os.path.join(root, 'index.db')
+        self.guilds = {}
+        self.archived = 0
+        self.archived_messages = 0
+        os.makedirs(root, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='evidence')
+        self.db = sqlite3.connect(self.index_path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+
+    @classmethod
+    def from_env(cls):
+        """EVIDENCE_DIR vacío desactiva el archivo de pruebas"""
+        root = os.environ.get('EVIDENCE_DIR', 'evidence')
+        if not root:
+            return None
+        return cls(
+            root,
+            per_channel=int(os.environ.get('EVIDENCE_CHANNEL_MESSAGES', 100)),
+            guild_bytes=int(float(os.environ.get('EVIDENCE_GUILD_KB', 1024)) * 1024),
+        )
+
+    def add(self, message):
+        guild_id = message.guild.id
+        buffer = self.guilds.get(guild_id)
+        if buffer is None:
+            buffer = self.guilds[guild_id] = GuildBuffer(self.per_channel, self.guild_bytes)
+        buffer.add(Snapshot.from_message(message))
+
+    def drop_guild(self, guild_id):
+        self.guilds.pop(guild_id, None)
+
+    def collect(self, guild_id, user_id=None, channel_id=None, limit=None):
+        """Mensajes en memoria de un usuario (en todo el servidor) o de un canal"""
+        buffer = self.guilds.get(guild_id)
+        if buffer is None:
+            return []
+        if user_id is not None:
+            return buffer.by_user(user_id)
+        return buffer.by_channel(channel_id, limit)
+
+    async def archive(self, guild_id, action, snapshots, moderator_id=None, reason=None):
+        """Escribe un lote y lo indexa; devuelve la ruta del fichero o None si no había nada"""
+        path = await self.write(guild_id, action, snapshots)
+        if path is not None:
+            await self.commit(guild_id, action, path, snapshots, moderator_id, reason)
+        return path
+
+    async def write(self, guild_id, action, snapshots):
+        """Escribe el lote en disco sin indexarlo todavía; devuelve la ruta o None si no había nada.
+
+        Permite escribir mientras se ejecuta la acción y decidir después: `commit`
+        si salió bien, `discard` si falló, para no archivar acciones que no ocurrieron.
+        """
+        if not snapshots:
+            return None
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._write_file, guild_id, action, snapshots)
+
+    async def commit(self, guild_id, action, path, snapshots, moderator_id=None, reason=None):
+        """Indexa un lote escrito con `write`: desde aquí aparece en `find`"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            self._executor, self._index_batch, guild_id, action, path, snapshots, moderator_id, reason
+        )
+        self.archived += 1
+        self.archived_messages += len(snapshots)
+
+    async def discard(self, path):
+        """Borra un lote escrito que no se llegó a indexar"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, os.remove, path)
+
+    def _write_file(self, guild_id, action, snapshots):
+        directory = os.path.join(self.root, str(guild_id))
+        os.makedirs(directory, exist_ok=True)
+        filename = f"{datetime.now():%Y%m%d-%H%M%S}-{action}-{uuid.uuid4().hex[:8]}.jsonl.gz"
+        path = os.path.join(directory, filename)
+        with open_store(path, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb') as f:
+            for snapshot in snapshots:
+                f.write((json.dumps(snapshot.to_dict(), ensure_ascii=False) + '\n').encode('utf-8'))
+        return path
+
+    def _index_batch(self, guild_id, action, path, snapshots, moderator_id, reason):
+        keys = {}
+        for snapshot in snapshots:
+            key = (snapshot.author_id, snapshot.channel_id)
+            keys[key] = keys.get(key, 0) + 1
+        with self.db:
+            batch_id = self.db.execute(
+                'INSERT INTO batches (guild_id, action, path, created, moderator_id, reason, messages) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (guild_id, action, path, time.time(), moderator_id, reason, len(snapshots))
+            ).lastrowid
+            self.db.executemany(
+                'INSERT INTO batch_keys (batch_id, guild_id, user_id, channel_id, messages) VALUES (?, ?, ?, ?, ?)',
+                [(batch_id, guild_id, user_id, channel_id, count) for (user_id, channel_id), count in keys.items()]
+            )
+
+    def find(self, guild_id, user_id=None, channel_id=None, limit=10):
+        """Lotes archivados de un usuario o canal, del más reciente al más antiguo"""
+        sql = ['SELECT b.id, b.action, b.path, b.created, b.moderator_id, b.reason, sum(k.messages)',
+               'FROM batch_keys k JOIN batches b ON b.id = k.batch_id WHERE k.guild_id = ?']
+        params = [guild_id]
+        if user_id is not None:
+            sql.append('AND k.user_id = ?')
+            params.append(user_id)
+        if channel_id is not None:
+            sql.append('AND k.channel_id = ?')
+            params.append(channel_id)
+        sql.append('GROUP BY b.id ORDER BY b.id DESC LIMIT ?')
+        params.append(limit)
+        with sqlite3.connect(self.index_path) as db:
+            rows = db.execute(' '.join(sql), params).fetchall()
+        return [
+            {"batch_id": batch_id, "action": action, "path": path, "created": datetime.fromtimestamp(created),
+             "moderator_id": moderator_id, "reason": reason, "messages": messages}
+            for batch_id, action, path, created, moderator_id, reason, messages in rows
+        ]
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.db.close()
+
+    def snapshot(self):
+        return {
+            "guilds": len(self.guilds),
+            "buffered_messages": sum(len(buffer.messages) for buffer in self.guilds.values()),
+            "buffered_bytes": sum(buffer.bytes for buffer in self.guilds.values()),
+            "per_channel": self.per_channel,
+            "guild_bytes": self.guild_bytes,
+            "archived_batches": self.archived,
+            "archived_messages": self.archived_messages,
+        }
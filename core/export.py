@@ -0,0 +1,103 @@
+import csv
+import gzip
+import io
+import itertools
+import json
+import os
+from datetime import datetime
+
+# Campos de cada fila exportada, en el orden de las columnas CSV
+FIELDS = ("timestamp", "target_id", "sender_id", "direction", "content", "attachments")
+
+# Margen para lo que zlib aún no ha volcado al fichero al decidir si cortar
+_PART_MARGIN = 512 * 1024
+
+
+def iter_history(conversation_history, target_id=None):
+    """Filas del historial en memoria (cuando no hay índice SQLite).
+
+    Solo recorre las entradas que existían al empezar, así que puede
+    consumirse en un hilo mientras el event loop sigue añadiendo mensajes.
+    """
+    target_ids = [target_id] if target_id is not None else list(conversation_history)
+    for tid in target_ids:
+        history = conversation_history.get(tid, [])
+        for entry in itertools.islice(history, len(history)):
+            yield {
+                "target_id": tid,
+                "sender_id": entry.sender,
+                "direction": entry.direction,
+                "ts": entry.ts,
+                "content": entry.content,
+                "attachments": list(entry.attachments),
+            }
+
+
+def _normalize(rows):
+    for row in rows:
+        yield {
+            "timestamp": datetime.fromtimestamp(row["ts"]).isoformat(timespec='seconds'),
+            "target_id": row["target_id"],
+            "sender_id": row["sender_id"],
+            "direction": row["direction"],
+            "content": row["content"],
+            "attachments": row.get("attachments", []),
+        }
+
+
+def jsonl_lines(rows):
+    for row in _normalize(rows):
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in _normalize(rows):
+        # En CSV las URLs de los adjuntos van en una sola columna separadas por espacios
+        row["attachments"] = " ".join(row["attachments"])
+        writer.writerow([row[field] for field in FIELDS])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+FORMATS = {
+    "jsonl": (jsonl_lines, None),
+    "csv": (csv_lines, ",".join(FIELDS) + "\n"),
+}
+
+
+def write_parts(rows, directory, basename, fmt="jsonl", max_part_bytes=8 * 1024 * 1024):
+    """Escribe las filas en ficheros .gz de como mucho `max_part_bytes` cada uno.
+
+    Cada parte es un gzip independiente (con su propia cabecera en CSV), así
+    que se pueden subir y abrir por separado. La memoria usada no depende del
+    número de filas. Devuelve ([rutas], filas escritas).
+    """
+    to_lines, header = FORMATS[fmt]
+    limit = max(max_part_bytes - _PART_MARGIN, _PART_MARGIN)
+    paths = []
+    count = 0
+    raw = archive = None
+
+    try:
+        for line in to_lines(rows):
+            if archive is None or raw.tell() >= limit:
+                if archive is not None:
+                    archive.close()
+                    raw.close()
+                path = os.path.join(directory, f"{basename}.part{len(paths) + 1}.{fmt}.gz")
+                paths.append(path)
+                # Partes temporales: se suben y se borran, así que no pasan por el cifrado en reposo
+                raw = open(path, 'wb')
+                archive = gzip.GzipFile(filename=f"{basename}.{fmt}", mode='wb', fileobj=raw)
+                if header:
+                    archive.write(header.encode('utf-8'))
+            archive.write(line.encode('utf-8'))
+            count += 1
+    finally:
+        if archive is not None:
+            archive.close()
+            raw.close()
+    return paths, count
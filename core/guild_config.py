@@ -0,0 +1,260 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+
+import discord
+
+logger = logging.getLogger('bot.guild_config')
+
+
+def command_signature(tree, guild_id):
+    """Hash de los comandos de aplicación de un ámbito (None = global)"""
+    guild = discord.Object(id=guild_id) if guild_id else None
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands(guild=guild)),
+        key=lambda data: (data.get('type', 1), data['name'])
+    )
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def parse_guilds(data):
+    """{"guilds": {"<guild_id>": {"roles": [<role_id>, ...]}}} -> {guild_id: frozenset(role_ids)}"""
+    guilds = data.get("guilds", {}) if isinstance(data, dict) else None
+    if not isinstance(guilds, dict):
+        raise ValueError("se esperaba un objeto 'guilds'")
+    parsed = {}
+    for guild_id, settings in guilds.items():
+        roles = (settings or {}).get("roles", [])
+        if not isinstance(roles, list):
+            raise ValueError(f"roles del servidor {guild_id} no es una lista")
+        parsed[int(guild_id)] = frozenset(int(role_id) for role_id in roles)
+    return parsed
+
+
+class GuildConfig:
+    """Servidores en los que se sirven los comandos por servidor y roles con acceso.
+
+    Se guarda en un JSON que se puede editar a mano:
+        {"guilds": {"<guild_id>": {"roles": [<role_id>, ...]}}}
+    y en memoria es {guild_id: frozenset(role_ids)}, así que la comprobación
+    de cada interacción es una búsqueda en un dict. Los cambios (del fichero,
+    vigilado por mtime, o de `set_guild`/`remove_guild`) se aplican en
+    caliente: se calcula qué servidores se añadieron, quitaron o cambiaron de
+    roles y se pasa a `on_change`. La firma de los comandos ya sincronizados
+    se guarda aparte para no resincronizar al arrancar lo que no cambió.
+    """
+
+    def __init__(self, path, interval=5.0, on_change=None):
+        self.path = path
+        self.sync_path = os.path.splitext(path)[0] + '.sync.json'
+        self.interval = interval
+        self.on_change = on_change
+        self.guilds = {}
+        self.synced = {}  # {'global' | guild_id (str): firma sincronizada}
+        self.reloads = 0
+        self.errors = 0
+        self.last_error = None
+        self._mtime = None
+        self._task = None
+        self._lock = asyncio.Lock()
+        self.load()
+        self.synced = self._read_synced()
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            os.environ.get('GUILD_CONFIG_PATH', 'guild_config.json'),
+            interval=float(os.environ.get('GUILD_CONFIG_INTERVAL', 5.0)),
+        )
+
+    # --- Consultas ---
+
+    def __contains__(self, guild_id):
+        return guild_id in self.guilds
+
+    def __len__(self):
+        return len(self.guilds)
+
+    def guild_ids(self):
+        return sorted(self.guilds)
+
+    def roles(self, guild_id):
+        return self.guilds.get(guild_id, frozenset())
+
+    def allows(self, guild_id, role_ids):
+        """True si el servidor está registrado y alguno de los roles tiene acceso"""
+        roles = self.guilds.get(guild_id)
+        return roles is not None and not roles.isdisjoint(role_ids)
+
+    # --- Carga y escritura ---
+
+    @staticmethod
+    def _read_json(path):
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _read_synced(self):
+        """Firmas de la última sincronización; si el fichero está dañado se vuelve a sincronizar todo"""
+        try:
+            synced = self._read_json(self.sync_path) or {}
+            if not isinstance(synced, dict):
+                raise ValueError("se esperaba un objeto JSON")
+            return synced
+        except ValueError as e:
+            logger.error(f"Estado de sincronización no válido en {self.sync_path}, se sincroniza todo: {e}")
+            return {}
+
+    def _mtime_now(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    @staticmethod
+    def diff(old, new):
+        return {
+            "added": sorted(set(new) - set(old)),
+            "removed": sorted(set(old) - set(new)),
+            "updated": sorted(guild_id for guild_id in set(old) & set(new) if old[guild_id] != new[guild_id]),
+        }
+
+    def load(self):
+        """Relee el fichero y devuelve los cambios; si no es válido se conserva lo anterior"""
+        self._mtime = self._mtime_now()
+        try:
+            data = self._read_json(self.path)
+            guilds = parse_guilds(data) if data is not None else {}
+        except (ValueError, TypeError, AttributeError) as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logger.error(f"Configuración de servidores no válida en {self.path}: {e}")
+            return self.diff(self.guilds, self.guilds)
+
+        changes = self.diff(self.guilds, guilds)
+        self.guilds = guilds
+        self.reloads += 1
+        self.last_error = None
+        return changes
+
+    def _write(self, path, data):
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+
+    def save(self):
+        self._write(self.path, {
+            "guilds": {
+                str(guild_id): {"roles": sorted(roles)}
+                for guild_id, roles in sorted(self.guilds.items())
+            }
+        })
+        self._mtime = self._mtime_now()
+
+    def seed(self, guilds):
+        """Escribe una configuración inicial {guild_id: [role_ids]} solo si aún no existe el fichero"""
+        if os.path.exists(self.path):
+            return False
+        self.guilds = {int(guild_id): frozenset(map(int, roles)) for guild_id, roles in guilds.items()}
+        self.save()
+        logger.info(f"Configuración de servidores creada en {self.path} con {len(self.guilds)} servidores")
+        return True
+
+    async def _apply(self, guilds):
+        changes = self.diff(self.guilds, guilds)
+        self.guilds = guilds
+        self.save()
+        await self._notify(changes)
+        return changes
+
+    async def set_guild(self, guild_id, role_ids):
+        async with self._lock:
+            guilds = dict(self.guilds)
+            guilds[int(guild_id)] = frozenset(map(int, role_ids))
+            return await self._apply(guilds)
+
+    async def remove_guild(self, guild_id):
+        async with self._lock:
+            guilds = dict(self.guilds)
+            guilds.pop(int(guild_id), None)
+            return await self._apply(guilds)
+
+    async def _notify(self, changes):
+        if not any(changes.values()):
+            return
+        logger.info(
+            f"Configuración de servidores: {len(changes['added'])} añadidos, "
+            f"{len(changes['removed'])} quitados, {len(changes['updated'])} con roles nuevos"
+        )
+        if self.on_change is not None:
+            try:
+                await self.on_change(changes)
+            except Exception as e:
+                logger.error(f"Error al aplicar la configuración de servidores: {e}")
+
+    async def refresh(self):
+        """Aplica el fichero si cambió en disco desde la última lectura"""
+        if self._mtime_now() == self._mtime:
+            return None
+        async with self._lock:
+            changes = self.load()
+            await self._notify(changes)
+            return changes
+
+    # --- Firmas sincronizadas ---
+
+    def needs_sync(self, scope, signature):
+        return self.synced.get(scope) != signature
+
+    def mark_synced(self, scope, signature):
+        self.synced[scope] = signature
+
+    def forget_synced(self, scope):
+        self.synced.pop(scope, None)
+
+    def stale_synced(self):
+        """Servidores con comandos sincronizados que ya no están en el registro (p. ej. quitados con el bot apagado)"""
+        return sorted(int(scope) for scope in self.synced if scope != 'global' and int(scope) not in self.guilds)
+
+    def save_synced(self):
+        try:
+            self._write(self.sync_path, self.synced)
+        except OSError as e:
+            logger.error(f"No se pudo guardar el estado de sincronización en {self.sync_path}: {e}")
+
+    # --- Vigilancia ---
+
+    def start(self):
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._watch())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                logger.error(f"Error en la vigilancia de la configuración de servidores: {e}")
+
+    def snapshot(self):
+        return {
+            "path": self.path,
+            "guilds": len(self.guilds),
+            "roles": sum(len(roles) for roles in self.guilds.values()),
+            "reloads": self.reloads,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "synced_scopes": len(self.synced),
+        }
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import logging
+import time
+
+from aiohttp import web
+
+logger = logging.getLogger('bot.health')
+
+
+class HealthMonitor:
+    """Estado de salud del bot precalculado para las sondas /healthz y /readyz.
+
+    Una tarea en segundo plano mide el retraso del event loop y recalcula el
+    estado cada `interval` segundos; las sondas solo devuelven el último
+    resultado, así que su coste no depende de la carga.
+    """
+
+    def __init__(self, bot, interval=1.0, max_loop_lag=2.0, gateway_grace=120.0):
+        self.bot = bot
+        self.interval = interval
+        self.max_loop_lag = max_loop_lag
+        self.gateway_grace = gateway_grace
+        self.loop_lag = 0.0
+        self.connected = False
+        self.disconnected_since = time.monotonic()
+        self.started_at = time.monotonic()
+        self._live = (503, b'{}')
+        self._ready = (503, b'{}')
+        self._task = None
+
+    def start(self):
+        if self._task is None:
+            self.refresh()
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    # Eventos del gateway (los llaman on_connect, on_resumed y on_disconnect en main.py)
+    def gateway_connected(self):
+        self.connected = True
+        self.disconnected_since = None
+
+    def gateway_disconnected(self):
+        if self.connected:
+            self.disconnected_since = time.monotonic()
+        self.connected = False
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            self.loop_lag = max(0.0, time.monotonic() - expected)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Error al calcular el estado de salud: {e}")
+
+    def refresh(self):
+        bot = self.bot
+        now = time.monotonic()
+        latency = bot.latency
+        disconnected_for = round(now - self.disconnected_since, 1) if self.disconnected_since else 0.0
+        failed_sync = {scope: error for scope, error in bot.sync_status.items() if error != 'ok'}
+
+        state = {
+            "uptime_s": round(now - self.started_at, 1),
+            "gateway": {
+                "connected": self.connected and not bot.is_closed(),
+                "ready": bot.is_ready(),
+                "disconnected_for_s": disconnected_for,
+                "latency_ms": round(latency * 1000, 2) if latency == latency and latency != float('inf') else None,
+            },
+            "event_loop_lag_ms": round(self.loop_lag * 1000, 2),
+            "cogs": {
+                "loaded": sorted(bot.loaded_cogs),
+                "failed": bot.failed_cogs,
+            },
+            "sync": {
+                "done": bot.sync_done,
+                "failed": failed_sync,
+            },
+        }
+
+        # Vivo: el loop responde y el gateway no lleva demasiado tiempo caído
+        live_checks = {
+            "event_loop": self.loop_lag < self.max_loop_lag,
+            "gateway": disconnected_for < self.gateway_grace,
+        }
+        ready_checks = {
+            # Durante la parada ordenada deja de recibir tráfico antes de cerrar
+            "accepting": not getattr(bot, 'draining', False),
+            "event_loop": live_checks["event_loop"],
+            "gateway": state["gateway"]["connected"] and state["gateway"]["ready"],
+            "cogs": not bot.failed_cogs and bool(bot.loaded_cogs),
+            "sync": bot.sync_done and not failed_sync,
+        }
+
+        self._live = self._encode(live_checks, state)
+        self._ready = self._encode(ready_checks, state)
+
+    def _encode(self, checks, state):
+        ok = all(checks.values())
+        body = json.dumps({"status": "ok" if ok else "fail", "checks": checks, **state}).encode('utf-8')
+        return (200 if ok else 503), body
+
+    async def healthz(self, request):
+        status, body = self._live
+        return web.Response(body=body, status=status, content_type='application/json')
+
+    async def readyz(self, request):
+        status, body = self._ready
+        return web.Response(body=body, status=status, content_type='application/json')
@@ -0,0 +1,52 @@
+import sys
+import time
+from datetime import datetime
+
+# Dirección de cada mensaje; internadas para que todas las entradas compartan el mismo objeto
+INCOMING = sys.intern('incoming')
+OUTGOING = sys.intern('outgoing')
+
+
+class HistoryEntry:
+    """Un mensaje de `conversation_history`.
+
+    Con `__slots__` no hay dict por instancia ni claves repetidas; la hora se
+    guarda como entero epoch (segundos) en lugar de un datetime y las listas
+    vacías de adjuntos son la tupla vacía compartida.
+    """
+
+    __slots__ = ('sender', 'ts', 'direction', 'content', 'attachments', 'cached_attachments', 'responder_name')
+
+    def __init__(self, sender, content, direction=INCOMING, ts=None, attachments=(),
+                 cached_attachments=(), responder_name=None):
+        self.sender = sender
+        self.ts = int(time.time()) if ts is None else int(ts)
+        self.direction = OUTGOING if direction == OUTGOING else INCOMING
+        self.content = content
+        self.attachments = tuple(attachments) if attachments else ()
+        self.cached_attachments = tuple(map(tuple, cached_attachments)) if cached_attachments else ()
+        self.responder_name = responder_name
+
+    @property
+    def timestamp(self):
+        return datetime.fromtimestamp(self.ts)
+
+    @property
+    def outgoing(self):
+        return self.direction is OUTGOING
+
+    @classmethod
+    def from_dict(cls, entry):
+        """Entradas del formato anterior (dicts), p. ej. al recargar el cog en caliente"""
+        return cls(
+            entry["sender"],
+            entry["content"],
+            direction=entry.get("type", INCOMING),
+            ts=entry["timestamp"].timestamp(),
+            attachments=entry.get("attachments", ()),
+            cached_attachments=entry.get("cached_attachments", ()),
+            responder_name=entry.get("responder_name"),
+        )
+
+    def __repr__(self):
+        return f"<HistoryEntry sender={self.sender} ts={self.ts} direction={self.direction}>"
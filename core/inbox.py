@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict
+
+logger = logging.getLogger('bot.inbox')
+
+
+class Conversation:
+    """Una fila de la bandeja: quién escribe, cuántos mensajes sin responder y la última actividad"""
+
+    __slots__ = ('target_id', 'name', 'unread', 'total', 'last_ts', 'preview')
+
+    def __init__(self, target_id, name, unread=0, total=0, last_ts=0, preview=''):
+        self.target_id = target_id
+        self.name = name
+        self.unread = unread
+        self.total = total
+        self.last_ts = int(last_ts)
+        self.preview = preview
+
+    def to_list(self):
+        return [self.target_id, self.name, self.unread, self.total, self.last_ts, self.preview]
+
+
+class Inbox:
+    """Conversaciones activas ordenadas por última actividad (la más reciente al final).
+
+    Solo guarda lo que se muestra: una fila por conversación con el
+    contador de no leídos y un extracto del último mensaje. Las que llevan
+    más de `idle` segundos sin actividad y sin nada pendiente se olvidan.
+    """
+
+    def __init__(self, idle=24 * 3600, preview_chars=80, clock=time.time):
+        self.idle = idle
+        self.preview_chars = preview_chars
+        self.clock = clock
+        self.conversations = OrderedDict()  # {target_id: Conversation}
+        self.message_id = None  # mensaje del owner que se edita
+
+    def _touch(self, target_id, name, now):
+        conversation = self.conversations.get(target_id)
+        if conversation is None:
+            conversation = self.conversations[target_id] = Conversation(target_id, name)
+        else:
+            self.conversations.move_to_end(target_id)
+            conversation.name = name or conversation.name
+        conversation.last_ts = int(now)
+        return conversation
+
+    def incoming(self, target_id, name, content, now=None):
+        conversation = self._touch(target_id, name, self.clock() if now is None else now)
+        conversation.unread += 1
+        conversation.total += 1
+        text = ' '.join(content.split()) or '(attachment)'
+        conversation.preview = text if len(text) <= self.preview_chars else text[:self.preview_chars - 1] + '…'
+
+    def replied(self, target_id, name=None, now=None):
+        """Alguien respondió: la conversación queda al día"""
+        conversation = self._touch(target_id, name, self.clock() if now is None else now)
+        conversation.unread = 0
+        conversation.total += 1
+
+    def mark_read(self, target_id=None):
+        """Pone a cero los no leídos de una conversación (o de todas); devuelve si cambió algo"""
+        targets = self.conversations.values() if target_id is None else filter(None, [self.conversations.get(target_id)])
+        changed = False
+        for conversation in targets:
+            changed = changed or conversation.unread > 0
+            conversation.unread = 0
+        return changed
+
+    def remove(self, target_id):
+        return self.conversations.pop(target_id, None) is not None
+
+    def prune(self, now=None):
+        cutoff = (self.clock() if now is None else now) - self.idle
+        stale = [target_id for target_id, conversation in self.conversations.items()
+                 if conversation.last_ts < cutoff and not conversation.unread]
+        for target_id in stale:
+            del self.conversations[target_id]
+        return len(stale)
+
+    def rows(self, limit):
+        """Las `limit` conversaciones más recientes, primero las que tienen algo sin leer"""
+        recent = list(reversed(self.conversations.values()))[:limit]
+        return sorted(recent, key=lambda conversation: not conversation.unread)
+
+    def unread(self):
+        return sum(conversation.unread for conversation in self.conversations.values())
+
+    def to_dict(self):
+        return {"message_id": self.message_id,
+                "conversations": [conversation.to_list() for conversation in self.conversations.values()]}
+
+    def load(self, data):
+        self.message_id = data.get("message_id")
+        for row in data.get("conversations", []):
+            conversation = Conversation(*row)
+            self.conversations[conversation.target_id] = conversation
+
+
+class DebouncedEditor:
+    """Agrupa los cambios de un mensaje y lo edita como mucho `per_minute` veces por minuto.
+
+    `touch()` solo marca que hay algo nuevo y, si no había ya una edición
+    programada, la programa tras `debounce` segundos (o cuando se cumpla el
+    intervalo mínimo desde la anterior). Lo que llegue mientras tanto entra
+    en la misma edición, así que el número de ediciones no depende del
+    tráfico. Si algo cambia durante una edición se programa otra.
+    """
+
+    def __init__(self, publish, per_minute=6, debounce=2.0, clock=time.monotonic):
+        self.publish = publish
+        self.min_interval = 60.0 / per_minute
+        self.debounce = debounce
+        self.clock = clock
+        self.dirty = False
+        self.last_edit = None
+        self.counters = Counter()
+        self._handle = None
+        self._task = None
+
+    @classmethod
+    def from_env(cls, publish):
+        """DM_INBOX=0 desactiva la bandeja"""
+        if os.environ.get('DM_INBOX', '1').lower() in ('0', 'false', 'no'):
+            return None
+        return cls(
+            publish,
+            per_minute=float(os.environ.get('DM_INBOX_EDITS_PER_MINUTE', 6)),
+            debounce=float(os.environ.get('DM_INBOX_DEBOUNCE', 2.0)),
+        )
+
+    def touch(self):
+        self.dirty = True
+        self.counters["changes"] += 1
+        if self._handle is None and self._task is None:
+            self._schedule()
+
+    def _schedule(self):
+        delay = self.debounce
+        if self.last_edit is not None:
+            delay = max(delay, self.last_edit + self.min_interval - self.clock())
+        loop = asyncio.get_running_loop()
+        self._handle = loop.call_later(delay, self._fire)
+
+    def _fire(self):
+        self._handle = None
+        self._task = asyncio.create_task(self._edit())
+
+    async def _edit(self):
+        self.dirty = False
+        try:
+            await self.publish()
+            self.counters["edits"] += 1
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"Error al actualizar la bandeja de entrada: {e}")
+        finally:
+            self.last_edit = self.clock()
+            self._task = None
+        if self.dirty:
+            self._schedule()
+
+    async def flush(self):
+        """Edita ya si hay algo pendiente (p. ej. al apagar)"""
+        if self._task is not None:
+            await self._task
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self.dirty:
+            await self._edit()
+
+    def stop(self):
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def snapshot(self):
+        return {
+            "min_interval": self.min_interval,
+            "debounce": self.debounce,
+            "pending": self.dirty,
+            **self.counters,
+        }
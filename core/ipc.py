@@ -0,0 +1,317 @@
+import asyncio
+import itertools
+import json
+import logging
+import os
+import struct
+import subprocess
+import sys
+import zlib
+from collections import deque
+
+logger = logging.getLogger('bot.ipc')
+
+# Cada trama es una longitud de 4 bytes (big endian) seguida de JSON UTF-8
+HEADER = struct.Struct('>I')
+MAX_FRAME = 16 * 1024 * 1024
+
+
+def encode_frame(obj):
+    data = json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8')
+    return HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader):
+    header = await reader.readexactly(HEADER.size)
+    (size,) = HEADER.unpack(header)
+    if size > MAX_FRAME:
+        raise ValueError(f"Trama IPC demasiado grande: {size} bytes")
+    return json.loads(await reader.readexactly(size))
+
+
+def route_index(key, count):
+    """Elige el worker para una clave; la misma clave siempre va al mismo worker"""
+    try:
+        value = int(key)
+    except (TypeError, ValueError):
+        value = zlib.crc32(str(key).encode('utf-8'))
+    return value % count
+
+
+class _Peer:
+    """Conexión de un proceso al bus con su cola de salida"""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, writer):
+        self.id = next(self._ids)
+        self.writer = writer
+        self.role = None
+        self.worker_id = None
+        self.queue = asyncio.Queue()
+        self.task = asyncio.create_task(self._write_loop())
+
+    def send(self, obj):
+        self.queue.put_nowait(encode_frame(obj))
+
+    async def _write_loop(self):
+        try:
+            while True:
+                frames = [await self.queue.get()]
+                while not self.queue.empty():
+                    frames.append(self.queue.get_nowait())
+                self.writer.write(b''.join(frames))
+                await self.writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+
+
+class StateBus:
+    """Bus IPC local sobre un socket Unix.
+
+    Vive en el proceso gateway. Guarda el estado compartido (espacios de nombres
+    de clave/valor) y aplica todas las escrituras en un único bucle, de modo que
+    cada proceso ve las actualizaciones en el mismo orden. Los eventos publicados
+    se reparten entre los workers por clave para conservar el orden por usuario.
+    """
+
+    def __init__(self, path, backlog_limit=10000):
+        self.path = path
+        self.state = {}
+        self.version = 0
+        self.workers = []
+        self.gateways = []
+        self.backlog = deque(maxlen=backlog_limit)
+        self.stats = {"events_routed": 0, "events_backlogged": 0, "updates": 0}
+        self._server = None
+
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._server = await asyncio.start_unix_server(self._handle, path=self.path)
+        logger.info(f"Bus IPC escuchando en {self.path}")
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for peer in self.workers + self.gateways:
+            peer.task.cancel()
+            peer.writer.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def snapshot(self):
+        return {
+            "version": self.version,
+            "workers": [peer.worker_id for peer in self.workers],
+            "gateways": len(self.gateways),
+            "backlog": len(self.backlog),
+            **self.stats,
+        }
+
+    async def _handle(self, reader, writer):
+        peer = _Peer(writer)
+        try:
+            hello = await read_frame(reader)
+            peer.role = hello.get('role', 'gateway')
+            peer.worker_id = hello.get('worker_id')
+            peer.send({"op": "snapshot", "peer_id": peer.id, "state": self.state, "version": self.version})
+
+            if peer.role == 'worker':
+                self.workers.append(peer)
+                self.workers.sort(key=lambda p: p.worker_id or 0)
+                logger.info(f"Worker {peer.worker_id} conectado al bus")
+                while self.backlog:
+                    self._route(self.backlog.popleft())
+            else:
+                self.gateways.append(peer)
+
+            while True:
+                self._apply(peer, await read_frame(reader))
+        except (asyncio.IncompleteReadError, ConnectionError, asyncio.CancelledError):
+            # Al cerrar el bus los handlers se cancelan; no es un error
+            pass
+        except Exception as e:
+            logger.error(f"Error en la conexión IPC {peer.id}: {e}")
+        finally:
+            if peer in self.workers:
+                self.workers.remove(peer)
+                logger.warning(f"Worker {peer.worker_id} desconectado del bus")
+            if peer in self.gateways:
+                self.gateways.remove(peer)
+            peer.task.cancel()
+            writer.close()
+
+    def _apply(self, peer, msg):
+        op = msg.get('op')
+        if op in ('set', 'delete'):
+            namespace = self.state.setdefault(msg['ns'], {})
+            key = str(msg['key'])
+            if op == 'set':
+                namespace[key] = msg['value']
+            else:
+                namespace.pop(key, None)
+            self.version += 1
+            self.stats["updates"] += 1
+            update = {
+                "op": "update",
+                "ns": msg['ns'],
+                "key": key,
+                "value": msg.get('value'),
+                "deleted": op == 'delete',
+                "version": self.version,
+                "origin": peer.id,
+                "rid": msg.get('rid'),
+            }
+            for other in self.workers + self.gateways:
+                other.send(update)
+        elif op == 'publish':
+            event = {"op": "event", "topic": msg['topic'], "key": msg.get('key'), "payload": msg.get('payload')}
+            if msg.get('to') == 'gateway':
+                for gateway in self.gateways:
+                    gateway.send(event)
+            else:
+                self._route(event)
+        else:
+            logger.warning(f"Operación IPC desconocida: {op}")
+
+    def _route(self, event):
+        if not self.workers:
+            # Sin workers conectados: guardar hasta que alguno se registre
+            self.backlog.append(event)
+            self.stats["events_backlogged"] += 1
+            return
+        self.workers[route_index(event.get('key'), len(self.workers))].send(event)
+        self.stats["events_routed"] += 1
+
+
+class BusClient:
+    """Cliente del bus con una réplica local del estado compartido.
+
+    Las lecturas son locales y síncronas; las escrituras esperan a que el bus
+    confirme el cambio para que cada proceso lea sus propias escrituras.
+    """
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.state = {}
+        self.version = 0
+        self.peer_id = None
+        self._rids = itertools.count(1)
+        self._waiters = {}
+        self._handlers = {}
+        self._tasks = set()
+        self._reader_task = None
+
+    @classmethod
+    async def connect(cls, path, role='gateway', worker_id=None, retries=50, delay=0.1):
+        for attempt in range(retries):
+            try:
+                reader, writer = await asyncio.open_unix_connection(path)
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                if attempt == retries - 1:
+                    raise
+                await asyncio.sleep(delay)
+
+        client = cls(reader, writer)
+        writer.write(encode_frame({"op": "hello", "role": role, "worker_id": worker_id}))
+        await writer.drain()
+        snapshot = await read_frame(reader)
+        client.peer_id = snapshot['peer_id']
+        client.state = snapshot['state']
+        client.version = snapshot['version']
+        client._reader_task = asyncio.create_task(client._read_loop())
+        return client
+
+    def get(self, ns, key, default=None):
+        return self.state.get(ns, {}).get(str(key), default)
+
+    async def set(self, ns, key, value):
+        await self._write({"op": "set", "ns": ns, "key": str(key), "value": value})
+
+    async def delete(self, ns, key):
+        await self._write({"op": "delete", "ns": ns, "key": str(key)})
+
+    async def publish(self, topic, key, payload, to='worker'):
+        self.writer.write(encode_frame({"op": "publish", "topic": topic, "key": key, "payload": payload, "to": to}))
+        await self.writer.drain()
+
+    def subscribe(self, topic, handler):
+        """Registra una corrutina que recibe el payload de cada evento del tema"""
+        self._handlers[topic] = handler
+
+    async def wait_closed(self):
+        await self._reader_task
+
+    async def close(self):
+        self.writer.close()
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+
+    async def _write(self, msg):
+        rid = next(self._rids)
+        msg['rid'] = rid
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[rid] = waiter
+        self.writer.write(encode_frame(msg))
+        await self.writer.drain()
+        await waiter
+
+    async def _read_loop(self):
+        try:
+            while True:
+                msg = await read_frame(self.reader)
+                op = msg.get('op')
+                if op == 'update':
+                    namespace = self.state.setdefault(msg['ns'], {})
+                    if msg['deleted']:
+                        namespace.pop(msg['key'], None)
+                    else:
+                        namespace[msg['key']] = msg['value']
+                    self.version = msg['version']
+                    if msg['origin'] == self.peer_id:
+                        waiter = self._waiters.pop(msg['rid'], None)
+                        if waiter is not None and not waiter.done():
+                            waiter.set_result(msg['version'])
+                elif op == 'event':
+                    handler = self._handlers.get(msg['topic'])
+                    if handler is None:
+                        continue
+                    task = asyncio.create_task(handler(msg['payload']))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning("Conexión con el bus IPC cerrada")
+        finally:
+            for waiter in self._waiters.values():
+                if not waiter.done():
+                    waiter.set_exception(ConnectionError("Bus IPC cerrado"))
+            self._waiters.clear()
+
+
+def spawn_workers(count, socket_path, script='worker.py'):
+    """Lanza `count` procesos worker que se conectan al bus en `socket_path`"""
+    processes = []
+    for worker_id in range(count):
+        env = dict(os.environ, IPC_SOCKET=socket_path, WORKER_ID=str(worker_id))
+        processes.append(subprocess.Popen([sys.executable, script], env=env))
+    return processes
+
+
+async def stop_workers(processes, timeout=10, poll=0.1):
+    """Termina los workers y espera sin bloquear el event loop; mata los que sigan vivos tras `timeout`"""
+    for process in processes:
+        if process.poll() is None:
+            process.terminate()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while any(process.poll() is None for process in processes) and loop.time() < deadline:
+        await asyncio.sleep(poll)
+    for process in processes:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
@@ -0,0 +1,166 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+
+TEXT_FORMAT = '%(asctime)s:%(levelname)s:%(name)s: %(message)s'
+
+
+class JsonFormatter(logging.Formatter):
+    """Una línea JSON por registro"""
+
+    def format(self, record):
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Deja pasar solo una fracción de los registros de los loggers ruidosos.
+
+    `rates` asocia prefijos de logger con la fracción a conservar (0.1 = uno de
+    cada diez). El muestreo es determinista y nunca se aplica a WARNING o superior.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+        self._credit = {}
+        self.sampled_out = 0
+
+    def rate_for(self, name):
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + '.'):
+                return prefix, rate
+        return None, 1.0
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        prefix, rate = self.rate_for(record.name)
+        if rate >= 1.0:
+            return True
+        credit = self._credit.get(prefix, 0.0) + rate
+        if credit >= 1.0:
+            self._credit[prefix] = credit - 1.0
+            return True
+        self._credit[prefix] = credit
+        self.sampled_out += 1
+        return False
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler que nunca bloquea: si la cola está llena descarta el registro.
+
+    El formateo completo (incluidas las trazas) se hace en el hilo del listener;
+    aquí solo se resuelve el mensaje para que los argumentos no cambien después.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self.enqueued = 0
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+
+class _DrainingListener(logging.handlers.QueueListener):
+    """El centinela de parada espera hueco aunque la cola esté llena"""
+
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+
+def parse_sample_rates(value):
+    """Convierte "discord.gateway=0.1,bot.dmreplies=0.5" en un diccionario"""
+    rates = {}
+    for part in (value or '').split(','):
+        if '=' not in part:
+            continue
+        name, rate = part.split('=', 1)
+        rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+class LogPipeline:
+    """Registro asíncrono: los handlers encolan y un hilo formatea y escribe"""
+
+    def __init__(self, stream=None, json_output=False, queue_size=10000, sample_rates=None):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queue_size = queue_size
+        self.handler = DroppingQueueHandler(self.queue)
+        self.sampler = SamplingFilter(sample_rates or {})
+        self.handler.addFilter(self.sampler)
+
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter() if json_output else logging.Formatter(TEXT_FORMAT))
+        self.output = output
+        self.listener = _DrainingListener(self.queue, output, respect_handler_level=True)
+        self.json_output = json_output
+        self.started_at = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self.started_at is None:
+                self.listener.start()
+                self.started_at = time.time()
+                atexit.register(self.stop)
+
+    def stop(self):
+        """Vacía la cola y detiene el hilo de escritura"""
+        with self._lock:
+            if self.started_at is not None:
+                self.listener.stop()
+                self.started_at = None
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue_size,
+            "enqueued": self.handler.enqueued,
+            "dropped": self.handler.dropped,
+            "sampled_out": self.sampler.sampled_out,
+            "format": "json" if self.json_output else "text",
+        }
+
+
+def setup_logging(logger_names=('',), level=logging.INFO):
+    """Instala el pipeline según LOG_FORMAT, LOG_QUEUE_SIZE y LOG_SAMPLE.
+
+    Por defecto se engancha al logger raíz para que los loggers `bot.*` y
+    `discord.*` compartan la misma cola.
+    """
+    pipeline = LogPipeline(
+        json_output=os.environ.get('LOG_FORMAT', 'text').lower() == 'json',
+        queue_size=int(os.environ.get('LOG_QUEUE_SIZE', 10000)),
+        sample_rates=parse_sample_rates(os.environ.get('LOG_SAMPLE')),
+    )
+    for name in logger_names:
+        target = logging.getLogger(name)
+        target.addHandler(pipeline.handler)
+        if name:
+            target.setLevel(level)
+    pipeline.start()
+    return pipeline
@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+logger = logging.getLogger('bot.memory')
+
+# Trazas que no son del bot: el propio tracemalloc y la maquinaria de importación
+_FILTERS = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+    tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    tracemalloc.Filter(False, '<unknown>'),
+)
+
+_CONTAINERS = (dict, list, tuple, set, frozenset, deque)
+
+
+def deep_size(obj, seen=None):
+    """Tamaño aproximado en bytes de un contenedor y lo que cuelga de él.
+
+    Solo se recorren contenedores integrados y objetos con `__slots__` de
+    core/ (HistoryEntry, Snapshot, TokenBucket...); cualquier otro objeto,
+    p. ej. un discord.User que apunta al estado de la conexión, cuenta solo
+    su tamaño propio para no medir medio proceso desde cada estructura.
+    """
+    seen = set() if seen is None else seen
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, _CONTAINERS):
+            stack.extend(item)
+        elif type(item).__module__.startswith('core.') and hasattr(type(item), '__slots__'):
+            stack.extend(getattr(item, name) for name in type(item).__slots__ if hasattr(item, name))
+    return total
+
+
+def _discord_caches(bot):
+    """Cachés de discord.py: solo número de entradas (recorrerlas sería tan caro como lo que miden)"""
+    state = getattr(bot, '_connection', None)
+    if state is None:
+        return {}
+    guilds = list(getattr(state, '_guilds', {}).values())
+    view_store = getattr(state, '_view_store', None)
+    return {
+        "discord.users": len(getattr(state, '_users', ())),
+        "discord.guilds": len(guilds),
+        "discord.members": sum(len(getattr(guild, '_members', ())) for guild in guilds),
+        "discord.private_channels": len(getattr(state, '_private_channels', ())),
+        "discord.messages": len(getattr(state, '_messages', None) or ()),
+        "discord.emojis": len(getattr(state, '_emojis', ())),
+        "discord.stickers": len(getattr(state, '_stickers', ())),
+        "discord.message_views": len(getattr(view_store, '_synced_message_views', ())),
+    }
+
+
+def tracked_structures(bot):
+    """{nombre: objeto} de las estructuras del bot que pueden crecer: los contenedores de cada cog y de core/"""
+    structures = {}
+    for cog_name, cog in bot.cogs.items():
+        for name, value in vars(cog).items():
+            if isinstance(value, _CONTAINERS):
+                structures[f"{cog_name}.{name}"] = value
+        throttle = getattr(cog, 'throttle', None)
+        if throttle is not None:
+            structures[f"{cog_name}.throttle.buckets"] = throttle.buckets
+            structures[f"{cog_name}.throttle.queues"] = throttle.queues
+            structures[f"{cog_name}.throttle.window"] = throttle.window
+    evidence = getattr(bot, 'evidence', None)
+    if evidence is not None:
+        structures["evidence.guilds"] = evidence.guilds
+    attachment_cache = getattr(bot, 'attachment_cache', None)
+    if attachment_cache is not None:
+        structures["attachments.entries"] = attachment_cache.entries
+    shard_stats = getattr(bot, 'shard_stats', None)
+    if shard_stats is not None:
+        structures["shards.buckets"] = shard_stats._buckets
+    return structures
+
+
+def structure_sizes(bot):
+    """{nombre: {"entries", "bytes"}} de cada estructura y entradas de las cachés de discord.py"""
+    sizes = {}
+    for name, value in tracked_structures(bot).items():
+        sizes[name] = {"entries": len(value), "bytes": deep_size(value)}
+    for name, entries in _discord_caches(bot).items():
+        sizes[name] = {"entries": entries}
+    return sizes
+
+
+def _location(frame):
+    filename = frame.filename
+    for prefix in (os.getcwd(), sys.prefix, sys.base_prefix):
+        if filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f"{filename}:{frame.lineno}"
+
+
+class MemoryDiagnostics:
+    """Instantáneas de tracemalloc bajo demanda o periódicas, con diferencias entre ellas.
+
+    Apagado (lo normal) no hay coste: tracemalloc no está activo y no corre
+    ninguna tarea. Al activarlo cada asignación guarda `frames` marcos de
+    pila, así que solo se enciende mientras se investiga. Se conservan dos
+    instantáneas, la de referencia (al activar) y la última, para acotar la
+    memoria que ocupa el propio diagnóstico; cada instantánea nueva se
+    compara con la anterior y el resumen queda en `reports`. Los tamaños de
+    las estructuras no entran en las instantáneas: recorrerlas bloquea el
+    event loop, así que solo se miden al pedirlos (!memory sizes).
+    """
+
+    def __init__(self, bot, frames=1, interval=0.0, top=10, keep_reports=12, autostart=False):
+        self.bot = bot
+        self.autostart = autostart
+        self.frames = frames
+        self.interval = interval
+        self.top = top
+        self.baseline = None
+        self.last = None
+        self.reports = deque(maxlen=keep_reports)
+        self.snapshots = 0
+        self.started_at = None
+        self._task = None
+        self._lock = asyncio.Lock()
+
+    @classmethod
+    def from_env(cls, bot):
+        """MEMORY_TRACE=1 activa el rastreo al arrancar; si no, se activa con !memory start"""
+        env = os.environ.get
+        return cls(
+            bot,
+            frames=int(env('MEMORY_TRACE_FRAMES', 1)),
+            interval=float(env('MEMORY_SNAPSHOT_INTERVAL', 0)),
+            top=int(env('MEMORY_TOP', 10)),
+            autostart=env('MEMORY_TRACE', '0').lower() in ('1', 'true', 'yes'),
+        )
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    async def start(self, frames=None, interval=None):
+        if frames is not None:
+            self.frames = frames
+        if interval is not None:
+            self.interval = interval
+        if self.tracing and tracemalloc.get_traceback_limit() != self.frames:
+            # La profundidad de las pilas solo se fija al arrancar: se reinicia con la nueva
+            # (y con una referencia nueva, las pilas anteriores no son comparables)
+            tracemalloc.stop()
+        if not self.tracing:
+            tracemalloc.start(self.frames)
+            self.started_at = time.time()
+            self.baseline = self.last = None
+        if self.baseline is None:
+            await self.take()
+        if self._task is None and self.interval > 0:
+            self._task = asyncio.create_task(self._run())
+        logger.info(f"Rastreo de memoria activo ({self.frames} marcos, instantánea cada {self.interval or '-'}s)")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.tracing:
+            tracemalloc.stop()
+            logger.info("Rastreo de memoria detenido")
+        self.baseline = self.last = None
+        self.started_at = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                report = await self.take()
+                growth = report["growth"][:3]
+                logger.info(f"Memoria: {report['traced_kib']} KiB trazados; más crecimiento en {growth}")
+            except Exception as e:
+                logger.error(f"Error al tomar la instantánea de memoria: {e}")
+
+    async def take(self):
+        """Toma una instantánea, la compara con la anterior y devuelve el resumen"""
+        if not self.tracing:
+            raise RuntimeError("tracemalloc no está activo (!memory start)")
+        async with self._lock:
+            previous = self.last
+            # Filtrar y comparar es Python puro: en un hilo el event loop sigue atendiendo
+            snapshot, growth = await asyncio.to_thread(self._snapshot, previous)
+            if self.baseline is None:
+                self.baseline = snapshot
+            self.last = snapshot
+            self.snapshots += 1
+            current, peak = tracemalloc.get_traced_memory()
+            report = {
+                "at": time.time(),
+                "traced_kib": current // 1024,
+                "peak_kib": peak // 1024,
+                "growth": growth,
+            }
+            self.reports.append(report)
+            return report
+
+    def _snapshot(self, previous):
+        snapshot = tracemalloc.take_snapshot().filter_traces(_FILTERS)
+        growth = self._format(snapshot.compare_to(previous, 'lineno')) if previous is not None else []
+        return snapshot, growth
+
+    def _format(self, stats):
+        return [
+            {"site": _location(stat.traceback[0]), "size_diff_kib": round(stat.size_diff / 1024, 1),
+             "count_diff": stat.count_diff, "size_kib": round(stat.size / 1024, 1)}
+            for stat in stats[:self.top]
+        ]
+
+    def top_sites(self, limit=None):
+        """Líneas que más memoria retienen en la última instantánea"""
+        if self.last is None:
+            return []
+        stats = self.last.statistics('lineno')[:limit or self.top]
+        return [{"site": _location(stat.traceback[0]), "size_kib": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in stats]
+
+    def since_baseline(self, limit=None):
+        """Crecimiento acumulado desde que se activó el rastreo"""
+        if self.baseline is None or self.last is None or self.baseline is self.last:
+            return []
+        return self._format(self.last.compare_to(self.baseline, 'lineno'))[:limit or self.top]
+
+    def traceback(self, site):
+        """Pila completa de la asignación más grande en `archivo:línea` (necesita frames > 1)"""
+        if self.last is None:
+            return []
+        # Los marcos van del más antiguo al más reciente, que es donde se asignó
+        for stat in self.last.statistics('traceback'):
+            if _location(stat.traceback[-1]) == site:
+                return [_location(frame) for frame in stat.traceback]
+        return []
+
+    def snapshot(self):
+        rss_kib = None
+        try:
+            with open('/proc/self/statm') as f:
+                rss_kib = int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+        except (OSError, ValueError, IndexError):
+            pass
+        state = {
+            "tracing": self.tracing,
+            "frames": self.frames,
+            "interval": self.interval,
+            "snapshots": self.snapshots,
+            "rss_kib": rss_kib,
+        }
+        if self.tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            state.update({
+                "started_at": self.started_at,
+                "traced_kib": current // 1024,
+                "peak_kib": peak // 1024,
+                "overhead_kib": tracemalloc.get_tracemalloc_memory() // 1024,
+            })
+        return state
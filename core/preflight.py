@@ -0,0 +1,95 @@
+from collections import Counter
+
+import discord
+
+# Permiso que necesita el bot para cada acción de /moderation-panel
+ACTION_PERMISSIONS = {
+    'ban': 'ban_members',
+    'kick': 'kick_members',
+    'timeout': 'moderate_members',
+    'add_role': 'manage_roles',
+    'remove_role': 'manage_roles',
+    'purge': 'manage_messages',
+}
+
+# Acciones que actúan sobre el miembro: Discord exige estar por encima de él en la jerarquía.
+# En add_role/remove_role solo cuenta la posición del rol, no la del miembro.
+ACTION_VERBS = {
+    'ban': 'ban',
+    'kick': 'kick',
+    'timeout': 'timeout',
+}
+
+# Acciones rechazadas localmente (peticiones a la API que no se llegaron a hacer)
+REJECTED = Counter()
+
+
+class PreflightError(Exception):
+    """La acción no puede salir bien con el estado actual del servidor"""
+
+
+def _outranks(member, target):
+    """True si `member` está por encima de `target` en la jerarquía de roles"""
+    if member.guild.owner_id == member.id:
+        return True
+    return member.top_role > target.top_role
+
+
+def evaluate(action, guild, moderator, target=None, roles=(), channel=None):
+    """Comprueba una acción de moderación contra la caché del servidor.
+
+    Devuelve el motivo (texto para el usuario) si Discord la rechazaría, o
+    None si puede intentarse. Usa siempre la caché viva de discord.py (roles,
+    posiciones, owner y permisos se actualizan con los eventos del gateway),
+    así que no hay estado propio que invalidar. Sin datos suficientes (p. ej.
+    el bot aún no está en caché) no bloquea: decide la API.
+    """
+    me = guild.me
+    if me is None:
+        return None
+
+    permission = ACTION_PERMISSIONS[action]
+    if action == 'purge':
+        if channel is None:
+            return None
+        perms = channel.permissions_for(me)
+        if not (perms.manage_messages and perms.read_message_history):
+            return "I don't have permission to delete messages in this channel."
+        return None
+
+    if not getattr(me.guild_permissions, permission):
+        return f"I need the {permission.replace('_', ' ').title()} permission to do that."
+
+    verb = ACTION_VERBS.get(action)
+    if verb is not None and isinstance(target, discord.Member):
+        if target.id == guild.owner_id:
+            return f"I can't {verb} the server owner."
+        if target.id == me.id:
+            return f"I can't {verb} myself."
+        if not _outranks(me, target):
+            return f"My highest role is not above {target.display_name}'s highest role."
+        if isinstance(moderator, discord.Member) and target.id != moderator.id and not _outranks(moderator, target):
+            return f"Your highest role is not above {target.display_name}'s highest role."
+        if action == 'timeout' and target.guild_permissions.administrator:
+            return "Administrators can't be timed out."
+
+    for role in roles:
+        if role.is_default() or role.managed:
+            return f"{role.name} is managed by Discord or an integration and can't be assigned."
+        if not role.is_assignable():
+            return f"{role.name} is not below my highest role."
+        if isinstance(moderator, discord.Member) and guild.owner_id != moderator.id and role >= moderator.top_role:
+            return f"{role.name} is not below your highest role."
+    return None
+
+
+def check(action, guild, moderator, target=None, roles=(), channel=None):
+    """Como `evaluate`, pero lanza PreflightError y cuenta el rechazo"""
+    reason = evaluate(action, guild, moderator, target=target, roles=roles, channel=channel)
+    if reason is not None:
+        REJECTED[action] += 1
+        raise PreflightError(reason)
+
+
+def snapshot():
+    return {"rejected": dict(REJECTED), "total_rejected": sum(REJECTED.values())}
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import time
+
+from core.guild_config import command_signature
+
+logger = logging.getLogger('bot.reloader')
+
+
+class CogReloader:
+    """Recarga en caliente los cogs de commands/ y scripts/.
+
+    Vigila las fechas de modificación de los ficheros (sin dependencias extra)
+    y recarga solo la extensión que cambió. Los cogs pueden definir
+    `export_state()` e `import_state(state)` para conservar su estado en memoria.
+    Tras recargar solo se sincronizan los ámbitos (global o guild) cuyos
+    comandos cambiaron de firma.
+    """
+
+    def __init__(self, bot, directories=('commands', 'scripts'), interval=2.0):
+        self.bot = bot
+        self.directories = directories
+        self.interval = interval
+        self.history = []
+        self.importing = set()  # extensiones cuya instancia nueva recibirá el estado con import_state
+        self._mtimes = self.scan()
+        self._lock = asyncio.Lock()
+        self._task = None
+
+    def scan(self):
+        """Devuelve {nombre_extension: (ruta, mtime)} de los cogs en disco"""
+        found = {}
+        for directory in self.directories:
+            if not os.path.isdir(directory):
+                continue
+            for filename in os.listdir(directory):
+                if filename.endswith('.py') and filename != '__init__.py':
+                    path = os.path.join(directory, filename)
+                    found[f'{directory}.{filename[:-3]}'] = (path, os.path.getmtime(path))
+        return found
+
+    def changed(self):
+        """Extensiones nuevas o modificadas desde el último escaneo"""
+        current = self.scan()
+        changed = [name for name, (path, mtime) in current.items()
+                   if name not in self._mtimes or self._mtimes[name][1] != mtime]
+        self._mtimes = current
+        return changed
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._watch())
+            logger.info(f"Recarga en caliente activa (cada {self.interval}s en {', '.join(self.directories)})")
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                for name in self.changed():
+                    await self.reload(name)
+            except Exception as e:
+                logger.error(f"Error en la vigilancia de cogs: {e}")
+
+    def command_signatures(self):
+        """Hash de los comandos de aplicación por ámbito (None = global)"""
+        scopes = [None] + self.bot.guild_config.guild_ids()
+        return {guild_id: command_signature(self.bot.tree, guild_id) for guild_id in scopes}
+
+    async def reload(self, name):
+        """Recarga (o carga, si es nueva) una extensión y devuelve un resumen"""
+        async with self._lock:
+            started = time.perf_counter()
+            before = self.command_signatures()
+            result = {"extension": name, "ok": False, "synced": [], "state_restored": []}
+
+            if name in self.bot.extensions:
+                saved = {}
+                for cog in list(self.bot.cogs.values()):
+                    if cog.__module__ == name and hasattr(cog, 'export_state'):
+                        saved[cog.qualified_name] = cog.export_state()
+                # cog_load de la instancia nueva consulta `importing` para no leer
+                # además el estado guardado en disco, que sería más antiguo
+                if saved:
+                    self.importing.add(name)
+                try:
+                    await self.bot.reload_extension(name)
+                    result["ok"] = True
+                except Exception as e:
+                    result["error"] = str(e)
+                    logger.error(f"Error al recargar {name}: {e}")
+                finally:
+                    self.importing.discard(name)
+
+                # Si la recarga falló, discord.py restaura el módulo anterior con
+                # una instancia nueva del cog, así que el estado se restaura igual
+                for cog_name, state in saved.items():
+                    cog = self.bot.get_cog(cog_name)
+                    if cog is not None and hasattr(cog, 'import_state'):
+                        cog.import_state(state)
+                        result["state_restored"].append(cog_name)
+
+                if result["ok"]:
+                    self.bot.failed_cogs.pop(name, None)
+                    self.bot.loaded_cogs.add(name)
+            else:
+                path = name.replace('.', os.sep) + '.py'
+                result["ok"] = await self.bot.load_cog_safely(name, path)
+
+            if result["ok"]:
+                after = self.command_signatures()
+                changed = [guild_id for guild_id in sorted(set(before) | set(after), key=lambda g: g or 0)
+                           if before.get(guild_id) != after.get(guild_id)]
+                result["synced"] = await self.bot.sync_scopes(changed)
+
+            current = self.scan().get(name)
+            if current is not None:
+                self._mtimes[name] = current
+
+            result["seconds"] = round(time.perf_counter() - started, 3)
+            self.history.append(result)
+            del self.history[:-50]
+            logger.info(
+                f"Recarga de {name}: {'ok' if result['ok'] else 'fallida'} en {result['seconds']}s, "
+                f"sincronizado: {result['synced'] or 'nada'}"
+            )
+            return result
@@ -0,0 +1,102 @@
+import asyncio
+import json
+import logging
+import os
+
+logger = logging.getLogger('bot.runtime')
+
+
+def _stdlib_codec():
+    def dumps(obj):
+        return json.dumps(obj, separators=(',', ':'), ensure_ascii=True)
+    return dumps, json.loads
+
+
+def _orjson_codec():
+    import orjson
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+    return dumps, orjson.loads
+
+
+def _msgspec_codec():
+    import msgspec
+    encoder = msgspec.json.Encoder()
+    decoder = msgspec.json.Decoder()
+
+    def dumps(obj):
+        return encoder.encode(obj).decode('utf-8')
+    return dumps, decoder.decode
+
+
+def _ujson_codec():
+    import ujson
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=True)
+    return dumps, ujson.loads
+
+
+# Orden de preferencia: el primero instalado es el que se usa
+JSON_CODECS = {
+    'orjson': _orjson_codec,
+    'msgspec': _msgspec_codec,
+    'ujson': _ujson_codec,
+    'json': _stdlib_codec,
+}
+
+
+def available_codecs():
+    """Devuelve {nombre: (dumps, loads)} de los codecs JSON instalados"""
+    codecs = {}
+    for name, factory in JSON_CODECS.items():
+        try:
+            codecs[name] = factory()
+        except ImportError:
+            continue
+    return codecs
+
+
+def install_json_codec(preferred=None):
+    """Hace que discord.py use el codec JSON más rápido disponible.
+
+    discord.py decodifica cada mensaje del gateway con `utils._from_json` y
+    codifica las peticiones con `utils._to_json`; ambas se buscan en tiempo de
+    llamada, así que basta con reemplazarlas en el módulo.
+    """
+    import discord.utils
+
+    codecs = available_codecs()
+    name = preferred if preferred in codecs else next(iter(codecs))
+    dumps, loads = codecs[name]
+    discord.utils._to_json = dumps
+    discord.utils._from_json = loads
+    return name
+
+
+def install_event_loop():
+    """Instala uvloop como política de event loop si está disponible"""
+    try:
+        import uvloop
+    except ImportError:
+        return 'asyncio'
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    return 'uvloop'
+
+
+def install_fast_runtime():
+    """Activa el modo rápido si FAST_RUNTIME=1; sin las dependencias opcionales
+    (uvloop, orjson/msgspec/ujson) se queda en asyncio y json estándar.
+
+    Debe llamarse antes de `bot.run`, que crea el event loop.
+    """
+    if os.environ.get('FAST_RUNTIME', '0').lower() not in ('1', 'true', 'yes'):
+        return None
+
+    runtime = {
+        "loop": install_event_loop(),
+        "json": install_json_codec(os.environ.get('FAST_JSON_CODEC')),
+    }
+    logger.info(f"Modo rápido: event loop {runtime['loop']}, JSON {runtime['json']}")
+    return runtime
@@ -0,0 +1,223 @@
+import asyncio
+import bisect
+import logging
+import os
+import time
+from collections import deque
+
+logger = logging.getLogger('bot.scheduler')
+
+# Límites superiores (ms) de los cubos del histograma de espera
+WAIT_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Clases en orden de prioridad: (nombre, tamaño máximo de cola, espera máxima antes de adelantar)
+DEFAULT_CLASSES = (
+    ('moderation', 1000, None),
+    ('notify', 500, 2.0),
+    ('history', 50, 5.0),
+)
+
+
+class SchedulerFull(Exception):
+    """La cola de la clase está llena; el trabajo no se ha ejecutado"""
+
+
+class WaitHistogram:
+    __slots__ = ('counts', 'total', 'sum_ms', 'max_ms')
+
+    def __init__(self):
+        self.counts = [0] * (len(WAIT_BUCKETS_MS) + 1)
+        self.total = 0
+        self.sum_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, ms):
+        self.counts[bisect.bisect_left(WAIT_BUCKETS_MS, ms)] += 1
+        self.total += 1
+        self.sum_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, fraction):
+        """Límite superior del cubo que contiene el cuantil (el máximo observado en el último cubo)"""
+        if not self.total:
+            return None
+        target = fraction * self.total
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return WAIT_BUCKETS_MS[index] if index < len(WAIT_BUCKETS_MS) else round(self.max_ms, 1)
+        return round(self.max_ms, 1)
+
+    def snapshot(self):
+        labels = [f"<={limit}ms" for limit in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+        return {
+            "count": self.total,
+            "mean_ms": round(self.sum_ms / self.total, 3) if self.total else None,
+            "max_ms": round(self.max_ms, 3),
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "buckets": {label: count for label, count in zip(labels, self.counts) if count},
+        }
+
+
+class _PriorityClass:
+    __slots__ = ('name', 'max_queue', 'max_wait', 'waiters', 'histogram', 'rejected', 'promoted')
+
+    def __init__(self, name, max_queue, max_wait):
+        self.name = name
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.waiters = deque()  # (enqueued_at, future)
+        self.histogram = WaitHistogram()
+        self.rejected = 0
+        self.promoted = 0
+
+
+class WorkScheduler:
+    """Reparte `concurrency` huecos de trabajo entre clases con prioridad.
+
+    Cada llamada a `run` espera un hueco y ejecuta la corrutina en la propia
+    tarea del que llama. Al liberarse un hueco se lo lleva la clase más
+    prioritaria con trabajo en cola. Contra la inanición, una clase inferior
+    que lleve más de su `max_wait` esperando se adelanta, pero como mucho una
+    vez cada `promote_every` cesiones: con sobrecarga sostenida la prioridad
+    alta sigue llevándose la mayor parte. Las colas están acotadas: si la de
+    una clase está llena, `run` lanza SchedulerFull en lugar de acumular trabajo.
+    """
+
+    def __init__(self, concurrency=8, classes=DEFAULT_CLASSES, promote_every=4, clock=time.monotonic):
+        self.concurrency = concurrency
+        self.promote_every = promote_every
+        self.clock = clock
+        self._since_promotion = 0
+        self.classes = {name: _PriorityClass(name, max_queue, max_wait) for name, max_queue, max_wait in classes}
+        self.order = [self.classes[name] for name, _, _ in classes]
+        self.running = 0
+        self.closed = False
+
+    @classmethod
+    def from_env(cls):
+        """SCHEDULER_CONCURRENCY=0 desactiva el planificador"""
+        concurrency = int(os.environ.get('SCHEDULER_CONCURRENCY', 8))
+        return cls(concurrency) if concurrency > 0 else None
+
+    def queued(self):
+        return sum(len(pclass.waiters) for pclass in self.order)
+
+    async def run(self, class_name, fn, *args, **kwargs):
+        await self.acquire(class_name)
+        try:
+            return await fn(*args, **kwargs)
+        finally:
+            self.release()
+
+    async def acquire(self, class_name):
+        pclass = self.classes[class_name]
+        if self.closed:
+            pclass.rejected += 1
+            raise SchedulerFull(class_name)
+        enqueued_at = self.clock()
+        if self.running < self.concurrency and not self.queued():
+            self.running += 1
+            pclass.histogram.record(0.0)
+            return
+
+        if len(pclass.waiters) >= pclass.max_queue:
+            pclass.rejected += 1
+            raise SchedulerFull(class_name)
+
+        future = asyncio.get_running_loop().create_future()
+        waiter = (enqueued_at, future)
+        pclass.waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Se le había cedido el hueco justo al cancelarse: devolverlo
+                self.release()
+            else:
+                try:
+                    pclass.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            raise
+        pclass.histogram.record((self.clock() - enqueued_at) * 1000)
+
+    def release(self):
+        now = self.clock()
+        while True:
+            pclass = self._next_class(now)
+            if pclass is None:
+                self.running -= 1
+                return
+            _, future = pclass.waiters.popleft()
+            if not future.done():
+                # El hueco pasa directamente al siguiente: `running` no cambia
+                future.set_result(None)
+                return
+
+    async def drain(self, timeout, poll=0.05):
+        """Espera (como mucho `timeout` s) a que acabe lo que está en marcha y en cola.
+
+        Al vencer el plazo deja de aceptar trabajo y devuelve lo que quedaba
+        por clase (más 'running' si algo seguía ejecutándose).
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while (self.running or self.queued()) and loop.time() < deadline:
+            await asyncio.sleep(poll)
+        self.closed = True
+        left = {pclass.name: len(pclass.waiters) for pclass in self.order if pclass.waiters}
+        if self.running:
+            left["running"] = self.running
+        return left
+
+    def _next_class(self, now):
+        first = next((pclass for pclass in self.order if pclass.waiters), None)
+        if first is None:
+            return None
+
+        self._since_promotion += 1
+        if self._since_promotion < self.promote_every:
+            return first
+
+        # Turno de antigüedad: la clase inferior que más tiempo lleva pasada de su límite
+        overdue = None
+        for pclass in self.order:
+            if pclass is first or not pclass.waiters or pclass.max_wait is None:
+                continue
+            waited = now - pclass.waiters[0][0]
+            if waited >= pclass.max_wait and (overdue is None or waited > overdue[0]):
+                overdue = (waited, pclass)
+        if overdue is None:
+            return first
+        self._since_promotion = 0
+        overdue[1].promoted += 1
+        return overdue[1]
+
+    def snapshot(self):
+        return {
+            "concurrency": self.concurrency,
+            "running": self.running,
+            "closed": self.closed,
+            "classes": {
+                pclass.name: {
+                    "queued": len(pclass.waiters),
+                    "max_queue": pclass.max_queue,
+                    "rejected": pclass.rejected,
+                    "promoted": pclass.promoted,
+                    "wait": pclass.histogram.snapshot(),
+                }
+                for pclass in self.order
+            },
+        }
+
+
+async def scheduled(bot, class_name, fn, *args, **kwargs):
+    """Ejecuta `fn` a través de `bot.scheduler` si existe, o directamente si no"""
+    scheduler = getattr(bot, 'scheduler', None)
+    if scheduler is None:
+        return await fn(*args, **kwargs)
+    return await scheduler.run(class_name, fn, *args, **kwargs)
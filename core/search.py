@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import sqlite3
+import time
+
+logger = logging.getLogger('bot.search')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    target_id INTEGER NOT NULL,
+    sender_id INTEGER NOT NULL,
+    direction TEXT NOT NULL,
+    ts REAL NOT NULL,
+    content TEXT NOT NULL,
+    attachments TEXT NOT NULL DEFAULT '[]'
+);
+CREATE INDEX IF NOT EXISTS messages_target_ts ON messages (target_id, ts);
+CREATE INDEX IF NOT EXISTS messages_sender_ts ON messages (sender_id, ts);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    content, content='messages', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+"""
+
+_TERM = re.compile(r'\w+\*?', re.UNICODE)
+
+
+def fts_query(text):
+    """Convierte texto libre en una consulta FTS5 segura (todas las palabras, `pal*` como prefijo)"""
+    terms = []
+    for term in _TERM.findall(text):
+        prefix = term.endswith('*')
+        terms.append('"' + term.rstrip('*') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+class HistoryIndex:
+    """Índice de texto completo del historial de conversaciones (SQLite FTS5).
+
+    Los mensajes se añaden a un búfer y se escriben por lotes, cada
+    `flush_interval` segundos o al llegar a `batch_size`, así que añadir al
+    historial no cuesta una transacción por mensaje. Las búsquedas vacían el
+    búfer antes de consultar, se ordenan por relevancia (bm25) y se ejecutan
+    en un hilo con su propia conexión de solo lectura.
+    """
+
+    def __init__(self, path, flush_interval=1.0, batch_size=500):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.executescript(SCHEMA)
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(messages)')}
+        if 'attachments' not in columns:
+            # Índices creados antes de guardar los adjuntos
+            self.db.execute("ALTER TABLE messages ADD COLUMN attachments TEXT NOT NULL DEFAULT '[]'")
+        self._pending = []
+        self._task = None
+
+    @classmethod
+    def from_env(cls):
+        """HISTORY_INDEX_PATH vacío desactiva el índice"""
+        path = os.environ.get('HISTORY_INDEX_PATH', 'history_index.db')
+        return cls(path) if path else None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.error(f"Error al escribir en el índice de búsqueda: {e}")
+
+    def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.flush()
+        self.db.close()
+
+    def add(self, target_id, sender_id, direction, ts, content, attachments=()):
+        """`ts` en segundos epoch; `attachments`, URLs de los adjuntos (un mensaje puede no tener texto)"""
+        if not content and not attachments:
+            return
+        self._pending.append((target_id, sender_id, direction, ts, content, json.dumps(list(attachments))))
+        if len(self._pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Escribe el búfer; devuelve cuántos mensajes se escribieron"""
+        if not self._pending:
+            return 0
+        rows, self._pending = self._pending, []
+        with self.db:
+            self.db.executemany(
+                'INSERT INTO messages (target_id, sender_id, direction, ts, content, attachments) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                rows
+            )
+        return len(rows)
+
+    def count(self):
+        self.flush()
+        return self.db.execute('SELECT count(*) FROM messages').fetchone()[0]
+
+    async def search(self, text, user_id=None, since=None, until=None, limit=10):
+        """Busca en todas las conversaciones.
+
+        `user_id` filtra por conversación o por remitente; `since`/`until` son
+        datetimes (until exclusivo). Devuelve (resultados, segundos).
+        """
+        started = time.perf_counter()
+        query = fts_query(text)
+        if not query:
+            return [], 0.0
+        # El búfer se vacía en el loop (usa la conexión del loop); la consulta FTS5, en otro hilo
+        self.flush()
+        results = await asyncio.to_thread(self._query, query, user_id, since, until, limit)
+        return results, time.perf_counter() - started
+
+    def _query(self, query, user_id, since, until, limit):
+
+        sql = ["SELECT m.target_id, m.sender_id, m.direction, m.ts,",
+               "snippet(messages_fts, 0, '**', '**', '…', 16)",
+               "FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid",
+               "WHERE messages_fts MATCH ?"]
+        params = [query]
+        if user_id is not None:
+            sql.append("AND (m.target_id = ? OR m.sender_id = ?)")
+            params += [user_id, user_id]
+        if since is not None:
+            sql.append("AND m.ts >= ?")
+            params.append(since.timestamp())
+        if until is not None:
+            sql.append("AND m.ts < ?")
+            params.append(until.timestamp())
+        sql.append("ORDER BY bm25(messages_fts) LIMIT ?")
+        params.append(limit)
+
+        db = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        try:
+            return [
+                {"target_id": row[0], "sender_id": row[1], "direction": row[2], "ts": row[3], "snippet": row[4]}
+                for row in db.execute(' '.join(sql), params)
+            ]
+        finally:
+            db.close()
+
+    def iter_messages(self, target_id=None, batch_size=1000):
+        """Recorre los mensajes en orden cronológico con una conexión propia de solo lectura.
+
+        Se llama desde el event loop (vacía el búfer) y el generador que
+        devuelve puede consumirse en otro hilo: no comparte la conexión del
+        loop y con WAL no bloquea las escrituras.
+        """
+        self.flush()
+        return self._iter_rows(target_id, batch_size)
+
+    def _iter_rows(self, target_id, batch_size):
+        db = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+        try:
+            sql = 'SELECT target_id, sender_id, direction, ts, content, attachments FROM messages'
+            params = ()
+            if target_id is not None:
+                sql += ' WHERE target_id = ?'
+                params = (target_id,)
+            cursor = db.execute(sql + ' ORDER BY id', params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {"target_id": row[0], "sender_id": row[1], "direction": row[2],
+                           "ts": row[3], "content": row[4], "attachments": json.loads(row[5])}
+        finally:
+            db.close()
@@ -0,0 +1,174 @@
+import os
+import time
+from collections import deque
+
+# Clave de ShardStats para los eventos sin servidor (MD y similares)
+NO_GUILD = 'dm'
+
+
+def parse_shard_ids(value):
+    """Convierte una lista tipo "0,1,4-7" en una lista ordenada de IDs de shard"""
+    shard_ids = set()
+    for part in value.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        if '-' in part:
+            start, end = part.split('-', 1)
+            start, end = int(start), int(end)
+            if end < start:
+                raise ValueError(f"Rango de shards inválido: {part}")
+            shard_ids.update(range(start, end + 1))
+        else:
+            shard_ids.add(int(part))
+    return sorted(shard_ids)
+
+
+class ShardConfig:
+    """Configuración de sharding leída de las variables de entorno.
+
+    SHARDING=off (por defecto) mantiene un único shard, SHARDING=auto deja que
+    Discord recomiende el número de shards y SHARDING=manual usa SHARD_COUNT
+    junto con SHARD_IDS (por ejemplo "0-3") para repartir shards entre procesos.
+    """
+
+    def __init__(self, mode='off', shard_count=None, shard_ids=None):
+        self.mode = mode
+        self.shard_count = shard_count
+        self.shard_ids = shard_ids
+
+    @property
+    def enabled(self):
+        return self.mode != 'off'
+
+    @classmethod
+    def from_env(cls):
+        mode = os.environ.get('SHARDING', 'off').lower()
+        if mode not in ('off', 'auto', 'manual'):
+            raise ValueError(f"SHARDING debe ser off, auto o manual (recibido: {mode})")
+
+        shard_count = os.environ.get('SHARD_COUNT')
+        shard_count = int(shard_count) if shard_count else None
+        shard_ids = os.environ.get('SHARD_IDS')
+        shard_ids = parse_shard_ids(shard_ids) if shard_ids else None
+
+        if mode == 'manual':
+            if shard_count is None:
+                raise ValueError("SHARDING=manual requiere SHARD_COUNT")
+            if shard_ids is None:
+                shard_ids = list(range(shard_count))
+            invalid = [shard_id for shard_id in shard_ids if shard_id >= shard_count]
+            if invalid:
+                raise ValueError(f"SHARD_IDS fuera de rango para SHARD_COUNT={shard_count}: {invalid}")
+        elif mode == 'auto':
+            # En modo automático Discord decide cuántos shards usar
+            shard_ids = None
+
+        return cls(mode=mode, shard_count=shard_count, shard_ids=shard_ids)
+
+    def bot_kwargs(self):
+        """Argumentos extra para el constructor del bot"""
+        if not self.enabled:
+            return {}
+        kwargs = {'shard_count': self.shard_count}
+        if self.shard_ids is not None:
+            kwargs['shard_ids'] = self.shard_ids
+        return kwargs
+
+    def describe(self):
+        if not self.enabled:
+            return "sharding desactivado"
+        ids = self.shard_ids if self.shard_ids is not None else "auto"
+        return f"sharding {self.mode} (shard_count={self.shard_count or 'auto'}, shard_ids={ids})"
+
+
+class ShardStats:
+    """Cuenta eventos por shard en ventanas de un segundo.
+
+    Todos los shards comparten el mismo event loop, así que los contadores no
+    necesitan bloqueo. Solo se guardan los últimos `window` segundos.
+    """
+
+    def __init__(self, window=60):
+        self.window = window
+        self.totals = {}
+        self._buckets = {}
+        self.started = time.monotonic()
+
+    def record(self, shard_id):
+        now = int(time.monotonic())
+        self.totals[shard_id] = self.totals.get(shard_id, 0) + 1
+
+        buckets = self._buckets.get(shard_id)
+        if buckets is None:
+            buckets = self._buckets[shard_id] = deque()
+        if buckets and buckets[-1][0] == now:
+            buckets[-1][1] += 1
+        else:
+            buckets.append([now, 1])
+        while buckets and buckets[0][0] <= now - self.window:
+            buckets.popleft()
+
+    def rate(self, shard_id):
+        """Eventos por segundo del shard en la ventana actual"""
+        buckets = self._buckets.get(shard_id)
+        if not buckets:
+            return 0.0
+        now = time.monotonic()
+        cutoff = int(now) - self.window
+        count = sum(n for second, n in buckets if second > cutoff)
+        # Recién arrancado la ventana aún no está llena: dividir por lo transcurrido
+        return count / max(1.0, min(self.window, now - self.started))
+
+
+def event_shard_id(args, shard_count=None):
+    """Deduce el shard que recibió un evento a partir de sus argumentos.
+
+    Discord entrega los eventos de un guild en el shard (guild_id >> 22) % shard_count.
+    Los que no tienen servidor (MD) se cuentan aparte, con la clave NO_GUILD,
+    para no inflar las cifras del shard 0.
+    """
+    for arg in args:
+        guild = arg if isinstance(getattr(arg, 'shard_id', None), int) else getattr(arg, 'guild', None)
+        shard_id = getattr(guild, 'shard_id', None)
+        if shard_id is not None:
+            return shard_id
+        guild_id = getattr(arg, 'guild_id', None)
+        if guild_id and shard_count:
+            return (guild_id >> 22) % shard_count
+    return NO_GUILD
+
+
+def shard_snapshot(bot, stats):
+    """Estado de cada shard para el servidor web"""
+    shards = []
+    shard_map = getattr(bot, 'shards', None)
+    if shard_map:
+        items = sorted(shard_map.items())
+    else:
+        items = [(0, None)]
+
+    guild_counts = {}
+    for guild in bot.guilds:
+        guild_counts[guild.shard_id] = guild_counts.get(guild.shard_id, 0) + 1
+
+    for shard_id, shard in items:
+        latency = shard.latency if shard is not None else bot.latency
+        shards.append({
+            "id": shard_id,
+            "latency_ms": round(latency * 1000, 2) if latency == latency and latency != float('inf') else None,
+            "closed": shard.is_closed() if shard is not None else bot.is_closed(),
+            "guilds": guild_counts.get(shard_id, 0),
+            "events_total": stats.totals.get(shard_id, 0),
+            "events_per_second": round(stats.rate(shard_id), 3),
+        })
+
+    return {
+        "shard_count": bot.shard_count or 1,
+        "shard_ids": [shard["id"] for shard in shards],
+        "shards": shards,
+        "no_guild": {
+            "events_total": stats.totals.get(NO_GUILD, 0),
+            "events_per_second": round(stats.rate(NO_GUILD), 3),
+        },
+    }
@@ -0,0 +1,123 @@
+import asyncio
+import logging
+import signal
+import time
+
+logger = logging.getLogger('bot.shutdown')
+
+# Prefijo que discord.py pone a las tareas de cada evento (on_message, on_reaction_add...)
+EVENT_TASK_PREFIX = 'discord.py: on_'
+
+
+class ShutdownCoordinator:
+    """Parada ordenada: deja de aceptar trabajo, drena lo pendiente dentro de un plazo, guarda y cierra.
+
+    Orden: el bot marca `draining` (readyz pasa a 503, los eventos nuevos y
+    los comandos se rechazan), se entregan los MD retenidos por la limitación,
+    se espera al planificador y a las tareas de eventos en curso (p. ej. el
+    borrado diferido de `handle_rejection`), se guarda el estado de los cogs
+    con `persist_state()`, se vacía el índice del historial y se cierran el
+    servidor web y el bot. Guardar el estado no depende del plazo. El
+    informe final dice qué se drenó y qué se descartó.
+    """
+
+    def __init__(self, bot, deadline=20.0, log_pipeline=None):
+        self.bot = bot
+        self.deadline = deadline
+        self.log_pipeline = log_pipeline
+        self.report = None
+        self._task = None
+
+    def install(self, signals=(signal.SIGTERM, signal.SIGINT)):
+        loop = asyncio.get_running_loop()
+        for sig in signals:
+            try:
+                loop.add_signal_handler(sig, self.request, sig.name)
+            except (NotImplementedError, RuntimeError):
+                # Windows o un hilo que no es el principal: queda el comportamiento por defecto
+                pass
+
+    def request(self, reason='manual'):
+        if self._task is None:
+            logger.warning(f"Parada solicitada ({reason}): drenando durante como mucho {self.deadline}s")
+            self._task = asyncio.create_task(self.run(reason))
+        return self._task
+
+    async def run(self, reason):
+        bot = self.bot
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        deadline = started + self.deadline
+        report = {"reason": reason, "drained": {}, "dropped": {}, "persisted": {}, "errors": {}}
+
+        def remaining():
+            return max(0.0, deadline - loop.time())
+
+        # 1. No aceptar trabajo nuevo
+        bot.draining = True
+        bot.health.refresh()
+
+        # 2. MD retenidos por la limitación (antes que el planificador: se reparten a través de él)
+        for cog in list(bot.cogs.values()):
+            throttle = getattr(cog, 'throttle', None)
+            if throttle is not None and hasattr(throttle, 'drain'):
+                delivered, dropped = await throttle.drain(remaining())
+                report["drained"]["throttled_dms"] = delivered
+                report["dropped"]["throttled_dms"] = dropped
+
+        # 3. Manejadores de eventos en curso (el trabajo planificado se ejecuta dentro de ellos)
+        scheduler = getattr(bot, 'scheduler', None)
+        scheduled_before = scheduler.queued() + scheduler.running if scheduler is not None else 0
+        current = asyncio.current_task()
+        tasks = [task for task in asyncio.all_tasks()
+                 if task is not current and not task.done() and task.get_name().startswith(EVENT_TASK_PREFIX)]
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=remaining())
+            for task in pending:
+                task.cancel()
+            report["drained"]["event_tasks"] = len(done)
+            if pending:
+                report["dropped"]["event_tasks"] = sorted(task.get_name()[len('discord.py: '):] for task in pending)
+
+        # 4. Lo que quede en el planificador; después ya no acepta más
+        if scheduler is not None:
+            left = await scheduler.drain(remaining())
+            report["drained"]["scheduled"] = max(0, scheduled_before - sum(left.values()))
+            if left:
+                report["dropped"]["scheduled"] = left
+
+        # 5. Estado en memoria de los cogs (fuera del plazo: perderlo es peor que tardar)
+        for name, cog in list(bot.cogs.items()):
+            persist = getattr(cog, 'persist_state', None)
+            if persist is None:
+                continue
+            try:
+                report["persisted"][name] = await persist()
+            except Exception as e:
+                report["errors"][name] = str(e)
+                logger.error(f"Error al guardar el estado de {name}: {e}")
+
+        # 6. Índice del historial
+        history_index = getattr(bot, 'history_index', None)
+        if history_index is not None:
+            try:
+                report["persisted"]["history_index"] = history_index.flush()
+            except Exception as e:
+                report["errors"]["history_index"] = str(e)
+
+        # 7. Servidor web y bot
+        runner = getattr(bot, 'web_runner', None)
+        if runner is not None:
+            await runner.cleanup()
+            bot.web_runner = None
+
+        report["refused_events"] = bot.refused_events
+        if self.log_pipeline is not None:
+            report["logs_dropped"] = self.log_pipeline.handler.dropped
+        report["seconds"] = round(loop.time() - started, 3)
+        report["deadline_exceeded"] = loop.time() > deadline
+        report["finished_at"] = time.time()
+        self.report = report
+        logger.warning(f"Parada ordenada completada: {report}")
+        await bot.close()
+        return report
@@ -0,0 +1,291 @@
+import asyncio
+import logging
+import os
+import time
+from collections import Counter, OrderedDict, deque
+
+logger = logging.getLogger('bot.throttle')
+
+
+class TokenBucket:
+    """`rate` tokens por segundo hasta un máximo de `capacity`"""
+
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return self.tokens
+
+    def ready(self, now):
+        return self.refill(now) >= 1
+
+    def consume(self):
+        self.tokens -= 1
+
+    def wait_time(self, now):
+        """Segundos hasta que haya un token"""
+        missing = 1 - self.refill(now)
+        return max(0.0, missing / self.rate) if self.rate > 0 else float('inf')
+
+    @property
+    def full(self):
+        return self.tokens >= self.capacity
+
+
+class InboundThrottle:
+    """Limita los MD entrantes por remitente y en total antes de repartirlos.
+
+    `submit` decide al momento: si hay token del remitente y del presupuesto
+    global el mensaje se reparte ya ('forward'); si no, se encola en una cola
+    corta por remitente ('queued') que una tarea vacía por turnos conforme
+    llegan tokens, o se descarta si la cola está llena ('dropped'). Mientras
+    haya limitación se acumula un resumen por remitente que se entrega de una
+    vez a `on_summary` cada `summary_interval` segundos.
+    """
+
+    def __init__(self, handler, sender_rate=0.5, sender_burst=5, global_rate=10.0, global_burst=30,
+                 sender_queue=5, max_queued=200, summary_interval=60.0, on_summary=None,
+                 max_senders=10000, clock=time.monotonic):
+        self.handler = handler
+        self.sender_rate = sender_rate
+        self.sender_burst = sender_burst
+        self.sender_queue = sender_queue
+        self.max_queued = max_queued
+        self.summary_interval = summary_interval
+        self.on_summary = on_summary
+        self.max_senders = max_senders
+        self.clock = clock
+        self.global_bucket = TokenBucket(global_rate, global_burst, clock())
+        self.buckets = OrderedDict()  # {sender_id: TokenBucket}, del menos al más reciente
+        self.queues = OrderedDict()  # {sender_id: deque}, en orden de turno
+        self.queued = 0
+        self.counters = Counter()
+        self.window = {}  # {sender_id: Counter} desde el último resumen
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._summary_handle = None
+
+    @classmethod
+    def from_env(cls, handler, on_summary=None):
+        """DM_THROTTLE=0 desactiva la limitación"""
+        if os.environ.get('DM_THROTTLE', '1').lower() in ('0', 'false', 'no'):
+            return None
+        env = os.environ.get
+        return cls(
+            handler,
+            sender_rate=float(env('DM_SENDER_RATE', 0.5)),
+            sender_burst=float(env('DM_SENDER_BURST', 5)),
+            global_rate=float(env('DM_GLOBAL_RATE', 10)),
+            global_burst=float(env('DM_GLOBAL_BURST', 30)),
+            sender_queue=int(env('DM_SENDER_QUEUE', 5)),
+            max_queued=int(env('DM_MAX_QUEUED', 200)),
+            summary_interval=float(env('DM_THROTTLE_SUMMARY', 60)),
+            on_summary=on_summary,
+        )
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._drain())
+
+    def stop(self):
+        """Detiene el reparto; devuelve cuántos mensajes quedaban en cola"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self._summary_handle is not None:
+            self._summary_handle.cancel()
+            self._summary_handle = None
+        pending = self.queued
+        self.queues.clear()
+        self.queued = 0
+        if pending:
+            self.counters["dropped"] += pending
+            self.counters["dropped_stopped"] += pending
+        return pending
+
+    def export_queues(self):
+        """Entrega la cola, los cubos y los contadores a otra instancia (recarga en caliente del cog).
+
+        Esta instancia se queda vacía, así que el `stop()` del cog saliente
+        ya no descarta esos mensajes.
+        """
+        state = {"queues": self.queues, "buckets": self.buckets, "counters": self.counters}
+        self.queues = OrderedDict()
+        self.queued = 0
+        return state
+
+    def import_queues(self, state):
+        """Inverso de export_queues: lo heredado va delante de lo que ya hubiera en cola"""
+        queues = state["queues"]
+        for sender_id, queue in self.queues.items():
+            if sender_id in queues:
+                queues[sender_id].extend(queue)
+            else:
+                queues[sender_id] = queue
+        self.queues = queues
+        self.queued = sum(len(queue) for queue in queues.values())
+        now = self.clock()
+        for bucket in state["buckets"].values():
+            # Conservan los tokens, pero con los límites de esta instancia (pueden haber cambiado)
+            bucket.refill(now)
+            bucket.rate = self.sender_rate
+            bucket.capacity = self.sender_burst
+            bucket.tokens = min(bucket.tokens, bucket.capacity)
+        state["buckets"].update(self.buckets)
+        self.buckets = state["buckets"]
+        self.counters = state["counters"] + self.counters
+        if self.queued:
+            self._wakeup.set()
+
+    async def drain(self, timeout):
+        """Entrega lo que queda en cola sin esperar tokens (al apagar), como mucho `timeout` segundos.
+
+        Devuelve (entregados, descartados); lo que no dio tiempo a entregar se descarta.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        delivered = 0
+        while self.queues and loop.time() < deadline:
+            sender_id = next(iter(self.queues))
+            queue = self.queues.pop(sender_id)
+            item = queue.popleft()
+            self.queued -= 1
+            if queue:
+                self.queues[sender_id] = queue
+            try:
+                await asyncio.wait_for(self.handler(item), timeout=max(0.0, deadline - loop.time()))
+                delivered += 1
+            except asyncio.TimeoutError:
+                self.queued += 1  # el que no llegó a entregarse cuenta como descartado
+                break
+            except Exception as e:
+                logger.error(f"Error al reenviar un MD en cola de {sender_id}: {e}")
+        self.counters["released"] += delivered
+        return delivered, self.stop()
+
+    def _bucket(self, sender_id, now):
+        bucket = self.buckets.get(sender_id)
+        if bucket is None:
+            bucket = self.buckets[sender_id] = TokenBucket(self.sender_rate, self.sender_burst, now)
+            self._prune(now)
+        else:
+            self.buckets.move_to_end(sender_id)
+        return bucket
+
+    def _prune(self, now):
+        # Un cubo lleno y sin cola equivale a uno nuevo: se puede olvidar
+        while len(self.buckets) > self.max_senders:
+            sender_id, bucket = next(iter(self.buckets.items()))
+            bucket.refill(now)
+            if sender_id in self.queues or not bucket.full:
+                break
+            del self.buckets[sender_id]
+
+    def submit(self, sender_id, item):
+        now = self.clock()
+        bucket = self._bucket(sender_id, now)
+
+        # Con mensajes ya en cola el nuevo va detrás para conservar el orden
+        if sender_id not in self.queues and bucket.ready(now) and self.global_bucket.ready(now):
+            bucket.consume()
+            self.global_bucket.consume()
+            self.counters["forwarded"] += 1
+            return 'forward'
+
+        reason = 'sender' if not bucket.ready(now) or sender_id in self.queues else 'global'
+        queue = self.queues.get(sender_id)
+        if (queue is None or len(queue) < self.sender_queue) and self.queued < self.max_queued:
+            if queue is None:
+                queue = self.queues[sender_id] = deque()
+            queue.append(item)
+            self.queued += 1
+            self._throttled(sender_id, 'queued', reason)
+            self._wakeup.set()
+            return 'queued'
+
+        self._throttled(sender_id, 'dropped', reason)
+        return 'dropped'
+
+    def _throttled(self, sender_id, outcome, reason):
+        self.counters[outcome] += 1
+        self.counters[f"{outcome}_{reason}"] += 1
+        self.window.setdefault(sender_id, Counter())[outcome] += 1
+        if self._summary_handle is None and self.on_summary is not None:
+            loop = asyncio.get_running_loop()
+            self._summary_handle = loop.call_later(self.summary_interval, self._emit_summary)
+
+    def _emit_summary(self):
+        self._summary_handle = None
+        window, self.window = self.window, {}
+        if window:
+            self.counters["summaries"] += 1
+            asyncio.create_task(self._run_summary(window))
+
+    async def _run_summary(self, window):
+        try:
+            await self.on_summary(window)
+        except Exception as e:
+            logger.error(f"Error al enviar el resumen de limitación: {e}")
+
+    def _next_ready(self, now):
+        """Primer remitente en turno con token disponible, o el tiempo de espera mínimo"""
+        if not self.global_bucket.ready(now):
+            return None, self.global_bucket.wait_time(now)
+        wait = float('inf')
+        for sender_id in self.queues:
+            bucket = self.buckets[sender_id]
+            if bucket.ready(now):
+                return sender_id, 0.0
+            wait = min(wait, bucket.wait_time(now))
+        return None, wait
+
+    async def _drain(self):
+        while True:
+            if not self.queues:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = self.clock()
+            sender_id, wait = self._next_ready(now)
+            if sender_id is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            queue = self.queues.pop(sender_id)
+            item = queue.popleft()
+            self.queued -= 1
+            if queue:
+                # Al final del turno: los demás remitentes van antes
+                self.queues[sender_id] = queue
+            self.buckets[sender_id].consume()
+            self.global_bucket.consume()
+            self.counters["released"] += 1
+            try:
+                await self.handler(item)
+            except Exception as e:
+                logger.error(f"Error al reenviar un MD en cola de {sender_id}: {e}")
+
+    def snapshot(self):
+        return {
+            **self.counters,
+            "queued_now": self.queued,
+            "senders_queued": len(self.queues),
+            "senders_tracked": len(self.buckets),
+            "senders_throttled_window": len(self.window),
+            "global_tokens": round(self.global_bucket.refill(self.clock()), 2),
+        }
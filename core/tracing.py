@@ -0,0 +1,178 @@
+import contextlib
+import contextvars
+import functools
+import time
+from collections import deque
+
+import discord
+from discord import app_commands
+from discord.webhook.async_ import async_context
+
+CURRENT_TRACE = contextvars.ContextVar('bot_trace', default=None)
+
+
+class RollingPercentiles:
+    """Duraciones de los últimos `window` segundos (como mucho `max_samples`)"""
+
+    __slots__ = ('window', 'samples')
+
+    def __init__(self, window=300.0, max_samples=2048):
+        self.window = window
+        self.samples = deque(maxlen=max_samples)  # (monotonic, ms)
+
+    def add(self, ms, now=None):
+        self.samples.append((time.monotonic() if now is None else now, ms))
+
+    def snapshot(self, now=None):
+        cutoff = (time.monotonic() if now is None else now) - self.window
+        values = sorted(ms for at, ms in self.samples if at >= cutoff)
+        if not values:
+            return {"count": 0}
+
+        def pick(fraction):
+            return round(values[min(len(values) - 1, int(fraction * len(values)))], 3)
+        return {
+            "count": len(values),
+            "p50_ms": pick(0.50),
+            "p95_ms": pick(0.95),
+            "p99_ms": pick(0.99),
+            "max_ms": round(values[-1], 3),
+        }
+
+
+class Trace:
+    """Una operación (comando o modal) y el tiempo acumulado en cada etapa"""
+
+    __slots__ = ('tracer', 'name', 'started', 'stages', 'status')
+
+    def __init__(self, tracer, name):
+        self.tracer = tracer
+        self.name = name
+        self.started = time.perf_counter()
+        self.stages = {}
+        self.status = 'ok'
+
+    def add(self, stage, ms):
+        self.stages[stage] = self.stages.get(stage, 0.0) + ms
+
+    @contextlib.contextmanager
+    def stage(self, stage):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, (time.perf_counter() - started) * 1000)
+
+    def finish(self):
+        self.stages['total'] = (time.perf_counter() - self.started) * 1000
+        self.tracer.record(self)
+
+
+class Tracer:
+    """Percentiles móviles por operación y etapa, para /traces.
+
+    Las etapas se miden con `stage(nombre)` desde cualquier punto de la
+    tarea (y de sus subtareas) gracias a CURRENT_TRACE; `instrument` añade
+    'rest' y 'response' a todas las llamadas HTTP e interacciones.
+    """
+
+    def __init__(self, window=300.0, max_samples=2048):
+        self.window = window
+        self.max_samples = max_samples
+        self.stats = {}  # {operación: {etapa: RollingPercentiles}}
+        self.errors = {}
+
+    @contextlib.contextmanager
+    def trace(self, name):
+        trace = Trace(self, name)
+        token = CURRENT_TRACE.set(trace)
+        try:
+            yield trace
+        except BaseException:
+            trace.status = 'error'
+            raise
+        finally:
+            CURRENT_TRACE.reset(token)
+            trace.finish()
+
+    def record(self, trace):
+        now = time.monotonic()
+        stages = self.stats.setdefault(trace.name, {})
+        for stage, ms in trace.stages.items():
+            stats = stages.get(stage)
+            if stats is None:
+                stats = stages[stage] = RollingPercentiles(self.window, self.max_samples)
+            stats.add(ms, now)
+        if trace.status != 'ok':
+            self.errors[trace.name] = self.errors.get(trace.name, 0) + 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {
+            "window_s": self.window,
+            "operations": {
+                name: {
+                    "errors": self.errors.get(name, 0),
+                    "stages": {stage: stats.snapshot(now) for stage, stats in sorted(stages.items())},
+                }
+                for name, stages in sorted(self.stats.items())
+            },
+        }
+
+
+TRACER = Tracer()
+
+
+def stage(name):
+    """Mide una etapa de la traza en curso; sin traza no hace nada"""
+    trace = CURRENT_TRACE.get()
+    return trace.stage(name) if trace is not None else contextlib.nullcontext()
+
+
+def _traced_call(request, stage_name):
+    @functools.wraps(request)
+    async def traced(*args, **kwargs):
+        trace = CURRENT_TRACE.get()
+        if trace is None:
+            return await request(*args, **kwargs)
+        with trace.stage(stage_name):
+            return await request(*args, **kwargs)
+    return traced
+
+
+def instrument(bot):
+    """Atribuye el tiempo de REST ('rest') y de respuestas a interacciones ('response') a la traza en curso.
+
+    Llamar después de que el bot tenga su cliente HTTP (y, en las pruebas,
+    después de instalar las capas falsas).
+    """
+    bot.http.request = _traced_call(bot.http.request, 'rest')
+    adapter = async_context.get()
+    adapter.request = _traced_call(adapter.request, 'response')
+
+
+class TracedCommandTree(app_commands.CommandTree):
+    """Traza cada comando de aplicación desde que llega la interacción hasta que termina"""
+
+    async def _call(self, interaction):
+        if interaction.type is not discord.InteractionType.application_command:
+            return await super()._call(interaction)
+        name = (interaction.data or {}).get('name', 'unknown')
+        with TRACER.trace(f"command:{name}"):
+            await super()._call(interaction)
+
+
+class TracedModal(discord.ui.Modal):
+    """Base de los modales: traza `on_submit` hasta la respuesta final"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        on_submit = cls.__dict__.get('on_submit')
+        if on_submit is None:
+            return
+
+        @functools.wraps(on_submit)
+        async def traced_submit(self, interaction):
+            with TRACER.trace(f"modal:{type(self).__name__}"):
+                await on_submit(self, interaction)
+        cls.on_submit = traced_submit
@@ -1,18 +1,32 @@
+import time
+_startup_started = time.perf_counter()
+
 import discord
 from discord.ext import commands
 import os
 import asyncio
 from aiohttp import web
 from dotenv import load_dotenv
-import base64
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
-from cryptography.hazmat.primitives import padding
-import glob
-import importlib.util
+
+# Antes que nada: el logging, el descifrado y los módulos leen su configuración del entorno al importarse
+load_dotenv()
+
 import sys
+import json
+from core.sharding import ShardConfig, ShardStats, event_shard_id, shard_snapshot
+from core.ipc import StateBus, BusClient, spawn_workers, stop_workers
+from core.reloader import CogReloader
+from core.runtime import install_fast_runtime
+from core.health import HealthMonitor
+from core.attachments import AttachmentCache
+from core.search import HistoryIndex
+from core.scheduler import WorkScheduler
+from core.guild_config import GuildConfig, command_signature
+from core.evidence import EvidenceCache
+from core.shutdown import ShutdownCoordinator
+from core.memory import MemoryDiagnostics, structure_sizes
+from core.tracing import TRACER, TracedCommandTree, instrument
+from core import preflight
 
 # Configurar logging
 import logging
@@ -20,71 +34,64 @@ logging.getLogger('discord').setLevel(logging.ERROR)
 logging.getLogger('discord.http').setLevel(logging.ERROR)
 logging.getLogger('discord.gateway').setLevel(logging.ERROR)
 
+from core.log_pipeline import setup_logging
+
 logger = logging.getLogger('bot')
 logger.setLevel(logging.INFO)
-handler = logging.StreamHandler()
-handler.setFormatter(logging.Formatter('%(asctime)s:%(levelname)s:%(name)s: %(message)s'))
-logger.addHandler(handler)
+# Formatear y escribir en un hilo aparte para no bloquear el event loop
+log_pipeline = setup_logging()
 
-def get_encryption_key():
-    """Obtiene y deriva la clave desde la variable de entorno KEY_CODE"""
-    try:
-        key_code = os.environ.get('KEY_CODE')
-        if not key_code:
-            raise ValueError("KEY_CODE no está definida en las variables de entorno")
-        
-        # Decodifica la clave base64
-        key = base64.urlsafe_b64decode(key_code)
-        
-        if len(key) != 32:
-            salt = b'fixed_salt_for_github'
-            kdf = PBKDF2HMAC(
-                algorithm=hashes.SHA256(),
-                length=32,
-                salt=salt,
-                iterations=100000,
-                backend=default_backend()
-            )
-            key = kdf.derive(key_code.encode())
-        
-        return key
-    except Exception as e:
-        logger.error(f"Error getting encryption key: {e}")
-        return None
+# Tiempos de cada etapa del arranque hasta la conexión al gateway
+startup_stages = {}
+_stage_started = _startup_started
 
-def decrypt_file(encrypted_content, key):
-    """Descifra contenido usando AES-256 en modo CBC"""
-    try:
-        encrypted_data = base64.b64decode(encrypted_content)
-        iv = encrypted_data[:16]
-        ciphertext = encrypted_data[16:]
-        
-        cipher = Cipher(
-            algorithms.AES(key),
-            modes.CBC(iv),
-            backend=default_backend()
-        )
-        decryptor = cipher.decryptor()
-        padded_plaintext = decryptor.update(ciphertext) + decryptor.finalize()
-        
-        unpadder = padding.PKCS7(128).unpadder()
-        plaintext = unpadder.update(padded_plaintext) + unpadder.finalize()
-        
-        return plaintext.decode('utf-8')
-    except Exception as e:
-        logger.error(f"Error decrypting file: {e}")
-        return None
+def mark_stage(name):
+    global _stage_started
+    now = time.perf_counter()
+    startup_stages[name] = round(now - _stage_started, 3)
+    _stage_started = now
+    logger.info(f"Etapa de arranque '{name}': {startup_stages[name]:.3f}s (total {now - _startup_started:.3f}s)")
+
+mark_stage('imports')
+
+ENCRYPTED_MANIFEST = os.environ.get('ENCRYPTED_MANIFEST', 'encrypted.manifest')
+ENCRYPTED_DIRS = os.environ.get('ENCRYPTED_DIRS', '.,commands,scripts').split(',')
+
+def find_encrypted_files():
+    """Lista los *.encrypted del manifiesto o, si no existe, de los directorios de cogs.
+
+    No se recorre el árbol completo: evita entrar en .git, entornos virtuales, etc.
+    """
+    if os.path.exists(ENCRYPTED_MANIFEST):
+        with open(ENCRYPTED_MANIFEST, 'r', encoding='utf-8') as file:
+            entries = [line.strip() for line in file if line.strip() and not line.startswith('#')]
+        return [path for path in entries if os.path.exists(path)]
+
+    encrypted_files = []
+    for directory in ENCRYPTED_DIRS:
+        directory = directory.strip()
+        if not os.path.isdir(directory):
+            continue
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.is_file() and entry.name.endswith('.encrypted'):
+                    encrypted_files.append(os.path.normpath(entry.path))
+    return encrypted_files
 
 def decrypt_scripts():
     """Verifica y desencripta todos los scripts encriptados"""
     decrypted_files = []
     try:
+        encrypted_files = find_encrypted_files()
+        if not encrypted_files:
+            # Camino rápido: sin ficheros no se importa cryptography ni se deriva la clave
+            return decrypted_files
+        logger.info(f"Archivos encriptados encontrados: {encrypted_files}")
+        
+        from core.crypto import get_encryption_key, decrypt_file
         key = get_encryption_key()
         if not key:
             return decrypted_files
-            
-        encrypted_files = glob.glob("**/*.encrypted", recursive=True)
-        logger.info(f"Archivos encriptados encontrados: {encrypted_files}")
         
         for file_path in encrypted_files:
             if file_path == os.path.basename(__file__):
@@ -118,20 +125,78 @@ def decrypt_scripts():
 # Ejecutar desencriptación antes de continuar
 decrypted = decrypt_scripts()
 logger.info(f"Archivos desencriptados: {len(decrypted)}")
+mark_stage('decrypt')
 
-load_dotenv()
+# FAST_RUNTIME=1: uvloop y el codec JSON más rápido instalado, si los hay
+runtime_info = install_fast_runtime()
 
 intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 intents.guilds = True
 
-async def web_server():
+shard_config = ShardConfig.from_env()
+
+# Modo dividido: el gateway reparte los MD entre procesos worker (worker.py)
+PROCESS_WORKERS = int(os.environ.get('PROCESS_WORKERS', 0))
+IPC_SOCKET = os.environ.get('IPC_SOCKET', '/tmp/silentbot-ipc.sock')
+BotBase = commands.AutoShardedBot if shard_config.enabled else commands.Bot
+
+async def web_server(bot):
+    async def throttle_stats(request):
+        # El cog puede recargarse, así que se busca en cada petición
+        throttle = getattr(bot.get_cog('DMForwarding'), 'throttle', None)
+        return web.Response(
+            text=json.dumps(throttle.snapshot() if throttle else {"enabled": False}),
+            content_type='application/json'
+        )
+
     try:
         app = web.Application()
         app.router.add_get('/', lambda request: web.Response(text="Bot is running!"))
+        app.router.add_get('/healthz', bot.health.healthz)
+        app.router.add_get('/readyz', bot.health.readyz)
+        app.router.add_get('/shards', lambda request: web.Response(
+            text=json.dumps(shard_snapshot(bot, bot.shard_stats)),
+            content_type='application/json'
+        ))
+        app.router.add_get('/logging', lambda request: web.Response(
+            text=json.dumps(log_pipeline.stats()),
+            content_type='application/json'
+        ))
+        app.router.add_get('/ipc', lambda request: web.Response(
+            text=json.dumps(bot.ipc_server.snapshot() if bot.ipc_server else {"enabled": False}),
+            content_type='application/json'
+        ))
+        app.router.add_get('/throttle', throttle_stats)
+        app.router.add_get('/traces', lambda request: web.Response(
+            text=json.dumps(TRACER.snapshot()),
+            content_type='application/json'
+        ))
+        app.router.add_get('/preflight', lambda request: web.Response(
+            text=json.dumps(preflight.snapshot()),
+            content_type='application/json'
+        ))
+        app.router.add_get('/scheduler', lambda request: web.Response(
+            text=json.dumps(bot.scheduler.snapshot() if bot.scheduler else {"enabled": False}),
+            content_type='application/json'
+        ))
+        app.router.add_get('/attachments', lambda request: web.Response(
+            text=json.dumps(bot.attachment_cache.snapshot() if bot.attachment_cache else {"enabled": False}),
+            content_type='application/json'
+        ))
+        app.router.add_get('/evidence', lambda request: web.Response(
+            text=json.dumps(bot.evidence.snapshot() if bot.evidence else {"enabled": False}),
+            content_type='application/json'
+        ))
+        app.router.add_get('/guilds', lambda request: web.Response(
+            text=json.dumps(bot.guild_config.snapshot()),
+            content_type='application/json'
+        ))
         runner = web.AppRunner(app)
         await runner.setup()
+        # Se guarda para cerrarlo en la parada ordenada (core/shutdown.py)
+        bot.web_runner = runner
         port = int(os.environ.get('PORT', 10000))
         site = web.TCPSite(runner, host='0.0.0.0', port=port)
         await site.start()
@@ -141,60 +206,185 @@ async def web_server():
         logger.error(f"Error al iniciar el servidor web: {e}")
         return False
 
-class SilentBot(commands.Bot):
+class BotCommandTree(TracedCommandTree):
+    async def interaction_check(self, interaction):
+        # Durante la parada ordenada no se empiezan comandos nuevos
+        if getattr(self.client, 'draining', False):
+            await interaction.response.send_message("The bot is restarting, please try again in a moment.", ephemeral=True)
+            return False
+        return True
+
+class SilentBot(BotBase):
     def __init__(self):
         super().__init__(
             command_prefix='!',
             intents=intents,
-            help_command=None
+            help_command=None,
+            tree_cls=BotCommandTree,
+            **shard_config.bot_kwargs()
         )
         self.loaded_cogs = set()
-        self.cog_guilds = {}
-        self.cog_roles = {}
+        self.shard_stats = ShardStats()
+        self.ipc_server = None
+        self.ipc_bus = None
+        self.worker_processes = []
+        self.reloader = None
+        self.failed_cogs = {}
+        self.sync_status = {}
+        self.sync_done = False
+        self.web_runner = None
+        # Parada ordenada con SIGTERM/SIGINT: drenar, guardar y cerrar dentro de SHUTDOWN_DEADLINE
+        self.draining = False
+        self.refused_events = 0
+        self.shutdown = ShutdownCoordinator(
+            self,
+            deadline=float(os.environ.get('SHUTDOWN_DEADLINE', 20.0)),
+            log_pipeline=log_pipeline
+        )
+        self.health = HealthMonitor(
+            self,
+            max_loop_lag=float(os.environ.get('HEALTH_MAX_LOOP_LAG', 2.0)),
+            gateway_grace=float(os.environ.get('HEALTH_GATEWAY_GRACE', 120.0))
+        )
+        # Adjuntos de los MD guardados en disco por hash (lo comparten los cogs y los workers)
+        self.attachment_cache = AttachmentCache.from_env()
+        # Índice de texto completo del historial de MD (!search)
+        self.history_index = HistoryIndex.from_env()
+        # Prioridad entre cogs: moderación > avisos al owner > historial
+        self.scheduler = WorkScheduler.from_env()
+        # Servidores y roles de los comandos por servidor; los cambios se aplican en caliente
+        self.guild_config = GuildConfig.from_env()
+        self.guild_config.on_change = self.apply_guild_config
+        # Mensajes recientes por canal y archivo de lo borrado en bans, kicks y purges
+        self.evidence = EvidenceCache.from_env()
+        # Instantáneas de tracemalloc para !memory; apagado no cuesta nada
+        self.memory = MemoryDiagnostics.from_env(self)
+        logger.info(f"Configuración de shards: {shard_config.describe()}")
+
+    def dispatch(self, event_name, /, *args, **kwargs):
+        if self.draining and event_name not in ('disconnect', 'shard_disconnect', 'error'):
+            self.refused_events += 1
+            return
+        # Contar eventos por shard para /shards (los eventos socket_* son internos)
+        if not event_name.startswith('socket_'):
+            self.shard_stats.record(event_shard_id(args, self.shard_count))
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def start_ipc(self):
+        self.ipc_server = StateBus(IPC_SOCKET)
+        await self.ipc_server.start()
+        self.worker_processes = spawn_workers(PROCESS_WORKERS, IPC_SOCKET)
+        self.ipc_bus = await BusClient.connect(IPC_SOCKET, role='gateway')
+        logger.info(f"Modo dividido activo con {PROCESS_WORKERS} workers")
+
+    async def close(self):
+        self.health.stop()
+        self.memory.stop()
+        self.guild_config.stop()
+        if self.reloader:
+            self.reloader.stop()
+        if self.worker_processes:
+            await stop_workers(self.worker_processes)
+            self.worker_processes = []
+        if self.ipc_bus:
+            await self.ipc_bus.close()
+        if self.ipc_server:
+            await self.ipc_server.close()
+        if self.attachment_cache:
+            await self.attachment_cache.close()
+        if self.history_index:
+            self.history_index.close()
+        if self.evidence:
+            self.evidence.close()
+        if self.web_runner:
+            await self.web_runner.cleanup()
+            self.web_runner = None
+        await super().close()
     
     async def load_cog_safely(self, cog_name, module_path):
         if cog_name in self.loaded_cogs:
             return False
         
         try:
-            spec = importlib.util.spec_from_file_location(cog_name, module_path)
-            module = importlib.util.module_from_spec(spec)
-            spec.loader.exec_module(module)
-            allowed_guilds = getattr(module, "ALLOWED_GUILDS", None)
-            allowed_roles = getattr(module, "ALLOWED_ROLES", None)
-            self.cog_guilds[cog_name] = allowed_guilds
-            self.cog_roles[cog_name] = allowed_roles
-
             await self.load_extension(cog_name)
             self.loaded_cogs.add(cog_name)
+            self.failed_cogs.pop(cog_name, None)
             logger.info(f"Cog cargado: {cog_name}")
             return True
         except Exception as e:
+            self.failed_cogs[cog_name] = str(e)
             logger.error(f"Error al cargar el cog {cog_name}: {e}")
             return False
     
     async def setup_hook(self):
         # Iniciar el servidor web en segundo plano inmediatamente
-        asyncio.create_task(web_server())
+        self.shutdown.install()
+        self.health.start()
+        if self.memory.autostart:
+            await self.memory.start()
+        instrument(self)
+        if self.history_index:
+            self.history_index.start()
+        asyncio.create_task(web_server(self))
+        
+        # Arrancar el bus IPC antes de los cogs para que lo encuentren
+        if PROCESS_WORKERS > 0:
+            await self.start_ipc()
         
         # Cargar cogs y sincronizar comandos
+        mark_stage('login')
         await self.load_all_cogs()
+        mark_stage('cogs')
         
-        for cog_name, allowed_guilds in self.cog_guilds.items():
-            if allowed_guilds:
-                for guild_id in allowed_guilds:
-                    try:
-                        guild = discord.Object(id=guild_id)
-                        synced = await self.tree.sync(guild=guild)
-                        logger.info(f"Comandos {cog_name} sincronizados en guild {guild_id}: {len(synced)}")
-                    except Exception as e:
-                        logger.error(f"Error al sincronizar {cog_name} para guild {guild_id}: {e}")
-            else:
-                try:
-                    synced = await self.tree.sync()
-                    logger.info(f"Comandos {cog_name} sincronizados globalmente: {len(synced)}")
-                except Exception as e:
-                    logger.error(f"Error al sincronizar {cog_name} global: {e}")
+        # Recarga en caliente: !reload siempre disponible, vigilancia con COG_HOT_RELOAD=1
+        self.reloader = CogReloader(self, interval=float(os.environ.get('COG_RELOAD_INTERVAL', 2.0)))
+        if os.environ.get('COG_HOT_RELOAD', '0').lower() in ('1', 'true', 'yes'):
+            self.reloader.start()
+        
+        # Globales y por servidor, solo los ámbitos cuyos comandos cambiaron desde la última vez.
+        # Los servidores sincronizados que ya no están en el registro se sincronizan vacíos.
+        await self.sync_scopes([None] + self.guild_config.guild_ids() + self.guild_config.stale_synced())
+        self.guild_config.start()
+        self.sync_done = True
+        mark_stage('sync')
+
+    async def sync_scopes(self, scopes, force=False):
+        """Sincroniza los ámbitos (None = global) cuya firma de comandos no es la ya sincronizada"""
+        synced = []
+        for guild_id in scopes:
+            scope = str(guild_id or 'global')
+            signature = command_signature(self.tree, guild_id)
+            if not force and not self.guild_config.needs_sync(scope, signature):
+                self.sync_status[scope] = 'ok'
+                continue
+            try:
+                commands_synced = await self.tree.sync(guild=discord.Object(id=guild_id) if guild_id else None)
+                self.sync_status[scope] = 'ok'
+                synced.append(guild_id or 'global')
+                logger.info(f"Comandos sincronizados en {scope}: {len(commands_synced)}")
+                if guild_id and guild_id not in self.guild_config:
+                    # Servidor quitado del registro: ya no tiene comandos que seguir
+                    self.guild_config.forget_synced(scope)
+                    self.sync_status.pop(scope, None)
+                else:
+                    self.guild_config.mark_synced(scope, signature)
+            except Exception as e:
+                self.sync_status[scope] = str(e)
+                logger.error(f"Error al sincronizar {scope}: {e}")
+        self.guild_config.save_synced()
+        return synced
+
+    async def apply_guild_config(self, changes):
+        """Registra o quita los comandos por servidor y sincroniza solo los servidores afectados.
+
+        Los cambios de roles no tocan los comandos (se comprueban en cada
+        interacción), así que no generan sincronización.
+        """
+        for cog in list(self.cogs.values()):
+            update = getattr(cog, 'guild_commands_changed', None)
+            if update is not None:
+                update(changes["added"], changes["removed"])
+        return await self.sync_scopes(changes["added"] + changes["removed"])
 
     async def load_all_cogs(self):
         # Cargar cogs de la carpeta commands
@@ -218,6 +408,21 @@ class SilentBot(commands.Bot):
             logger.warning("No se encontró el directorio scripts")
 
 bot = SilentBot()
+mark_stage('bot')
+
+@bot.event
+async def on_connect():
+    bot.health.gateway_connected()
+    if 'gateway' not in startup_stages:
+        mark_stage('gateway')
+
+@bot.event
+async def on_resumed():
+    bot.health.gateway_connected()
+
+@bot.event
+async def on_disconnect():
+    bot.health.gateway_disconnected()
 
 @bot.event
 async def on_ready():
@@ -258,6 +463,93 @@ async def on_ready():
         status=status_dict.get(status_type, discord.Status.online)
     )
 
+@bot.event
+async def on_shard_ready(shard_id):
+    logger.info(f"Shard {shard_id} listo")
+
+@bot.event
+async def on_shard_disconnect(shard_id):
+    logger.warning(f"Shard {shard_id} desconectado")
+
+@bot.command(name='reload')
+@commands.is_owner()
+async def reload_cogs(ctx, extension: str = None):
+    # Sin argumento se recargan solo los cogs modificados en disco
+    names = [extension] if extension else bot.reloader.changed()
+    if not names:
+        await ctx.send("No cog changes detected.")
+        return
+
+    for name in names:
+        result = await bot.reloader.reload(name)
+        status = "reloaded" if result["ok"] else f"failed ({result.get('error', 'see logs')})"
+        synced = ", ".join(str(scope) for scope in result["synced"]) or "none"
+        await ctx.send(f"`{name}` {status} in {result['seconds']}s. Synced: {synced}.")
+
+@bot.command(name='guildconfig')
+@commands.is_owner()
+async def guild_config_command(ctx, action: str = 'list', guild_id: int = None, *role_ids: int):
+    # !guildconfig list | add <guild_id> <role_id...> | remove <guild_id>
+    config = bot.guild_config
+    if action == 'list':
+        lines = [f"`{gid}`: {', '.join(f'`{rid}`' for rid in sorted(config.roles(gid))) or 'no roles'}"
+                 for gid in config.guild_ids()]
+        await ctx.send("\n".join(lines)[:2000] if lines else "No guilds configured.")
+        return
+    if guild_id is None or action not in ('add', 'remove'):
+        await ctx.send("Usage: `!guildconfig list`, `!guildconfig add <guild_id> <role_id...>` or `!guildconfig remove <guild_id>`")
+        return
+
+    if action == 'add':
+        changes = await config.set_guild(guild_id, role_ids)
+    else:
+        changes = await config.remove_guild(guild_id)
+    summary = ", ".join(f"{kind}: {len(ids)}" for kind, ids in changes.items() if ids) or "no changes"
+    await ctx.send(f"Guild config updated ({summary}).")
+
+def format_memory_rows(rows, fields):
+    return "\n".join(" ".join(str(row[field]) for field in fields) for row in rows) or "(nothing yet)"
+
+@bot.command(name='memory')
+@commands.is_owner()
+async def memory_command(ctx, action: str = 'status', arg: str = None):
+    # !memory status | start [frames] | stop | snapshot | diff | top | sizes | trace <file:line>
+    memory = bot.memory
+    if action == 'start':
+        await memory.start(frames=int(arg) if arg else None)
+        await ctx.send(f"Tracing allocations with {memory.frames} frame(s).")
+        return
+    if action == 'stop':
+        memory.stop()
+        await ctx.send("Allocation tracing stopped.")
+        return
+    if action == 'sizes':
+        # En el event loop: recorrer los dicts desde otro hilo fallaría si cambian a la vez
+        rows = sorted(structure_sizes(bot).items(), key=lambda item: item[1].get("bytes", 0), reverse=True)
+        text = "\n".join(f"{name}: {size['entries']} entries" + (f", {size['bytes'] // 1024} KiB" if "bytes" in size else "")
+                         for name, size in rows)
+    elif action == 'status':
+        text = "\n".join(f"{key}: {value}" for key, value in memory.snapshot().items())
+    elif not memory.tracing:
+        await ctx.send("Tracing is off. Start it with `!memory start [frames]`.")
+        return
+    elif action == 'snapshot':
+        report = await memory.take()
+        text = f"traced {report['traced_kib']} KiB (peak {report['peak_kib']} KiB), growth since previous:\n"
+        text += format_memory_rows(report["growth"], ("size_diff_kib", "count_diff", "site"))
+    elif action == 'diff':
+        text = "growth since tracing started (KiB, blocks, site):\n"
+        text += format_memory_rows(memory.since_baseline(), ("size_diff_kib", "count_diff", "site"))
+    elif action == 'top':
+        text = "largest allocation sites in the last snapshot (KiB, blocks, site):\n"
+        text += format_memory_rows(memory.top_sites(), ("size_kib", "count", "site"))
+    elif action == 'trace' and arg:
+        text = "\n".join(memory.traceback(arg)) or "No allocations at that site (more frames: `!memory start 10`)."
+    else:
+        await ctx.send("Usage: `!memory status|start [frames]|stop|snapshot|diff|top|sizes|trace <file:line>`")
+        return
+    await ctx.send(f"```\n{text[:1980]}\n```")
+
 @bot.event
 async def on_command_error(ctx, error):
     if isinstance(error, commands.CommandNotFound):
@@ -266,6 +558,9 @@ async def on_command_error(ctx, error):
 
 @bot.tree.error
 async def on_app_command_error(interaction: discord.Interaction, error: discord.app_commands.AppCommandError):
+    if isinstance(error, discord.app_commands.CheckFailure) and interaction.response.is_done():
+        # El check ya respondió con el motivo (permisos o parada en curso)
+        return
     logger.error(f"Error en comando de aplicación: {error}")
     if interaction.response.is_done():
         await interaction.followup.send("An error occurred while executing the command.")
@@ -276,7 +571,9 @@ async def on_app_command_error(interaction: discord.Interaction, error: discord.
 token = os.getenv('DISCORD_TOKEN')
 if token:
     logger.info("Iniciando bot...")
-    bot.run(token)
+    # log_handler=None: discord.py usa el mismo pipeline en lugar de su propio handler
+    bot.run(token, log_handler=None)
 else:
     logger.error("DISCORD_TOKEN no encontrado en las variables de entorno")
+    log_pipeline.stop()
     exit(1)
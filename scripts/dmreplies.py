@@ -1,10 +1,168 @@
 import discord
 from discord.ext import commands
 import asyncio
-from datetime import datetime
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from core.export import FORMATS, iter_history, write_parts
+from core.throttle import InboundThrottle
+from core.scheduler import SchedulerFull, scheduled
+from core.history import HistoryEntry, OUTGOING
+from core.at_rest import open_store
+from core.inbox import DebouncedEditor, Inbox
 
 # Configuration - HARDCODED VALUES
 BOT_OWNER_ID = 842832497044881438  # REPLACE WITH YOUR DISCORD USER ID
+# Export parts stay under Discord's default 10 MB upload limit
+EXPORT_PART_MB = float(os.environ.get('EXPORT_PART_MB', 8))
+# In-memory state saved on graceful shutdown and restored on the next start
+STATE_PATH = os.environ.get('DM_STATE_PATH', 'dm_state.jsonl')
+# Live inbox message: conversations listed, and how long an answered one stays listed
+INBOX_ROWS = int(os.environ.get('DM_INBOX_ROWS', 15))
+INBOX_IDLE_HOURS = float(os.environ.get('DM_INBOX_IDLE_HOURS', 24))
+
+logger = logging.getLogger('bot.dmreplies')
+
+def build_dm_embed(author_name, author_id, content, created_at, attachment_urls, shared=False):
+    """Build the embed used to forward a DM to the owner or a shared helper"""
+    embed = discord.Embed(
+        title=f"📩 DM from {author_name}" + (" (Shared)" if shared else ""),
+        description=content,
+        color=discord.Color.purple() if shared else discord.Color.blue(),
+        timestamp=created_at
+    )
+    embed.set_footer(text=f"User ID: {author_id}")
+    
+    # Add any attachments
+    if attachment_urls:
+        embed.add_field(name="Attachments", value="\n".join(attachment_urls), inline=False)
+    return embed
+
+def build_inbox_embed(inbox, limit=INBOX_ROWS):
+    """Render the owner's inbox: newest conversations first, unread ones on top"""
+    inbox.prune()
+    rows = inbox.rows(limit)
+    lines = []
+    for conversation in rows:
+        marker = "🔵" if conversation.unread else "⚪"
+        unread = f"**{conversation.unread} unread**" if conversation.unread else "answered"
+        lines.append(
+            f"{marker} **{discord.utils.escape_markdown(conversation.name)}** (`{conversation.target_id}`) · "
+            f"{unread} · <t:{conversation.last_ts}:R>\n"
+            f"> {discord.utils.escape_markdown(conversation.preview) or '-'}"
+        )
+    embed = discord.Embed(
+        title="📥 Inbox",
+        description="\n".join(lines)[:4000] or "No active conversations.",
+        color=discord.Color.blurple() if inbox.unread() else discord.Color.light_grey(),
+        timestamp=datetime.now()
+    )
+    hidden = len(inbox.conversations) - len(rows)
+    footer = f"{len(inbox.conversations)} active · {inbox.unread()} unread"
+    if hidden > 0:
+        footer += f" · {hidden} older not shown"
+    embed.set_footer(text=footer)
+    return embed
+
+def dm_payload(message, cached_attachments=()):
+    """Serialize a DM for the worker processes (see worker.py)"""
+    return {
+        "author_id": message.author.id,
+        "author_name": str(message.author),
+        "content": message.content,
+        "created_at": message.created_at.isoformat(),
+        "attachments": [a.url for a in message.attachments],
+        "cached_attachments": [list(entry) for entry in cached_attachments]
+    }
+
+def attachment_files(cache, cached_attachments, limit=10):
+    """Fresh discord.File objects for cached attachments (Discord allows 10 per message)"""
+    if cache is None or not cached_attachments:
+        return []
+    cached_attachments = list(cached_attachments)[-limit:]
+    return cache.files_for([digest for digest, _ in cached_attachments],
+                           [filename for _, filename in cached_attachments])
+
+async def send_with_files(destination, files, **kwargs):
+    """Send with cached attachments, falling back to no files if the upload is rejected (e.g. 413).
+
+    The embeds still carry the attachment links, so the message is delivered either way.
+    """
+    try:
+        return await destination.send(files=files, **kwargs)
+    except discord.Forbidden:
+        raise
+    except discord.HTTPException as e:
+        if not files:
+            raise
+        logger.warning(f"Attachment upload failed ({e.status}), sending without files")
+        return await destination.send(**kwargs)
+
+def write_state(path, authorized_users, pending, history, inbox=None):
+    """Write the cog state as JSON lines (encrypted at rest when enabled); returns counts.
+
+    Safe to run in a thread: each history list is only read up to the length it had when called.
+    """
+    tmp_path = f"{path}.tmp"
+    entries = 0
+    with open_store(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"authorized": {str(k): sorted(v) for k, v in authorized_users.items()}}) + "\n")
+        f.write(json.dumps({"pending": pending}) + "\n")
+        if inbox is not None:
+            f.write(json.dumps({"inbox": inbox}, ensure_ascii=False) + "\n")
+        for target_id, (conversation, length) in history.items():
+            rows = [[e.sender, e.ts, e.direction, e.content, list(e.attachments),
+                     [list(c) for c in e.cached_attachments], e.responder_name]
+                    for e in itertools.islice(conversation, length)]
+            f.write(json.dumps({"history": target_id, "entries": rows}, ensure_ascii=False) + "\n")
+            entries += len(rows)
+    os.replace(tmp_path, path)
+    return {"conversations": len(history), "history_entries": entries,
+            "pending_messages": len(pending), "authorized_targets": len(authorized_users)}
+
+def read_state(path):
+    """Inverse of write_state: (authorized_users, pending, history, inbox)"""
+    authorized, pending, history, inbox = {}, {}, {}, None
+    with open_store(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            record = json.loads(line)
+            if "authorized" in record:
+                authorized = {int(k): set(v) for k, v in record["authorized"].items()}
+            elif "pending" in record:
+                pending = {int(k): v for k, v in record["pending"].items()}
+            elif "inbox" in record:
+                inbox = record["inbox"]
+            elif "history" in record:
+                history[int(record["history"])] = [
+                    HistoryEntry(sender, content, direction=direction, ts=ts, attachments=attachments,
+                                 cached_attachments=cached, responder_name=responder)
+                    for sender, ts, direction, content, attachments, cached, responder in record["entries"]
+                ]
+    return authorized, pending, history, inbox
+
+def owner_only():
+    """Prefix-command check for BOT_OWNER_ID"""
+    return commands.check(lambda ctx: ctx.author.id == BOT_OWNER_ID)
+
+def parse_search_args(text):
+    """Split `words user:<id> from:YYYY-MM-DD to:YYYY-MM-DD` into (query, user_id, since, until)"""
+    words, user_id, since, until = [], None, None, None
+    for token in text.split():
+        key, _, value = token.partition(":")
+        if key == "user" and value.isdigit():
+            user_id = int(value)
+        elif key == "from" and value:
+            since = datetime.strptime(value, "%Y-%m-%d")
+        elif key == "to" and value:
+            # Inclusive: everything up to the end of that day
+            until = datetime.strptime(value, "%Y-%m-%d") + timedelta(days=1)
+        else:
+            words.append(token)
+    return " ".join(words), user_id, since, until
 
 class DMForwarding(commands.Cog):
     def __init__(self, bot):
@@ -14,19 +172,165 @@ class DMForwarding(commands.Cog):
         self.pending_messages = {}  # {message_id: message_info}
         self.pending_invitations = {}  # {invitation_msg_id: invitation_info}
         self.authorized_users = {}  # {target_user_id: set(authorized_user_ids)}
-        self.conversation_history = {}  # {target_user_id: list(messages)}
+        self.conversation_history = {}  # {target_user_id: list(HistoryEntry)}
+        self.restored_pending = {}  # {message_id: {"type", "target_user_id"}} saved by the last shutdown
+        # One owner message listing active conversations, edited at most DM_INBOX_EDITS_PER_MINUTE times
+        self.inbox = Inbox(idle=INBOX_IDLE_HOURS * 3600)
+        self.inbox_editor = DebouncedEditor.from_env(self.publish_inbox)
+        # With sharding, events from already-ready shards can arrive before on_ready
+        self._owner_lock = asyncio.Lock()
+        # Debounced edits and !inbox re-posts must not run at once, or both could post a message
+        self._inbox_lock = asyncio.Lock()
+        # Per-sender and global budgets for inbound DMs (DM_THROTTLE=0 disables)
+        self.throttle = InboundThrottle.from_env(self.dispatch_forward,
+                                                 on_summary=self.send_throttle_summary)
+
+    async def cog_load(self):
+        if self.throttle is not None:
+            self.throttle.start()
+        await self.restore_state()
+
+    async def persist_state(self):
+        """Save authorized users, pending replies and history for the next start (see core/shutdown.py)"""
+        # Last inbox edit first, so the saved message id is the one the owner sees
+        await self.flush_inbox()
+        pending = {
+            str(message_id): {"type": info["type"], "target_user_id": info["target_user"].id}
+            for message_id, info in self.pending_messages.items() if info.get("target_user") is not None
+        }
+        pending.update({str(k): v for k, v in self.restored_pending.items() if str(k) not in pending})
+        history = {target_id: (conversation, len(conversation))
+                   for target_id, conversation in self.conversation_history.items()}
+        return await asyncio.to_thread(write_state, STATE_PATH, dict(self.authorized_users), pending, history,
+                                       self.inbox.to_dict())
+
+    async def restore_state(self):
+        # Only on a cold start: a hot reload carries newer state through import_state instead
+        reloader = getattr(self.bot, "reloader", None)
+        if reloader is not None and self.__module__ in reloader.importing:
+            return
+        if not os.path.exists(STATE_PATH):
+            return
+        try:
+            authorized, pending, history, inbox = await asyncio.to_thread(read_state, STATE_PATH)
+        except Exception as e:
+            logger.error(f"Could not restore DM state from {STATE_PATH}: {e}")
+            return
+        self.authorized_users.update(authorized)
+        self.restored_pending.update(pending)
+        for target_id, entries in history.items():
+            self.conversation_history[target_id] = entries + self.conversation_history.get(target_id, [])
+        if inbox is not None and not self.inbox.conversations:
+            self.inbox.load(inbox)
+            self.inbox_changed()
+        # The file stays: if the process dies before the next persist_state, it is still there
+        await self.publish_all_authorized_users()
+        logger.info(f"Restored DM state: {len(history)} conversation(s), {len(pending)} pending message(s)")
+
+    async def cog_unload(self):
+        if self.throttle is not None:
+            dropped = self.throttle.stop()
+            if dropped:
+                logger.warning(f"Discarded {dropped} queued DM(s) on unload")
+        if self.inbox_editor is not None:
+            # Let the owner see the last changes; the inbox itself moves to the new instance
+            await self.flush_inbox()
+            self.inbox_editor.stop()
+
+    def export_state(self):
+        """State carried across a hot reload (see core/reloader.py)"""
+        return {
+            "owner": self.owner,
+            "pending_messages": self.pending_messages,
+            "pending_invitations": self.pending_invitations,
+            "authorized_users": self.authorized_users,
+            "conversation_history": self.conversation_history,
+            "restored_pending": self.restored_pending,
+            "inbox": self.inbox,
+            # Queued DMs move to the new instance instead of being dropped by cog_unload
+            "throttle": self.throttle.export_queues() if self.throttle is not None else None
+        }
+
+    def import_state(self, state):
+        state = dict(state)
+        throttled = state.pop("throttle", None)
+        for name, value in state.items():
+            setattr(self, name, value)
+        if throttled is not None:
+            if self.throttle is not None:
+                self.throttle.import_queues(throttled)
+            else:
+                # Throttling was switched off: forward what was waiting right away
+                for queue in throttled["queues"].values():
+                    for message in queue:
+                        asyncio.create_task(self.dispatch_forward(message))
+        # State exported by an older version of this cog still holds dict entries
+        for history in self.conversation_history.values():
+            history[:] = [HistoryEntry.from_dict(entry) if isinstance(entry, dict) else entry
+                          for entry in history]
+        asyncio.create_task(self.publish_all_authorized_users())
+        self.inbox_changed()
+
+    def inbox_changed(self):
+        if self.inbox_editor is not None:
+            self.inbox_editor.touch()
+
+    async def flush_inbox(self):
+        if self.inbox_editor is None:
+            return
+        try:
+            await self.inbox_editor.flush()
+        except Exception as e:
+            logger.error(f"Could not update the inbox: {e}")
+
+    async def publish_inbox(self):
+        """Edit the inbox message in place, or post it if there is none yet"""
+        scheduler = getattr(self.bot, "scheduler", None)
+        if scheduler is not None and scheduler.closed:
+            # Shutting down: the scheduler was drained and takes no more work, but the last edit still matters
+            await self.edit_inbox_message()
+            return
+        await scheduled(self.bot, "notify", self.edit_inbox_message)
+
+    async def edit_inbox_message(self, repost=False):
+        async with self._inbox_lock:
+            owner = await self.ensure_owner()
+            embed = build_inbox_embed(self.inbox)
+            channel = owner.dm_channel or await owner.create_dm()
+            if self.inbox.message_id is not None:
+                message = channel.get_partial_message(self.inbox.message_id)
+                try:
+                    if not repost:
+                        await message.edit(embed=embed)
+                        return
+                    await message.delete()
+                except discord.NotFound:
+                    pass
+            self.inbox.message_id = (await channel.send(embed=embed)).id
+
+    async def ensure_owner(self):
+        """Fetch the owner once, no matter which shard asks first"""
+        if self.owner is not None:
+            return self.owner
+        async with self._owner_lock:
+            if self.owner is None:
+                self.owner = await self.bot.fetch_user(BOT_OWNER_ID)
+        return self.owner
 
     @commands.Cog.listener()
     async def on_ready(self):
-        print(f'{self.bot.user} has connected to Discord!')
+        logger.info(f'{self.bot.user} has connected to Discord!')
         # Get the owner user object
-        self.owner = await self.bot.fetch_user(BOT_OWNER_ID)
+        await self.ensure_owner()
 
     @commands.Cog.listener()
     async def on_message(self, message):
         # Ignore messages from the bot itself
         if message.author == self.bot.user:
             return
+
+        if isinstance(message.channel, discord.DMChannel):
+            await self.ensure_owner()
             
         # Handle DMs to the bot (global, from any user)
         if isinstance(message.channel, discord.DMChannel) and message.author != self.owner:
@@ -34,8 +338,10 @@ class DMForwarding(commands.Cog):
             if message.content.startswith(self.bot.command_prefix):
                 return
                 
-            # Forward the DM to the owner and authorized users
-            await self.forward_message_to_authorized_users(message)
+            # Forward the DM to the owner and authorized users, unless the sender
+            # or the global budget is exhausted (then it is queued or dropped)
+            if self.throttle is None or self.throttle.submit(message.author.id, message) == "forward":
+                await self.dispatch_forward(message)
                 
         # Handle replies from authorized users
         elif (isinstance(message.channel, discord.DMChannel) and 
@@ -45,39 +351,43 @@ class DMForwarding(commands.Cog):
             # Check if the message is a reply to a forwarded message
             await self.handle_authorized_user_reply(message)
 
-    async def forward_message_to_authorized_users(self, message):
-        """Forward a message to all authorized users for a conversation"""
+    async def dispatch_forward(self, message):
+        """Forward through the shared scheduler, behind any pending moderation actions"""
+        # Downloads can take up to the cache timeout, so they don't hold a scheduler slot
+        cached_attachments = await self.cache_attachments(message)
+        try:
+            await scheduled(self.bot, "notify", self.forward_message_to_authorized_users, message, cached_attachments)
+        except SchedulerFull:
+            logger.warning(f"Scheduler queue full, DM from {message.author.id} not forwarded")
+
+    async def forward_message_to_authorized_users(self, message, cached_attachments):
+        """Forward a message (attachments already cached by dispatch_forward) to all authorized users"""
         target_user = message.author
         
-        # Create an embed with the user's message
-        embed = discord.Embed(
-            title=f"📩 DM from {message.author}",
-            description=message.content,
-            color=discord.Color.blue(),
-            timestamp=message.created_at
-        )
-        embed.set_footer(text=f"User ID: {message.author.id}")
-        
-        # Add any attachments
-        if message.attachments:
-            attachment_urls = "\n".join([attachment.url for attachment in message.attachments])
-            embed.add_field(name="Attachments", value=attachment_urls, inline=False)
+        attachment_urls = [attachment.url for attachment in message.attachments]
         
         # Store in conversation history
-        if target_user.id not in self.conversation_history:
-            self.conversation_history[target_user.id] = []
+        self.record_history(target_user.id, HistoryEntry(
+            target_user.id, message.content,
+            attachments=attachment_urls,
+            cached_attachments=cached_attachments
+        ))
+        self.inbox.incoming(target_user.id, target_user.name, message.content)
+        self.inbox_changed()
+        
+        bus = getattr(self.bot, "ipc_bus", None)
+        if bus is not None:
+            # Split mode: a worker process does the fan-out and records the routing
+            await bus.publish("dm", target_user.id, dm_payload(message, cached_attachments))
+            return
         
-        self.conversation_history[target_user.id].append({
-            "sender": target_user.id,
-            "content": message.content,
-            "timestamp": datetime.now(),
-            "attachments": [a.url for a in message.attachments],
-            "type": "incoming"
-        })
+        # Create an embed with the user's message
+        embed = build_dm_embed(message.author, message.author.id, message.content,
+                               message.created_at, attachment_urls)
         
         # Send to owner with different color for authorized users
         try:
-            owner_msg = await self.owner.send(embed=embed)
+            owner_msg = await send_with_files(self.owner, self.cached_files(cached_attachments), embed=embed)
             await owner_msg.add_reaction("👥")  # Manage users
             await owner_msg.add_reaction("❌")  # Reject
             
@@ -88,7 +398,7 @@ class DMForwarding(commands.Cog):
                 "confirmation_message": None
             }
         except discord.Forbidden:
-            print("Error: Cannot send messages to the owner. The owner might have DMs disabled.")
+            logger.error("Cannot send messages to the owner. The owner might have DMs disabled.")
         
         # Send to authorized users for this conversation with different color
         if target_user.id in self.authorized_users:
@@ -97,19 +407,10 @@ class DMForwarding(commands.Cog):
                     user = await self.bot.fetch_user(user_id)
                     
                     # Create a different colored embed for authorized users
-                    auth_embed = discord.Embed(
-                        title=f"📩 DM from {message.author} (Shared)",
-                        description=message.content,
-                        color=discord.Color.purple(),  # Different color
-                        timestamp=message.created_at
-                    )
-                    auth_embed.set_footer(text=f"User ID: {message.author.id}")
+                    auth_embed = build_dm_embed(message.author, message.author.id, message.content,
+                                                message.created_at, attachment_urls, shared=True)
                     
-                    if message.attachments:
-                        attachment_urls = "\n".join([attachment.url for attachment in message.attachments])
-                        auth_embed.add_field(name="Attachments", value=attachment_urls, inline=False)
-                    
-                    user_msg = await user.send(embed=auth_embed)
+                    user_msg = await send_with_files(user, self.cached_files(cached_attachments), embed=auth_embed)
                     
                     self.pending_messages[user_msg.id] = {
                         "type": "forwarded_message",
@@ -117,15 +418,93 @@ class DMForwarding(commands.Cog):
                         "responder": user
                     }
                 except discord.Forbidden:
-                    print(f"Error: Cannot send messages to user {user_id}.")
+                    logger.error(f"Cannot send messages to user {user_id}.")
+
+    def record_history(self, target_user_id, entry):
+        """Append to a conversation's history and to the search index"""
+        self.conversation_history.setdefault(target_user_id, []).append(entry)
+        index = getattr(self.bot, "history_index", None)
+        if index is not None:
+            index.add(target_user_id, entry.sender, entry.direction, entry.ts, entry.content, entry.attachments)
+
+    async def cache_attachments(self, message):
+        """Download a DM's attachments into the local cache, returning (digest, filename) pairs"""
+        cache = getattr(self.bot, "attachment_cache", None)
+        if cache is None or not message.attachments:
+            return []
+        digests = await asyncio.gather(*(cache.store_attachment(a) for a in message.attachments))
+        return [(digest, attachment.filename)
+                for digest, attachment in zip(digests, message.attachments) if digest]
+
+    def cached_files(self, cached_attachments):
+        # discord.File objects are consumed by each send, so build new ones every time
+        return attachment_files(getattr(self.bot, "attachment_cache", None), cached_attachments)
+
+    def history_files(self, messages):
+        """Cached attachments of a slice of conversation history, newest last"""
+        cached = [entry for msg in messages for entry in msg.cached_attachments]
+        return self.cached_files(cached)
+
+    async def send_throttle_summary(self, window):
+        """One notice per interval instead of one message per throttled DM"""
+        owner = await self.ensure_owner()
+        summary_embed = discord.Embed(
+            title="🚦 Inbound DMs throttled",
+            description=f"{len(window)} sender(s) exceeded the DM rate limit.",
+            color=discord.Color.orange(),
+            timestamp=datetime.now()
+        )
+        worst = sorted(window.items(), key=lambda item: -sum(item[1].values()))
+        for sender_id, counts in worst[:10]:
+            sender = self.bot.get_user(sender_id)
+            summary_embed.add_field(
+                name=sender.name if sender else f"User {sender_id}",
+                value=f"{counts['queued']} delayed, {counts['dropped']} dropped",
+                inline=False
+            )
+        if len(worst) > 10:
+            summary_embed.set_footer(text=f"And {len(worst) - 10} more")
+        await owner.send(embed=summary_embed)
+
+    async def get_pending(self, message_id):
+        """Look up a tracked message, including ones forwarded by worker processes"""
+        message_info = self.pending_messages.get(message_id)
+        bus = getattr(self.bot, "ipc_bus", None)
+        if message_info is None:
+            # Forwarded by a worker process, or before the last restart
+            shared = bus.get("pending", message_id) if bus is not None else None
+            if shared is not None:
+                # Adopted here (and saved by persist_state from now on), so the bus can forget it
+                await bus.delete("pending", message_id)
+            else:
+                shared = self.restored_pending.pop(message_id, None)
+            if shared is not None:
+                target_user = await self.bot.fetch_user(shared["target_user_id"])
+                message_info = {
+                    "type": shared["type"],
+                    "target_user": target_user,
+                    "confirmation_message": None
+                }
+                self.pending_messages[message_id] = message_info
+        return message_info
+
+    async def publish_authorized_users(self, target_user_id):
+        """Share the authorized users of a conversation with the worker processes"""
+        bus = getattr(self.bot, "ipc_bus", None)
+        if bus is not None:
+            await bus.set("authorized", target_user_id, sorted(self.authorized_users.get(target_user_id, set())))
+
+    async def publish_all_authorized_users(self):
+        """Workers answer replies from authorized users too, so they need every list this instance holds"""
+        for target_user_id in list(self.authorized_users):
+            await self.publish_authorized_users(target_user_id)
 
     async def handle_authorized_user_reply(self, message):
         """Handle replies from authorized users to forwarded messages"""
         original_msg_id = message.reference.message_id
+        message_info = await self.get_pending(original_msg_id)
         
-        if original_msg_id in self.pending_messages:
-            message_info = self.pending_messages[original_msg_id]
-            
+        if message_info is not None:
             if message_info["type"] == "forwarded_message":
                 target_user = message_info["target_user"]
                 responder = message.author
@@ -157,16 +536,13 @@ class DMForwarding(commands.Cog):
                         await self.owner.send(embed=owner_notification)
                     
                     # Store in conversation history
-                    if target_user.id not in self.conversation_history:
-                        self.conversation_history[target_user.id] = []
-                    
-                    self.conversation_history[target_user.id].append({
-                        "sender": responder.id,
-                        "content": message.content,
-                        "timestamp": datetime.now(),
-                        "responder_name": responder.name,
-                        "type": "outgoing"
-                    })
+                    self.record_history(target_user.id, HistoryEntry(
+                        responder.id, message.content,
+                        direction=OUTGOING,
+                        responder_name=responder.name
+                    ))
+                    self.inbox.replied(target_user.id, target_user.name)
+                    self.inbox_changed()
                     
                 except discord.Forbidden:
                     await message.channel.send("I don't have permission to DM this user.")
@@ -216,7 +592,7 @@ class DMForwarding(commands.Cog):
                 # User rejects invitation
                 await invited_user.send("You have declined the invitation to join the conversation.")
                 await reaction.message.delete()
-                del self.pending_invitations[reaction.message.id]
+                self.pending_invitations.pop(reaction.message.id, None)
 
     async def handle_rejection(self, reaction, target_user, message_info):
         """Handle message rejection by owner"""
@@ -237,8 +613,13 @@ class DMForwarding(commands.Cog):
         except:
             pass
         
-        # Remove from pending messages
-        del self.pending_messages[reaction.message.id]
+        # Remove from pending messages (another shard may have handled it already)
+        self.pending_messages.pop(reaction.message.id, None)
+        if self.inbox.mark_read(target_user.id):
+            self.inbox_changed()
+        bus = getattr(self.bot, "ipc_bus", None)
+        if bus is not None:
+            await bus.delete("pending", reaction.message.id)
 
     async def show_user_management(self, reaction, target_user):
         """Show user management options for a conversation"""
@@ -358,6 +739,7 @@ class DMForwarding(commands.Cog):
             # Remove from authorized users
             if target_user.id in self.authorized_users and user_id_to_remove in self.authorized_users[target_user.id]:
                 self.authorized_users[target_user.id].remove(user_id_to_remove)
+                await self.publish_authorized_users(target_user.id)
                 
                 # Get the user object for the removed user
                 removed_user = await self.bot.fetch_user(user_id_to_remove)
@@ -446,6 +828,8 @@ class DMForwarding(commands.Cog):
     async def show_conversation_history(self, target_user):
         """Show conversation history for a user"""
         history = self.conversation_history.get(target_user.id, [])
+        if self.inbox.mark_read(target_user.id):
+            self.inbox_changed()
         
         if not history:
             no_history_embed = discord.Embed(
@@ -468,24 +852,24 @@ class DMForwarding(commands.Cog):
         recent_messages = history[-10:]
         for msg in recent_messages:
             try:
-                sender = await self.bot.fetch_user(msg["sender"])
+                sender = await self.bot.fetch_user(msg.sender)
                 sender_name = sender.name
             except:
-                sender_name = f"User {msg['sender']}"
+                sender_name = f"User {msg.sender}"
             
             # Format timestamp
-            time_str = msg["timestamp"].strftime("%Y-%m-%d %H:%M")
+            time_str = msg.timestamp.strftime("%Y-%m-%d %H:%M")
             
             # Determine message direction
-            direction = "➡️" if msg.get("type") == "outgoing" else "⬅️"
+            direction = "➡️" if msg.outgoing else "⬅️"
             
             history_embed.add_field(
                 name=f"{direction} {sender_name} ({time_str})",
-                value=msg["content"][:500] + ("..." if len(msg["content"]) > 500 else ""),
+                value=msg.content[:500] + ("..." if len(msg.content) > 500 else ""),
                 inline=False
             )
         
-        await self.owner.send(embed=history_embed)
+        await send_with_files(self.owner, self.history_files(recent_messages), embed=history_embed)
 
     async def accept_invitation(self, invitation_info, reaction):
         """Handle invitation acceptance"""
@@ -496,6 +880,7 @@ class DMForwarding(commands.Cog):
         if target_user.id not in self.authorized_users:
             self.authorized_users[target_user.id] = set()
         self.authorized_users[target_user.id].add(invited_user.id)
+        await self.publish_authorized_users(target_user.id)
         
         # Send conversation history if available
         if target_user.id in self.conversation_history:
@@ -510,21 +895,21 @@ class DMForwarding(commands.Cog):
             recent_messages = self.conversation_history[target_user.id][-5:]
             for i, msg in enumerate(recent_messages):
                 try:
-                    sender = await self.bot.fetch_user(msg["sender"])
+                    sender = await self.bot.fetch_user(msg.sender)
                     sender_name = sender.name
                 except:
-                    sender_name = f"User {msg['sender']}"
+                    sender_name = f"User {msg.sender}"
                 
                 # Determine message direction
-                direction = "➡️" if msg.get("type") == "outgoing" else "⬅️"
+                direction = "➡️" if msg.outgoing else "⬅️"
                 
                 history_embed.add_field(
-                    name=f"{direction} {sender_name} ({msg['timestamp'].strftime('%H:%M')})",
-                    value=msg["content"][:100] + ("..." if len(msg["content"]) > 100 else ""),
+                    name=f"{direction} {sender_name} ({msg.timestamp.strftime('%H:%M')})",
+                    value=msg.content[:100] + ("..." if len(msg.content) > 100 else ""),
                     inline=False
                 )
             
-            await invited_user.send(embed=history_embed)
+            await send_with_files(invited_user, self.history_files(recent_messages), embed=history_embed)
         
         # Send success messages
         success_embed = discord.Embed(
@@ -569,9 +954,8 @@ class DMForwarding(commands.Cog):
             return
             
         # Handle reactions on forwarded messages
-        if reaction.message.id in self.pending_messages:
-            message_info = self.pending_messages[reaction.message.id]
-            
+        message_info = await self.get_pending(reaction.message.id)
+        if message_info is not None:
             if message_info["type"] == "forwarded_message":
                 await self.handle_forwarded_message_reaction(reaction, user, message_info)
             elif message_info["type"] == "user_management" and user.id == BOT_OWNER_ID:
@@ -592,11 +976,113 @@ class DMForwarding(commands.Cog):
             # Remove a user
             await self.show_remove_user_options(target_user)
         elif str(reaction.emoji) == "📜":
-            # Show conversation history
-            await self.show_conversation_history(target_user)
+            # Show conversation history (lowest priority: it can wait behind moderation and DMs)
+            try:
+                await scheduled(self.bot, "history", self.show_conversation_history, target_user)
+            except SchedulerFull:
+                await self.owner.send("The bot is busy right now. Please try again in a moment.")
         elif str(reaction.emoji) == "❌":
             # Close the management menu
             await reaction.message.delete()
 
+    @commands.command(name="search")
+    @owner_only()
+    async def search_history(self, ctx, *, text: str = ""):
+        """Search all conversations: !search <words> [user:<id>] [from:YYYY-MM-DD] [to:YYYY-MM-DD]"""
+        index = getattr(self.bot, "history_index", None)
+        if index is None:
+            await ctx.send("Search is disabled (HISTORY_INDEX_PATH is empty).")
+            return
+        
+        try:
+            query, user_id, since, until = parse_search_args(text)
+        except ValueError:
+            await ctx.send("Invalid date. Use YYYY-MM-DD.")
+            return
+        if not query:
+            await ctx.send("Usage: `!search <words> [user:<id>] [from:YYYY-MM-DD] [to:YYYY-MM-DD]`")
+            return
+        
+        results, seconds = await index.search(query, user_id=user_id, since=since, until=until)
+        
+        results_embed = discord.Embed(
+            title=f"🔎 Search: {query}",
+            description=f"{len(results)} result(s) in {seconds * 1000:.1f} ms" if results else "No messages found.",
+            color=discord.Color.blue(),
+            timestamp=datetime.now()
+        )
+        for result in results:
+            target = self.bot.get_user(result["target_id"])
+            target_name = target.name if target else f"User {result['target_id']}"
+            direction = "➡️" if result["direction"] == "outgoing" else "⬅️"
+            time_str = datetime.fromtimestamp(result["ts"]).strftime("%Y-%m-%d %H:%M")
+            results_embed.add_field(
+                name=f"{direction} {target_name} ({time_str})",
+                value=result["snippet"][:1000],
+                inline=False
+            )
+        
+        await ctx.send(embed=results_embed)
+
+    @commands.command(name="inbox")
+    @owner_only()
+    async def inbox_command(self, ctx, action: str = "show", target: str = None):
+        """Live inbox: !inbox (re-post it at the bottom) | !inbox read [user_id]"""
+        if action == "read":
+            if target is not None and not target.isdigit():
+                await ctx.send("Usage: `!inbox read [user_id]`")
+                return
+            self.inbox.mark_read(int(target) if target else None)
+            self.inbox_changed()
+            await ctx.message.add_reaction("✅")
+        elif action == "show":
+            try:
+                await scheduled(self.bot, "notify", self.edit_inbox_message, repost=True)
+            except SchedulerFull:
+                await ctx.send("The bot is busy right now. Please try again in a moment.")
+        else:
+            await ctx.send("Usage: `!inbox` or `!inbox read [user_id]`")
+
+    async def upload_file(self, ctx, path):
+        await ctx.send(file=discord.File(path))
+
+    @commands.command(name="export")
+    @owner_only()
+    async def export_history(self, ctx, scope: str = "all", fmt: str = "jsonl"):
+        """Export conversations as gzipped JSONL/CSV: !export [user_id|all] [jsonl|csv]"""
+        fmt = fmt.lower()
+        if fmt not in FORMATS or not (scope == "all" or scope.isdigit()):
+            await ctx.send("Usage: `!export [user_id|all] [jsonl|csv]`")
+            return
+        target_id = None if scope == "all" else int(scope)
+        
+        # Stream from the SQLite index when enabled; otherwise from memory
+        index = getattr(self.bot, "history_index", None)
+        if index is not None:
+            rows = index.iter_messages(target_id)
+        else:
+            rows = iter_history(self.conversation_history, target_id)
+        
+        directory = tempfile.mkdtemp(prefix="dm-export-")
+        basename = f"conversations-{scope}-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        try:
+            async with ctx.typing():
+                # Compression runs in a thread so the gateway keeps being served
+                paths, count = await asyncio.to_thread(
+                    write_parts, rows, directory, basename, fmt, int(EXPORT_PART_MB * 1024 * 1024)
+                )
+            if not count:
+                await ctx.send("No messages to export.")
+                return
+            
+            await ctx.send(f"Exported {count} message(s) in {len(paths)} part(s).")
+            for path in paths:
+                await scheduled(self.bot, "history", self.upload_file, ctx, path)
+        except Exception as e:
+            logger.error(f"Error exporting conversations: {e}")
+            await ctx.send(f"An error occurred: {e}")
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
 async def setup(bot):
     await bot.add_cog(DMForwarding(bot))
@@ -0,0 +1,137 @@
+import discord
+import os
+import asyncio
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Antes de importar core/ y scripts/, que leen su configuración del entorno
+load_dotenv()
+
+import logging
+from core.ipc import BusClient
+from core.attachments import AttachmentCache
+from core.log_pipeline import setup_logging
+from scripts.dmreplies import BOT_OWNER_ID, build_dm_embed, attachment_files, send_with_files
+
+# Proceso worker del modo dividido (PROCESS_WORKERS > 0 en main.py).
+# El gateway le entrega los MD por el bus IPC y este proceso hace el reparto
+# por REST, sin conexión propia al gateway de Discord.
+
+logger = logging.getLogger('bot.worker')
+logging.getLogger('bot').setLevel(logging.INFO)
+log_pipeline = setup_logging()
+
+class ForwardWorker:
+    def __init__(self, client, bus):
+        self.client = client
+        self.bus = bus
+        self.owner = None
+        self.users = {}
+        self.tails = {}  # {target_id: tarea del último MD de ese remitente}
+        # Mensajes reenviados sin respuesta: el gateway los adopta al usarlos, el resto caduca
+        self.pending_ttl = float(os.environ.get('IPC_PENDING_TTL', 7 * 24 * 3600))
+        self._last_prune = 0.0
+        # Mismo directorio que el gateway: los adjuntos ya están descargados por hash
+        self.attachment_cache = AttachmentCache.from_env()
+
+    async def get_user(self, user_id):
+        user = self.users.get(user_id)
+        if user is None:
+            user = self.users[user_id] = await self.client.fetch_user(user_id)
+        return user
+
+    def files(self, payload):
+        return attachment_files(self.attachment_cache, payload.get("cached_attachments"))
+
+    async def handle_dm(self, payload):
+        """Reparte los MD de un mismo remitente en orden: cada uno espera a que acabe el anterior"""
+        target_id = payload["author_id"]
+        previous = self.tails.get(target_id)
+        current = self.tails[target_id] = asyncio.current_task()
+        try:
+            if previous is not None:
+                # wait() no propaga el error ni la cancelación del anterior
+                await asyncio.wait([previous])
+            await self.forward_dm(payload)
+        finally:
+            if self.tails.get(target_id) is current:
+                del self.tails[target_id]
+        await self.prune_pending()
+
+    async def forward_dm(self, payload):
+        """Reparte un MD al owner y a los usuarios autorizados de la conversación"""
+        created_at = datetime.fromisoformat(payload["created_at"])
+        target_id = payload["author_id"]
+
+        try:
+            owner = await self.get_user(BOT_OWNER_ID)
+            embed = build_dm_embed(payload["author_name"], target_id, payload["content"],
+                                   created_at, payload["attachments"])
+            owner_msg = await send_with_files(owner, self.files(payload), embed=embed)
+            await owner_msg.add_reaction("👥")
+            await owner_msg.add_reaction("❌")
+            await self.bus.set("pending", owner_msg.id, {
+                "type": "forwarded_message",
+                "target_user_id": target_id,
+                "ts": time.time()
+            })
+        except discord.Forbidden:
+            logger.error("No se puede enviar MD al owner")
+        except Exception as e:
+            logger.error(f"Error reenviando MD de {target_id} al owner: {e}")
+
+        for user_id in self.bus.get("authorized", target_id, []):
+            try:
+                user = await self.get_user(user_id)
+                auth_embed = build_dm_embed(payload["author_name"], target_id, payload["content"],
+                                            created_at, payload["attachments"], shared=True)
+                user_msg = await send_with_files(user, self.files(payload), embed=auth_embed)
+                await self.bus.set("pending", user_msg.id, {
+                    "type": "forwarded_message",
+                    "target_user_id": target_id,
+                    "ts": time.time()
+                })
+            except discord.Forbidden:
+                logger.error(f"No se puede enviar MD al usuario {user_id}")
+            except Exception as e:
+                logger.error(f"Error reenviando MD de {target_id} a {user_id}: {e}")
+
+    async def prune_pending(self):
+        """Borra del bus los reenvíos más antiguos que `pending_ttl` (como mucho una pasada por hora)"""
+        now = time.time()
+        if now - self._last_prune < min(self.pending_ttl, 3600):
+            return
+        self._last_prune = now
+        cutoff = now - self.pending_ttl
+        expired = [key for key, value in self.bus.state.get("pending", {}).items()
+                   if value.get("ts", now) < cutoff]
+        for key in expired:
+            await self.bus.delete("pending", key)
+        if expired:
+            logger.info(f"Caducados {len(expired)} reenvíos pendientes del bus")
+
+async def main():
+    worker_id = int(os.environ.get('WORKER_ID', 0))
+    token = os.getenv('DISCORD_TOKEN')
+    if not token:
+        logger.error("DISCORD_TOKEN no encontrado en las variables de entorno")
+        return 1
+
+    # Solo REST: el gateway lo mantiene el proceso principal
+    client = discord.Client(intents=discord.Intents.none())
+    await client.login(token)
+
+    bus = await BusClient.connect(os.environ['IPC_SOCKET'], role='worker', worker_id=worker_id)
+    worker = ForwardWorker(client, bus)
+    bus.subscribe("dm", worker.handle_dm)
+    logger.info(f"Worker {worker_id} listo")
+
+    try:
+        await bus.wait_closed()
+    finally:
+        await client.close()
+    return 0
+
+if __name__ == '__main__':
+    exit(asyncio.run(main()))